@@ -1,3 +1,4 @@
+import asyncio
 from typing import Optional
 
 from fastapi import FastAPI, Body, Header, Request
@@ -11,6 +12,7 @@ os.environ["CHAT_TABLE"] = "Chat"
 os.environ["TRADE_TABLE"] = "Trade"
 os.environ["ACCOUNT_TABLE"] = "Account"
 os.environ["TRADE_TABLE_ACCOUNT_STATE_INDEX"] = "Trade-account_state_index"
+os.environ["LEADERBOARD_TABLE"] = "Leaderboard"
 
 
 from handon_fx.chat.chatbot import ChatBot
@@ -18,9 +20,9 @@ from handon_fx.fx import HandonFxAPI
 
 print(os.getenv("TRADE_TABLE"))
 
-from handon_fx.chat.mastodon_api import handle_push_notification
+from handon_fx.chat.mastodon_api import handle_push_notification_async
 from handon_fx.chat.models import ChatModel
-from handon_fx.fx.models import TradeModel, AccountModel
+from handon_fx.fx.models import TradeModel, AccountModel, LeaderboardModel
 
 try:
     if not ChatModel().exists():
@@ -31,6 +33,8 @@ if not TradeModel().exists():
     TradeModel.create_table(billing_mode="PAY_PER_REQUEST")
 if not AccountModel().exists():
     AccountModel.create_table(billing_mode="PAY_PER_REQUEST")
+if not LeaderboardModel().exists():
+    LeaderboardModel.create_table(billing_mode="PAY_PER_REQUEST")
 
 app = FastAPI()
 
@@ -40,7 +44,7 @@ async def index(q: Optional[str] = None):
     if not q:
         return {"message": "size is required"}
     bot = ChatBot(HandonFxAPI())
-    return bot.action("osa9@handon.club", q)
+    return await asyncio.to_thread(bot.action, "osa9@handon.club", q)
 
 
 @app.post("/push")
@@ -49,7 +53,7 @@ async def post_push(request: Request):
         body = await request.body()
         encryption = request.headers["encryption"]
         crypto_key = request.headers["crypto-key"]
-        handle_push_notification(body, encryption, crypto_key)
+        await handle_push_notification_async(body, encryption, crypto_key)
     finally:
         return {"message": "Hello World"}
 
@@ -57,4 +61,4 @@ async def post_push(request: Request):
 @app.get("/raking")
 async def get_ranking(request: Request):
     bot = ChatBot(HandonFxAPI())
-    return bot.handle_ranking()
+    return await asyncio.to_thread(bot.ranking)
@@ -157,6 +157,27 @@ class _Data:
                                                for s in self.__arrays['Close'].astype(str)]))
         return self.__pip
 
+    def _current(self, key: str, i: int = -1):
+        """
+        Value of column `key` at index `i` of the current (truncated) data,
+        i.e. `data[key][i]` without creating a new array view.
+        Used by the broker on every bar in `Backtest.run`.
+        """
+        if i < 0:
+            i += self.__i
+            if i < 0:
+                raise IndexError(f'index {i - self.__i} is out of bounds')
+        elif i >= self.__i:
+            raise IndexError(f'index {i} is out of bounds')
+        return self.__arrays[key][i]
+
+    def _values(self, key: str, start: int, stop: int) -> np.ndarray:
+        """
+        Plain array of column `key` for bars `[start, stop)`, regardless of
+        the current length.
+        """
+        return np.asarray(self.__arrays[key][start:stop])
+
     def __get_array(self, key) -> _Array:
         arr = self.__cache.get(key)
         if arr is None:
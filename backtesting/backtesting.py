@@ -11,7 +11,7 @@ import sys
 import warnings
 from abc import ABCMeta, abstractmethod
 from concurrent.futures import ProcessPoolExecutor, as_completed
-from copy import copy
+from bisect import bisect_left, bisect_right, insort
 from functools import lru_cache, partial
 from itertools import chain, compress, product, repeat
 from math import copysign
@@ -217,6 +217,14 @@ class Strategy(metaclass=ABCMeta):
             super().next()
         """
 
+    def _signal_bars(self) -> Optional[np.ndarray]:
+        """
+        Indices of the only bars on which `next()` can place orders,
+        if the strategy knows them in advance (see `backtesting.lib.SignalStrategy`).
+        `None` means any bar.
+        """
+        return None
+
     class __FULL_EQUITY(float):  # noqa: N801
         def __repr__(self):
             return ".9999"
@@ -367,6 +375,8 @@ class Position:
             ...  # we have a position, either long or short
     """
 
+    __slots__ = ("__broker",)
+
     def __init__(self, broker: "_Broker"):
         self.__broker = broker
 
@@ -376,12 +386,13 @@ class Position:
     @property
     def size(self) -> float:
         """Position size in units of asset. Negative if position is short."""
-        return sum(trade.size for trade in self.__broker.trades)
+        return self.__broker.trades.size
 
     @property
     def pl(self) -> float:
         """Profit (positive) or loss (negative) of the current position in cash units."""
-        return sum(trade.pl for trade in self.__broker.trades)
+        trades = self.__broker.trades
+        return trades.pl(self.__broker.last_price) if trades else 0
 
     @property
     def pl_pct(self) -> float:
@@ -432,6 +443,17 @@ class Order:
     [Good 'Til Canceled]: https://www.investopedia.com/terms/g/gtc.asp
     """
 
+    __slots__ = (
+        "__broker",
+        "__size",
+        "__limit_price",
+        "__stop_price",
+        "__sl_price",
+        "__tp_price",
+        "__parent_trade",
+        "__tag",
+    )
+
     def __init__(
         self,
         broker: "_Broker",
@@ -455,7 +477,7 @@ class Order:
 
     def _replace(self, **kwargs):
         for k, v in kwargs.items():
-            setattr(self, f"_{self.__class__.__qualname__}__{k}", v)
+            setattr(self, "_Order__" + k, v)
         return self
 
     def __repr__(self):
@@ -587,6 +609,18 @@ class Trade:
     Find active trades in `Strategy.trades` and closed, settled trades in `Strategy.closed_trades`.
     """
 
+    __slots__ = (
+        "__broker",
+        "__size",
+        "__entry_price",
+        "__exit_price",
+        "__entry_bar",
+        "__exit_bar",
+        "__sl_order",
+        "__tp_order",
+        "__tag",
+    )
+
     def __init__(
         self, broker: "_Broker", size: int, entry_price: float, entry_bar, tag
     ):
@@ -609,11 +643,24 @@ class Trade:
 
     def _replace(self, **kwargs):
         for k, v in kwargs.items():
-            setattr(self, f"_{self.__class__.__qualname__}__{k}", v)
+            setattr(self, "_Trade__" + k, v)
         return self
 
     def _copy(self, **kwargs):
-        return copy(self)._replace(**kwargs)
+        return self.__copy__()._replace(**kwargs)
+
+    def __copy__(self):
+        trade = object.__new__(type(self))
+        trade.__broker = self.__broker
+        trade.__size = self.__size
+        trade.__entry_price = self.__entry_price
+        trade.__exit_price = self.__exit_price
+        trade.__entry_bar = self.__entry_bar
+        trade.__exit_bar = self.__exit_bar
+        trade.__sl_order = self.__sl_order
+        trade.__tp_order = self.__tp_order
+        trade.__tag = self.__tag
+        return trade
 
     def close(self, portion: float = 1.0):
         """Place new `Order` to close `portion` of the trade at next market price."""
@@ -750,7 +797,7 @@ class Trade:
     def __set_contingent(self, type, price):
         assert type in ("sl", "tp")
         assert price is None or 0 < price < np.inf
-        attr = f"_{self.__class__.__qualname__}__{type}_order"
+        attr = f"_Trade__{type}_order"
         order: Order = getattr(self, attr)
         if order:
             order.cancel()
@@ -762,6 +809,203 @@ class Trade:
             setattr(self, attr, order)
 
 
+class _OrderBook:
+    """
+    Orders waiting for execution, in the order they are processed:
+    contingent and trade-closing orders are inserted in front,
+    new orders are appended at the back.
+
+    Supports the list operations the broker and `Order.cancel()` use
+    (iteration, `in`, `append()`, `insert(0, ...)`, `remove()`) without
+    scanning the whole book, and keeps resting stop and limit orders
+    sorted by trigger price, so that `triggered()` only returns the orders
+    that a bar with the given high and low can act on.
+    """
+
+    def __init__(self):
+        self.__front: Dict[Order, int] = {}  # Reversed
+        self.__back: Dict[Order, int] = {}
+        self.__orders: Dict[int, Order] = {}
+        self.__market: Dict[Order, int] = {}
+        # Sorted (trigger price, seq) per kind of resting order
+        self.__resting: Dict[str, List[Tuple[float, int]]] = {
+            "stop_long": [],
+            "stop_short": [],
+            "limit_long": [],
+            "limit_short": [],
+        }
+        self.__keys: Dict[Order, Tuple[str, float]] = {}
+        self.__first = self.__last = 0
+
+    def __len__(self):
+        return len(self.__orders)
+
+    def __iter__(self):
+        # A copy, so that orders can be canceled while iterating
+        return iter(list(chain(reversed(self.__front), self.__back)))
+
+    def __contains__(self, order):
+        return order in self.__front or order in self.__back
+
+    def __repr__(self):
+        return f"<OrderBook {list(self)}>"
+
+    def append(self, order: "Order"):
+        self.__last += 1
+        self.__back[order] = self.__last
+        self.__add(order, self.__last)
+
+    def insert(self, index: int, order: "Order"):
+        assert index == 0, "orders can only be inserted in front"
+        self.__first -= 1
+        self.__front[order] = self.__first
+        self.__add(order, self.__first)
+
+    def remove(self, order: "Order"):
+        seq = self.__front.pop(order, None)
+        if seq is None:
+            try:
+                seq = self.__back.pop(order)
+            except KeyError:
+                raise ValueError(f"{order} not in orders") from None
+        del self.__orders[seq]
+        self.__discard(order, seq)
+
+    def reindex(self, order: "Order"):
+        """Re-sort `order` after its stop or limit price changed."""
+        seq = self.__front.get(order) or self.__back[order]
+        self.__discard(order, seq)
+        self.__add(order, seq)
+
+    def __add(self, order: "Order", seq: int):
+        self.__orders[seq] = order
+        price, kind = order.stop, "stop"
+        if not price:
+            price, kind = order.limit, "limit"
+        # Market orders, and NaN prices that never trigger, are always checked
+        if not price or price != price:
+            self.__market[order] = seq
+            return
+        kind += "_long" if order.is_long else "_short"
+        insort(self.__resting[kind], (price, seq))
+        self.__keys[order] = (kind, price)
+
+    def __discard(self, order: "Order", seq: int):
+        if self.__market.pop(order, None) is not None:
+            return
+        kind, price = self.__keys.pop(order)
+        resting = self.__resting[kind]
+        del resting[bisect_left(resting, (price, seq))]
+
+    def triggered(self, high: float, low: float) -> "List[Order]":
+        """
+        Market orders and the stop/limit orders whose trigger price is
+        within the bar's range, in processing order.
+        """
+        resting = self.__resting
+        seqs = list(self.__market.values())
+        # Long stop and short limit trigger above, when high > price
+        for kind in ("stop_long", "limit_short"):
+            prices = resting[kind]
+            seqs += [seq for _, seq in prices[: bisect_left(prices, (high,))]]
+        # Short stop and long limit trigger below, when low < price
+        for kind in ("stop_short", "limit_long"):
+            prices = resting[kind]
+            seqs += [seq for _, seq in prices[bisect_right(prices, (low, np.inf)) :]]
+        seqs.sort()
+        return [self.__orders[seq] for seq in seqs]
+
+
+class _TradeList(list):
+    """
+    Active trades, in the order they were opened, that also keeps
+    running sums of their signed `size`, `size * entry_price` (`cost`)
+    and absolute size (`exposure`), so that equity and margin can be
+    computed without iterating over all open trades.
+
+    `append()`, `insert()`, `remove()` and `pop()` update the sums
+    incrementally, other list mutations recount them. The size of an
+    active trade must be changed through `resize()`.
+    """
+
+    def __init__(self, trades=()):
+        super().__init__(trades)
+        self.__recount()
+
+    def __recount(self):
+        self.size = self.cost = self.exposure = 0
+        for trade in self:
+            self.__add(trade)
+
+    def __add(self, trade: "Trade"):
+        size = trade.size
+        self.size += size
+        self.cost += size * trade.entry_price
+        self.exposure += abs(size)
+
+    def __sub(self, trade: "Trade"):
+        if not self:
+            # Avoid accumulating rounding errors over the whole run
+            self.size = self.cost = self.exposure = 0
+            return
+        size = trade.size
+        self.size -= size
+        self.cost -= size * trade.entry_price
+        self.exposure -= abs(size)
+
+    def append(self, trade: "Trade"):
+        super().append(trade)
+        self.__add(trade)
+
+    def insert(self, index, trade: "Trade"):
+        super().insert(index, trade)
+        self.__add(trade)
+
+    def remove(self, trade: "Trade"):
+        super().remove(trade)
+        self.__sub(trade)
+
+    def pop(self, index=-1):
+        trade = super().pop(index)
+        self.__sub(trade)
+        return trade
+
+    def resize(self, trade: "Trade", size: float):
+        """Change the size of `trade`, one of the active trades, in place."""
+        old = trade.size
+        self.size += size - old
+        self.cost += (size - old) * trade.entry_price
+        self.exposure += abs(size) - abs(old)
+        trade._replace(size=size)
+
+    def pl(self, price):
+        """Summed profit/loss of the trades at `price` (scalar or array)."""
+        return self.size * price - self.cost
+
+    # Mutations that don't add or remove a single trade recount the sums
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.__recount()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.__recount()
+
+    def __iadd__(self, trades):
+        super().__iadd__(trades)
+        self.__recount()
+        return self
+
+    def extend(self, trades):
+        super().extend(trades)
+        self.__recount()
+
+    def clear(self):
+        super().clear()
+        self.__recount()
+
+
 class _Broker:
     def __init__(
         self,
@@ -790,8 +1034,8 @@ class _Broker:
         self._exclusive_orders = exclusive_orders
 
         self._equity = np.tile(np.nan, len(index))
-        self.orders: List[Order] = []
-        self.trades: List[Trade] = []
+        self.orders = _OrderBook()
+        self.trades = _TradeList()
         self.position = Position(self)
         self.closed_trades: List[Trade] = []
 
@@ -856,7 +1100,7 @@ class _Broker:
     @property
     def last_price(self) -> float:
         """Price at the last (current) close."""
-        return self._data.Close[-1]
+        return self._data._current("Close")
 
     def _adjusted_price(self, size=None, price=None) -> float:
         """
@@ -865,15 +1109,30 @@ class _Broker:
         """
         return (price or self.last_price) * (1 + copysign(self._commission, size))
 
+    @property
+    def trades(self) -> _TradeList:
+        return self.__trades
+
+    @trades.setter
+    def trades(self, trades):
+        self.__trades = _TradeList(trades)
+
     @property
     def equity(self) -> float:
-        return self._cash + sum(trade.pl for trade in self.trades)
+        trades = self.__trades
+        if not trades:
+            return self._cash
+        return self._cash + trades.pl(self.last_price)
 
     @property
     def margin_available(self) -> float:
         # From https://github.com/QuantConnect/Lean/pull/3768
-        margin_used = sum(trade.value / self._leverage for trade in self.trades)
-        return max(0, self.equity - margin_used)
+        trades = self.__trades
+        if not trades:
+            return max(0, self._cash)
+        price = self.last_price
+        margin_used = trades.exposure * price / self._leverage
+        return max(0, self._cash + trades.pl(price) - margin_used)
 
     def next(self):
         i = self._i = len(self._data) - 1
@@ -887,19 +1146,44 @@ class _Broker:
         if equity <= 0:
             assert self.margin_available <= 0
             for trade in self.trades:
-                self._close_trade(trade, self._data.Close[-1], i)
+                self._close_trade(trade, self._data._current("Close"), i)
             self._cash = 0
             self._equity[i:] = 0
             raise _OutOfMoneyError
 
+    def _record_equity(self, start: int, stop: int) -> int:
+        """
+        Record equity for bars `[start, stop)` on which there are no orders to
+        process. Equivalent to calling `next()` on each of them, but vectorized.
+        Returns the first bar on which equity drops to zero (to be processed
+        by `next()`), or `stop`.
+        """
+        # Same operations as `self.equity` does for each bar
+        if self.__trades:
+            close = self._data._values("Close", start, stop)
+            equity = self._cash + self.__trades.pl(close)
+        else:
+            equity = np.full(stop - start, self._cash)
+
+        out_of_money = np.flatnonzero(equity <= 0)
+        if len(out_of_money):
+            stop = start + out_of_money[0]
+            equity = equity[: stop - start]
+        self._equity[start:stop] = equity
+        return stop
+
     def _process_orders(self):
         data = self._data
-        open, high, low = data.Open[-1], data.High[-1], data.Low[-1]
-        prev_close = data.Close[-2]
+        open, high, low = (
+            data._current("Open"),
+            data._current("High"),
+            data._current("Low"),
+        )
+        prev_close = data._current("Close", -2)
         reprocess_orders = False
 
-        # Process orders
-        for order in list(self.orders):  # type: Order
+        # Process orders (only those this bar can trigger, in the book's order)
+        for order in self.orders.triggered(high, low):  # type: Order
 
             # Related SL/TP order was already removed
             if order not in self.orders:
@@ -917,6 +1201,7 @@ class _Broker:
                 # > When the stop price is reached, a stop order becomes a market/limit order.
                 # https://www.sec.gov/fast-answers/answersstopordhtm.html
                 order._replace(stop_price=None)
+                self.orders.reindex(order)
 
             # Determine purchase price.
             # Check if limit order can be filled.
@@ -1070,7 +1355,7 @@ class _Broker:
             close_trade = trade
         else:
             # Reduce existing trade ...
-            trade._replace(size=size_left)
+            self.trades.resize(trade, size_left)
             if trade._sl_order:
                 trade._sl_order._replace(size=-trade.size)
             if trade._tp_order:
@@ -1336,7 +1621,26 @@ class Backtest:
         # np.nan >= 3 is not invalid; it's False.
         with np.errstate(invalid="ignore"):
 
-            for i in range(start, len(self._data)):
+            # A pure signal strategy can only place orders on the bars where its
+            # signal is set. On the other bars, when no orders are pending, the
+            # broker only records equity, which is done in bulk
+            signal_bars = None
+            if (
+                type(broker).next is _Broker.next
+                and type(broker).equity is _Broker.equity
+            ):
+                signal_bars = strategy._signal_bars()
+
+            i, n = start, len(self._data)
+            while i < n:
+                if signal_bars is not None and not broker.orders:
+                    j = np.searchsorted(signal_bars, i)
+                    j = signal_bars[j] if j < len(signal_bars) else n
+                    if j > i:
+                        i = broker._record_equity(i, j)
+                        if i == j:
+                            continue
+
                 # Prepare data and indicators for `next` call
                 data._set_length(i + 1)
                 for attr, indicator in indicator_attrs:
@@ -1351,7 +1655,14 @@ class Backtest:
 
                 # Next tick, a moment before bar close
                 strategy.next()
+                i += 1
             else:
+                if signal_bars is not None:
+                    # Bars at the end may have been skipped
+                    data._set_length(n)
+                    for attr, indicator in indicator_attrs:
+                        setattr(strategy, attr, indicator[..., :n])
+
                 # Close any remaining open trades so they produce some stats
                 for trade in broker.trades:
                     trade.close()
@@ -22,7 +22,7 @@ import pandas as pd
 
 from ._plotting import plot_heatmaps as _plot_heatmaps
 from ._stats import compute_stats as _compute_stats
-from ._util import _Array, _as_str
+from ._util import _Array, _as_str, _Indicator
 from .backtesting import Strategy
 
 __pdoc__ = {}
@@ -386,6 +386,10 @@ class SignalStrategy(Strategy):
 
     Remember to call `super().init()` and `super().next()` in your
     overridden methods.
+
+    If `next()` is not overridden, `backtesting.backtesting.Backtest.run`
+    only steps through the bars with a signal (or pending orders) and
+    computes equity for the bars in between in bulk, with the same results.
     """
     __entry_signal = (0,)
     __exit_signal = (False,)
@@ -417,6 +421,19 @@ class SignalStrategy(Strategy):
                 lambda: pd.Series(exit_portion, dtype=float).replace(0, np.nan),
                 name='exit portion', plot=plot, overlay=False, scatter=True, color='black')
 
+    def _signal_bars(self):
+        # Unless some class (including mixins later in the MRO, which
+        # `SignalStrategy.next()` calls through `super()`) defines `next()`,
+        # orders are only placed where a signal is set
+        if (any('next' in vars(cls) for cls in type(self).__mro__
+                if cls not in (SignalStrategy, Strategy)) or
+                not isinstance(self.__entry_signal, _Indicator)):
+            return None
+        active = np.nan_to_num(np.asarray(self.__entry_signal, dtype=float)) != 0
+        if isinstance(self.__exit_signal, _Indicator):
+            active |= np.nan_to_num(np.asarray(self.__exit_signal, dtype=float)) != 0
+        return np.flatnonzero(active)
+
     def next(self):
         super().next()
 
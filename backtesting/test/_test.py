@@ -6,6 +6,7 @@ import unittest
 import warnings
 from concurrent.futures.process import ProcessPoolExecutor
 from contextlib import contextmanager
+from functools import partial
 from glob import glob
 from runpy import run_path
 from tempfile import NamedTemporaryFile, gettempdir
@@ -17,8 +18,9 @@ import pandas as pd
 from pandas.testing import assert_frame_equal
 
 from backtesting import Backtest, Strategy
+from backtesting.backtesting import Order, Position, Trade, _Broker, _OrderBook, _TradeList
 from backtesting._stats import compute_drawdown_duration_peaks
-from backtesting._util import _Array, _as_str, _Indicator, try_
+from backtesting._util import _Array, _as_str, _Data, _Indicator, try_
 from backtesting.lib import (
     OHLCV_AGG,
     SignalStrategy,
@@ -412,6 +414,137 @@ class TestBacktest(TestCase):
 
         self.assertRaises(ValueError, Backtest(SHORT_DATA, S, commission=.02).run)
 
+    def test_order_book(self):
+        market = Order(None, 1)
+        long_stop = Order(None, 1, stop_price=110)
+        short_stop = Order(None, -1, stop_price=90)
+        long_limit = Order(None, 1, limit_price=95)
+        short_limit = Order(None, -1, limit_price=105)
+        contingent = Order(None, -1, stop_price=80)
+        book = _OrderBook()
+        for order in (market, long_stop, short_stop, long_limit, short_limit):
+            book.append(order)
+        book.insert(0, contingent)
+
+        self.assertEqual(list(book), [contingent, market, long_stop, short_stop,
+                                      long_limit, short_limit])
+        self.assertEqual(book.triggered(high=100, low=96), [market])
+        self.assertEqual(book.triggered(high=111, low=94),
+                         [market, long_stop, long_limit, short_limit])
+        self.assertEqual(book.triggered(high=100, low=79),
+                         [contingent, market, short_stop, long_limit])
+
+        book.remove(market)
+        self.assertNotIn(market, book)
+        self.assertRaises(ValueError, book.remove, market)
+        long_stop._replace(stop_price=None)
+        book.reindex(long_stop)
+        self.assertEqual(book.triggered(high=100, low=96), [long_stop])
+        self.assertEqual(len(book), 5)
+
+    def test_order_book_matches_list(self):
+        class ListOrders(list):
+            def triggered(self, high, low):
+                return list(self)
+
+            def reindex(self, order):
+                pass
+
+        class ListBroker(_Broker):
+            def __init__(self, **kwargs):
+                super().__init__(**kwargs)
+                self.orders = ListOrders()
+
+        class Grid(Strategy):
+            def init(self):
+                pass
+
+            def next(self):
+                if len(self.data) % 20:
+                    return
+                self.orders.cancel()
+                price = self.data.Close[-1]
+                for k in range(1, 11):
+                    step = price * .005 * k
+                    self.buy(size=1, limit=price - step, tp=price, sl=price - 2 * step)
+                    self.sell(size=1, stop=price - step, limit=price - 2 * step)
+                    self.buy(size=1, stop=price + step, tp=price + 2 * step)
+                    self.sell(size=1, limit=price + step, sl=price + 2 * step)
+
+        for kwargs in (dict(), dict(hedging=True), dict(trade_on_close=True)):
+            with self.subTest(**kwargs), warnings.catch_warnings():
+                # SL/TP in the same bar as their stop/limit parent
+                warnings.simplefilter('ignore')
+                bt = Backtest(GOOG, Grid, **kwargs)
+                stats = bt.run()
+                bt._broker = partial(ListBroker, **bt._broker.keywords)
+                expected = bt.run()
+                self.assertGreater(stats['# Trades'], 100)
+                assert_frame_equal(stats._equity_curve, expected._equity_curve,
+                                   check_exact=True)
+                assert_frame_equal(stats._trades, expected._trades, check_exact=True)
+
+    def test_trade_list(self):
+        a, b, c = (Trade(None, 3, 100., 0, None), Trade(None, -2, 110., 0, None),
+                   Trade(None, 5, 90., 0, None))
+        trades = _TradeList([a, b])
+        self.assertEqual((trades.size, trades.cost, trades.exposure), (1, 80, 5))
+        trades.append(c)
+        trades.resize(a, 1)
+        self.assertEqual(a.size, 1)
+        self.assertEqual((trades.size, trades.cost, trades.exposure), (4, 330, 8))
+        self.assertEqual(trades.pl(100.), 70)
+        trades[:2] = [c]
+        self.assertEqual((trades.size, trades.cost, trades.exposure), (10, 900, 10))
+        trades.remove(c)
+        trades.pop()
+        self.assertEqual((trades.size, trades.cost, trades.exposure), (0, 0, 0))
+
+    def test_slots(self):
+        order = Order(None, 1, limit_price=90)
+        trade = Trade(None, 2, 100., 3, 'tag')
+        for obj in (order, trade, Position(None)):
+            self.assertFalse(hasattr(obj, '__dict__'))
+        self.assertEqual(order._replace(size=-1).size, -1)
+
+        copied = trade._copy(size=-1)
+        self.assertEqual((copied.size, copied.entry_price, copied.entry_bar, copied.tag),
+                         (-1, 100., 3, 'tag'))
+        self.assertEqual(trade.size, 2)
+
+    def test_trade_list_matches_trades(self):
+        test = self
+
+        class Check(Strategy):
+            def init(self):
+                self.random = np.random.RandomState(0)
+
+            def next(self):
+                broker = self._broker
+                trades = broker.trades
+                price = broker.last_price
+                test.assertEqual(trades.size, sum(t.size for t in trades))
+                test.assertAlmostEqual(
+                    broker.equity, broker._cash + sum(t.pl for t in trades), places=6)
+                test.assertAlmostEqual(
+                    broker.margin_available,
+                    max(0, broker.equity - sum(t.value / broker._leverage for t in trades)),
+                    places=6)
+                test.assertAlmostEqual(
+                    self.position.pl, sum(t.pl for t in trades), places=6)
+                r = self.random.rand()
+                if r < .3:
+                    self.buy(size=self.random.randint(1, 5), tp=price * 1.05)
+                elif r < .6:
+                    self.sell(size=self.random.randint(1, 5), sl=price * 1.05)
+                elif r < .7 and self.trades:
+                    self.trades[0].close(.5)
+
+        for kwargs in (dict(), dict(hedging=True)):
+            with self.subTest(**kwargs):
+                stats = Backtest(GOOG.iloc[:500], Check, **kwargs).run()
+                self.assertGreater(stats['# Trades'], 100)
+
 
 class TestStrategy(TestCase):
     def _Backtest(self, strategy_coroutine, **kwargs):
@@ -875,6 +1008,48 @@ class TestLib(TestCase):
         stats = Backtest(GOOG, S).run()
         self.assertIn(stats['# Trades'], (1181, 1182))  # varies on different archs?
 
+    def test_SignalStrategy_signal_bars(self):
+        class S(SignalStrategy):
+            def init(self):
+                close = self.data.Close.s
+                up = (close.rolling(10).mean() > close.rolling(30).mean()).astype(int)
+                self.set_signal(up.diff().fillna(0) * .95,
+                                (up.diff().fillna(0) < 0) * .5)
+
+        class EventLoop(S):
+            def next(self):
+                super().next()
+
+        for kwargs in (dict(), dict(commission=.002, trade_on_close=True),
+                       dict(hedging=True, exclusive_orders=True),
+                       dict(margin=.002, commission=.01)):
+            with self.subTest(**kwargs):
+                stats = Backtest(GOOG, S, **kwargs).run()
+                expected = Backtest(GOOG, EventLoop, **kwargs).run()
+                assert_frame_equal(stats._equity_curve, expected._equity_curve,
+                                   check_exact=True)
+                assert_frame_equal(stats._trades, expected._trades, check_exact=True)
+
+        # A mixin's `next()` that trades is still called on every bar
+        class Other(Strategy):
+            def init(self):
+                pass
+
+            def next(self):
+                super().next()
+                if not self.position and len(self.data) % 50 == 0:
+                    self.buy()
+                elif self.position and len(self.data) % 50 == 25:
+                    self.position.close()
+
+        class Mixed(S, Other):
+            pass
+
+        stats = Backtest(GOOG, Mixed).run()
+        expected = Backtest(GOOG, type('MixedEventLoop', (EventLoop, Other), {})).run()
+        self.assertGreater(stats['# Trades'], 20)
+        assert_frame_equal(stats._trades, expected._trades, check_exact=True)
+
     def test_TrailingStrategy(self):
         class S(TrailingStrategy):
             def init(self):
@@ -929,6 +1104,17 @@ class TestUtil(TestCase):
 
         Backtest(GOOG.iloc[:20], S).run()
 
+    def test_data_current(self):
+        data = _Data(GOOG.iloc[:10])
+        data._set_length(5)
+        self.assertEqual(data._current('Close'), data.Close[-1])
+        self.assertEqual(data._current('Open', -2), data.Open[-2])
+        self.assertEqual(data._current('High', 0), data.High[0])
+        with self.assertRaises(IndexError):
+            data._current('Close', -6)
+        with self.assertRaises(IndexError):
+            data._current('Close', 5)
+
     def test_indicators_picklable(self):
         bt = Backtest(SHORT_DATA, SmaCross)
         with ProcessPoolExecutor() as executor:
@@ -1,20 +1,4 @@
-from .utils import (
-    _find,
-    BUY_TEXTS,
-    SELL_TEXTS,
-    UNPOSITION_TEXTS,
-    HELP_TEXTS,
-    SUMMARY_TEXTS,
-    RANKING_TEXTS,
-    _find_n,
-    _find_obj,
-    RATE_TEXTS,
-    yen,
-    DEBT_TEXT,
-    CLEAR_DEBT_TEXTS,
-    _find_yen,
-    WORST_RANKING_TEXTS,
-)
+from .utils import yen, scan_text
 from handon_fx.fx import HandonFxAPI
 from ..fx.exceptions import NotEnoughCash
 
@@ -23,23 +7,30 @@ class ChatBot:
     def __init__(self, fxApi: HandonFxAPI):
         self.fx = fxApi
 
+    def _fx_api(self) -> HandonFxAPI:
+        # 先読みした口座・建玉を使えるように、HandonFxAPIを渡されていればそれを使う
+        if isinstance(self.fx, HandonFxAPI):
+            return self.fx
+        return HandonFxAPI()
+
     def _parse_text(self, text: str):
-        buy = _find(BUY_TEXTS, text)
-        sell = _find(SELL_TEXTS, text)
-        unposition = _find(UNPOSITION_TEXTS, text)
-        help = _find(HELP_TEXTS, text)
-        summary = _find(SUMMARY_TEXTS, text)
-        rate = _find(RATE_TEXTS, text)
-        ranking = _find(RANKING_TEXTS, text)
-        debt = _find(DEBT_TEXT, text)
-        clear_debt = _find(CLEAR_DEBT_TEXTS, text)
+        scan = scan_text(text)
+        buy = "buy" in scan.intents
+        sell = "sell" in scan.intents
+        unposition = "unposition" in scan.intents
+        help = "help" in scan.intents
+        summary = "summary" in scan.intents
+        rate = "rate" in scan.intents
+        ranking = "ranking" in scan.intents
+        debt = "debt" in scan.intents
+        clear_debt = "clear_debt" in scan.intents
 
         ops = sum(
             [buy, sell, unposition, help, summary, rate, debt, clear_debt, ranking]
         )
         if ops != 1:
-            n = _find_n(text)
-            o = _find_obj(text)
+            n = scan.numbers
+            o = scan.pairs
             print({"obj": o, "len": len(o) })
             if ops == 0 and len(n) == 1 and len(o) == 0:
                 return {"operation": "buy", "size": n[0]}
@@ -50,7 +41,7 @@ class ChatBot:
                 return {"operation": "unknown"}
 
         if debt:
-            debt_sizes = _find_yen(text)
+            debt_sizes = scan.yen
             if len(debt_sizes) != 1:
                 return {
                     "operation": "notion",
@@ -58,7 +49,7 @@ class ChatBot:
                 }
             return {"operation": "debt", "size": debt_sizes[0]}
         elif clear_debt:
-            debt_sizes = _find_yen(text)
+            debt_sizes = scan.yen
             if len(debt_sizes) > 1:
                 return {
                     "operation": "notion",
@@ -69,8 +60,8 @@ class ChatBot:
                 "size": debt_sizes[0] if len(debt_sizes) == 1 else None,
             }
         if buy or sell:
-            n = _find_n(text)
-            o = _find_obj(text)
+            n = scan.numbers
+            o = scan.pairs
             if len(n) > 1:
                 return {
                     "operation": "notion",
@@ -105,7 +96,7 @@ class ChatBot:
         elif summary:
             return {"operation": "summary"}
         elif ranking:
-            worst = _find(WORST_RANKING_TEXTS, text)
+            worst = "worst" in scan.intents
             return {"operation": "ranking", "worst": worst}
         elif rate:
             return {"operation": "rate"}
@@ -158,7 +149,7 @@ class ChatBot:
         if ops["operation"] == "notion":
             return ops["message"]
         if ops["operation"] == "buy":
-            fx = HandonFxAPI()
+            fx = self._fx_api()
             fx.start()
 
             unit = ops["size"]
@@ -175,7 +166,7 @@ class ChatBot:
             res = fx.buy(account_id, unit)
             return self._operation_message("buy", res)
         if ops["operation"] == "sell":
-            fx = HandonFxAPI()
+            fx = self._fx_api()
             fx.start()
 
             unit = ops["size"]
@@ -192,19 +183,19 @@ class ChatBot:
             res = fx.sell(account_id, unit)
             return self._operation_message("sell", res)
         if ops["operation"] == "unposition":
-            fx = HandonFxAPI()
+            fx = self._fx_api()
             fx.start()
             res = fx.close_position(account_id)
             return self._operation_message("unposition", res)
         if ops["operation"] == "help":
             return "自分で考えろ"
         if ops["operation"] == "summary":
-            fx = HandonFxAPI()
+            fx = self._fx_api()
             fx.start()
             summary = fx.summary(account_id)
             return self._summary_message(summary)
         if ops["operation"] == "rate":
-            fx = HandonFxAPI()
+            fx = self._fx_api()
             fx.start()
             rate = fx.rate()
             return f"1ドル{rate}円です。\nhttps://finance.yahoo.co.jp/quote/USDJPY=FX"
@@ -216,22 +207,21 @@ class ChatBot:
             return self.pay_debt(account_id, ops["size"])
 
     def ranking(self, worst=False):
-        fx = HandonFxAPI()
+        fx = self._fx_api()
         fx.start()
-        ranking = fx.ranking()
+        ranking = fx.ranking(limit=10, worst=worst)
 
         if worst:
             message = "現在の資産額ワーストランキングは以下の通りです。\n"
-            ranking = ranking[::-1]
         else:
             message = "現在の資産額ランキングは以下の通りです。\n"
 
-        for i, r in enumerate(ranking[:10]):
+        for i, r in enumerate(ranking):
             message += f"{i+1}位: {r['account_id']} {int(r['equity'])}円\n"
         return message
 
     def debt(self, account_id: str, size):
-        fx = HandonFxAPI()
+        fx = self._fx_api()
         fx.start()
         try:
             if size == 0:
@@ -244,7 +234,7 @@ class ChatBot:
             return e.message
 
     def pay_debt(self, account_id: str, size):
-        fx = HandonFxAPI()
+        fx = self._fx_api()
         fx.start()
         try:
             if size == 0:
@@ -1,19 +1,33 @@
+import asyncio
+import collections
 import json
+import threading
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 
-from mastodon import Mastodon
+import requests
+from mastodon import Mastodon, StreamListener
 import os
 import base64
 from handon_fx.chat.models import ChatModel
 from urllib.parse import urlparse
 
 from .chatbot import ChatBot
+from .mention_queue import MentionWorker, create_queue
 from .utils import remove_html_tags
 from ..fx import HandonFxAPI
+from ..fx.models import AccountModel
 
 
 def get_notification(mastodon, notification_id):
-    notification = mastodon.notifications(id=notification_id)
+    return _mention_info(mastodon.notifications(id=notification_id))
+
+
+def _mention_info(notification):
+    """
+    通知(メンション)からChatBotに渡すのに必要なものだけを取り出す
+    """
     user_id = notification["account"]["acct"]
     if "@" not in user_id:
         user_id = f'{user_id}@{urlparse(os.getenv("MASTODON_SERVER")).hostname}'
@@ -27,46 +41,229 @@ def get_notification(mastodon, notification_id):
     }
 
 
-def process_mention(mastodon, notification_id, force_process=False):
-    if not ChatModel.lock(str(notification_id)) and not force_process:
+# 建玉まで読んでおく操作
+_TRADE_OPERATIONS = ("buy", "sell", "unposition")
+
+
+def _prefetch_account(fx: HandonFxAPI, info):
+    ops = ChatBot(fx)._parse_text(info["content"]) or {}
+    try:
+        account = AccountModel.get(info["user_id"])
+    except AccountModel.DoesNotExist:
+        # 口座の作成は書き込みなのでChatBotに任せる
+        return
+    trades = None
+    if ops.get("operation") in _TRADE_OPERATIONS and account.open_trades != 0:
+        trades = fx.get_open_trades(info["user_id"])
+    fx.prefetch(info["user_id"], account=account, trades=trades)
+
+
+def prefetch_mention(mastodon, notification_id, fx: HandonFxAPI, info=None):
+    """
+    ロック・通知の取得・レートの取得を同時に行い、
+    通知が取れ次第その口座(と必要なら建玉)も読んでfxに渡しておく
+    :param info: 取得済みのget_notification()の結果 (あれば取りに行かない)
+    :return: (ロックが取れたか, get_notification()の結果)
+    """
+    timings = {}
+
+    def timed(name, func, *args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            timings[name] = time.perf_counter() - start
+
+    def read_mention(info):
+        if info is None:
+            info = timed("notification", get_notification, mastodon, notification_id)
+        try:
+            timed("account", _prefetch_account, fx, info)
+        except Exception as ex:
+            # 読めなくてもChatBotの中でもう一度読みに行く
+            print("Failed to prefetch account: {}".format(ex))
+        return info
+
+    start = time.perf_counter()
+    # 同時に届いたメンション同士で待たされないように、メンションごとにスレッドを用意する
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        locked = executor.submit(timed, "lock", ChatModel.lock, str(notification_id))
+        quote = executor.submit(timed, "quote", fx.start)
+        info = executor.submit(read_mention, info)
+
+        locked, info = locked.result(), info.result()
+        try:
+            quote.result()
+        except Exception as ex:
+            print("Failed to prefetch quote: {}".format(ex))
+
+    elapsed = time.perf_counter() - start
+    print(
+        "Prefetched notificationId={} in {:.3f}s (saved {:.3f}s): {}".format(
+            notification_id,
+            elapsed,
+            sum(timings.values()) - elapsed,
+            ", ".join(
+                "{}={:.3f}s".format(name, seconds) for name, seconds in timings.items()
+            ),
+        )
+    )
+    return locked, info
+
+
+def process_mention(mastodon, notification_id, force_process=False, info=None):
+    fx = HandonFxAPI()
+    locked, info = prefetch_mention(mastodon, notification_id, fx, info=info)
+    if not locked and not force_process:
         print("Already processed: notificationId={}".format(notification_id))
         return
 
-    info = get_notification(mastodon, notification_id)
-    try:
-        bot = ChatBot(HandonFxAPI())
-        res = bot.action(info["user_id"], info["content"])
-        if res is not None:
-            mastodon.status_post(
-                "@" + info["acct"] + " " + res,
-                in_reply_to_id=info["status_id"],
-                visibility=info["visibility"],
-            )
-    except Exception as ex:
+    _reply_mention(mastodon, fx, info)
+
+
+def _reply_mention(mastodon, fx: HandonFxAPI, info):
+    """
+    メンションをChatBotで処理して返信する (失敗したらエラーを返信する)
+    :param info: get_notification()の結果
+    """
+
+    def reply(text):
         mastodon.status_post(
-            "@" + info["acct"] + " エラー" + str(ex),
+            "@" + info["acct"] + " " + text,
             in_reply_to_id=info["status_id"],
             visibility=info["visibility"],
         )
+
+    try:
+        res = ChatBot(fx).action(info["user_id"], info["content"])
+        if res is not None:
+            reply(res)
+    except Exception as ex:
+        reply("エラー" + str(ex))
         print("Unknown error")
         print(ex)
         print(traceback.format_exc())
 
 
-def handle_push_notification(body, encryption, crypto_key):
-    mastodon = Mastodon(
+def _create_mastodon(session=None):
+    return Mastodon(
         access_token=os.getenv("ACCESS_TOKEN"),
         api_base_url=os.getenv("MASTODON_SERVER"),
+        session=session,
     )
 
+
+def _load_priv_key(path="keys/privkey"):
+    with open(path) as f:
+        priv_key = json.load(f)
+    priv_key["auth"] = base64.b64decode(priv_key["auth"])
+    return priv_key
+
+
+class MastodonContext:
+    """
+    Lambdaのコンテナが温まっている間、Mastodonのクライアント(HTTPのコネクションプールごと)と
+    復号用の鍵を使い回す
+    クライアントは環境変数が、鍵はファイルが変わった時だけ作り直す
+    """
+
+    def __init__(self, key_path: str = "keys/privkey", pool_size: int = 10):
+        self.key_path = key_path
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+        self._mastodon = None
+        self._mastodon_config = None
+        self._priv_key = None
+        self._priv_key_stamp = None
+
+    @staticmethod
+    def _config():
+        return os.getenv("ACCESS_TOKEN"), os.getenv("MASTODON_SERVER")
+
+    def _create_session(self):
+        # prefetch_mention()のスレッドからも同時に使うので、その分のコネクションを持っておく
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def mastodon(self):
+        config = self._config()
+        with self._lock:
+            if self._mastodon is None or config != self._mastodon_config:
+                self._mastodon = _create_mastodon(session=self._create_session())
+                self._mastodon_config = config
+            return self._mastodon
+
+    def priv_key(self):
+        stat = os.stat(self.key_path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if self._priv_key is None or stamp != self._priv_key_stamp:
+                self._priv_key = _load_priv_key(self.key_path)
+                self._priv_key_stamp = stamp
+            return self._priv_key
+
+    def reset(self):
+        with self._lock:
+            self._mastodon = None
+            self._priv_key = None
+
+
+_context = MastodonContext()
+
+
+_mention_queue = None
+_mention_queue_lock = threading.Lock()
+
+
+def _process_queued_mention(mastodon, notification_id, info):
+    process_mention(mastodon, notification_id, info=info)
+
+
+def get_mention_queue():
+    """
+    環境変数MENTION_QUEUE (memory:// か sqlite:///path) で指定したキュー
+    指定がなければNoneで、メンションはpushを受けたその場で処理する
+    最初に呼ばれた時に、このプロセスでキューを処理するワーカーも起動する
+
+    ワーカーはこのプロセスのスレッドなので、常駐するプロセス(app.pyなど)でだけ使える。
+    Lambdaでは返した後にコンテナが止まってキューが処理されないので、指定されていても使わない
+    """
+    global _mention_queue
+    url = os.getenv("MENTION_QUEUE")
+    if not url:
+        return None
+    if os.getenv("AWS_LAMBDA_FUNCTION_NAME"):
+        print("MENTION_QUEUE is ignored on Lambda: processing mentions inline")
+        return None
+    with _mention_queue_lock:
+        if _mention_queue is None:
+            _mention_queue = create_queue(url)
+            MentionWorker(
+                _mention_queue,
+                mastodon_factory=_context.mastodon,
+                fetch=get_notification,
+                process=_process_queued_mention,
+            ).start()
+    return _mention_queue
+
+
+def handle_push_notification(body, encryption, crypto_key):
+    mastodon = _context.mastodon()
+
     try:
-        priv_key = json.load(open("keys/privkey"))
-        priv_key["auth"] = base64.b64decode(priv_key["auth"])
+        priv_key = _context.priv_key()
         notification = mastodon.push_subscription_decrypt_push(
             body, priv_key, encryption, crypto_key
         )
         if notification["notification_type"] == "mention":
-            process_mention(mastodon, notification["notification_id"])
+            queue = get_mention_queue()
+            if queue is not None:
+                queue.put(notification["notification_id"])
+            else:
+                process_mention(mastodon, notification["notification_id"])
         if notification["notification_type"] == "follow":
             pass
     except Exception as ex:
@@ -77,3 +274,159 @@ def handle_push_notification(body, encryption, crypto_key):
         raise ex
 
     return True
+
+
+async def process_mention_async(mastodon, notification_id, force_process=False):
+    """
+    process_mentionのasync版
+    ブロッキングな処理はスレッドで動かし、イベントループは止めない
+    """
+    fx = HandonFxAPI()
+    locked, info = await asyncio.to_thread(
+        prefetch_mention, mastodon, notification_id, fx
+    )
+    if not locked and not force_process:
+        print("Already processed: notificationId={}".format(notification_id))
+        return
+
+    await asyncio.to_thread(_reply_mention, mastodon, fx, info)
+
+
+async def handle_push_notification_async(
+    body, encryption, crypto_key, mastodon=None, priv_key=None
+):
+    """
+    handle_push_notificationのasync版
+    :param mastodon: Mastodonのクライアント (省略時は環境変数から作る。負荷試験ではFakeMastodonを渡す)
+    :param priv_key: 復号用の鍵 (省略時はkeys/privkeyから読む)
+    """
+    if mastodon is None:
+        mastodon = await asyncio.to_thread(_context.mastodon)
+
+    try:
+        if priv_key is None:
+            priv_key = await asyncio.to_thread(_context.priv_key)
+        notification = mastodon.push_subscription_decrypt_push(
+            body, priv_key, encryption, crypto_key
+        )
+        if notification["notification_type"] == "mention":
+            queue = get_mention_queue()
+            if queue is not None:
+                await asyncio.to_thread(queue.put, notification["notification_id"])
+            else:
+                await process_mention_async(mastodon, notification["notification_id"])
+        if notification["notification_type"] == "follow":
+            pass
+    except Exception as ex:
+        print("Unknown error")
+        print(ex)
+        print(traceback.format_exc())
+        await asyncio.to_thread(
+            mastodon.status_post, "@osa9 " + str(ex), visibility="direct"
+        )
+        raise ex
+
+    return True
+
+
+class MentionStreamListener(StreamListener):
+    """
+    ユーザーストリームで届いたメンションを、通知に入っているステータスでそのまま処理する
+    (pushと違って復号も通知の取り直しもいらない)
+
+    同じアカウントのメンションは届いた順に1つずつ、違うアカウントのメンションは並行して処理する。
+    """
+
+    def __init__(self, mastodon, process=None, max_workers: int = 4):
+        """
+        :param process: process(mastodon, notification_id, info=info) 省略時はprocess_mention
+        """
+        self.mastodon = mastodon
+        self.process = process or process_mention
+        self.last_id = None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def on_notification(self, notification):
+        with self._lock:
+            if self.last_id is None or int(notification["id"]) > int(self.last_id):
+                self.last_id = notification["id"]
+        if notification["type"] == "mention":
+            self.submit(notification)
+
+    def on_unknown_event(self, name, unknown_event=None):
+        pass
+
+    def submit(self, notification):
+        info = _mention_info(notification)
+        job = (notification["id"], info)
+        with self._lock:
+            jobs = self._pending.get(info["user_id"])
+            if jobs is not None:
+                jobs.append(job)
+                return
+            self._pending[info["user_id"]] = collections.deque([job])
+        self._executor.submit(self._process_account, info["user_id"])
+
+    def _process_account(self, user_id):
+        while True:
+            with self._lock:
+                jobs = self._pending[user_id]
+                if not jobs:
+                    del self._pending[user_id]
+                    return
+                notification_id, info = jobs.popleft()
+            try:
+                self.process(self.mastodon, notification_id, info=info)
+            except Exception:
+                print(traceback.format_exc())
+
+    def catch_up(self):
+        """
+        つながっていなかった間に届いたメンションを通知APIから拾う
+        1ページに収まらない分も、min_idで古い方から空になるまでページをめくって拾う
+        (二重に処理しそうになってもChatModel.lockで弾かれる)
+        """
+        if self.last_id is None:
+            return
+        min_id = self.last_id
+        while True:
+            notifications = self.mastodon.notifications(
+                min_id=min_id, types=["mention"]
+            )
+            if not notifications:
+                return
+            for notification in reversed(notifications):
+                self.on_notification(notification)
+            min_id = max(int(notification["id"]) for notification in notifications)
+
+    def close(self):
+        """
+        処理中のメンションが終わるまで待つ
+        """
+        self._executor.shutdown(wait=True)
+
+
+def run_mention_stream(mastodon=None, listener=None, retry_wait=5, stop=None):
+    """
+    ユーザーストリームにつなぎっぱなしにしてメンションを処理する (pushの代わりの常駐モード)
+    切れたら、取りこぼしを拾ってからつなぎ直す
+    :param stop: setされたら次につなぎ直す時に止める
+    """
+    if mastodon is None:
+        mastodon = _context.mastodon()
+    if listener is None:
+        listener = MentionStreamListener(mastodon)
+    if stop is None:
+        stop = threading.Event()
+
+    while not stop.is_set():
+        try:
+            listener.catch_up()
+            mastodon.stream_user(listener)
+        except Exception:
+            print("Stream disconnected")
+            print(traceback.format_exc())
+            stop.wait(retry_wait)
+    listener.close()
@@ -0,0 +1,280 @@
+import abc
+import collections
+import math
+import sqlite3
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional
+from urllib.parse import urlparse
+
+
+class Job(NamedTuple):
+    id: int
+    notification_id: str
+    deliveries: int = 1  # get_batch()で渡された回数 (今回を含む)
+
+
+class MentionQueue(abc.ABC):
+    """
+    pushで届いたメンションの通知IDを貯めておくキュー
+    get_batch()で取り出したジョブは、ack()するまで他のワーカーには渡さない
+    (ack()されないまま `visibility_timeout` 秒たったジョブはもう一度渡す)
+    """
+
+    @abc.abstractmethod
+    def put(self, notification_id: str):
+        pass
+
+    @abc.abstractmethod
+    def get_batch(self, max_jobs: int) -> List[Job]:
+        pass
+
+    @abc.abstractmethod
+    def ack(self, jobs: List[Job]):
+        pass
+
+
+class MemoryQueue(MentionQueue):
+    """
+    プロセス内だけのキュー (ローカルでの動作確認・テスト用)
+    """
+
+    def __init__(self, visibility_timeout: float = 300):
+        self.visibility_timeout = visibility_timeout
+        self._jobs: Dict[int, Job] = {}  # ack()されるまで残す (idの順)
+        self._taken_at: Dict[int, float] = {}
+        self._deliveries: Dict[int, int] = {}
+        self._ids = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def put(self, notification_id: str):
+        with self._lock:
+            self._ids += 1
+            self._jobs[self._ids] = Job(self._ids, str(notification_id))
+
+    def get_batch(self, max_jobs: int) -> List[Job]:
+        now = time.time()
+        with self._lock:
+            jobs = [
+                job
+                for job in self._jobs.values()
+                if self._taken_at.get(job.id, -math.inf) < now - self.visibility_timeout
+            ][:max_jobs]
+            for job in jobs:
+                self._taken_at[job.id] = now
+                self._deliveries[job.id] = self._deliveries.get(job.id, 0) + 1
+            return [job._replace(deliveries=self._deliveries[job.id]) for job in jobs]
+
+    def ack(self, jobs: List[Job]):
+        with self._lock:
+            for job in jobs:
+                self._jobs.pop(job.id, None)
+                self._taken_at.pop(job.id, None)
+                self._deliveries.pop(job.id, None)
+
+
+class SQLiteQueue(MentionQueue):
+    """
+    SQLiteのファイルに置くキュー (複数のプロセスから使える)
+    取り出してから `visibility_timeout` 秒たってもack()されないジョブはもう一度渡す
+    """
+
+    def __init__(self, path: str, visibility_timeout: float = 300):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS mentions ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " notification_id TEXT NOT NULL,"
+                " taken_at REAL,"
+                " deliveries INTEGER NOT NULL DEFAULT 0)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def __len__(self):
+        with self._connect() as db:
+            return db.execute("SELECT COUNT(*) FROM mentions").fetchone()[0]
+
+    def put(self, notification_id: str):
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO mentions (notification_id) VALUES (?)",
+                (str(notification_id),),
+            )
+
+    def get_batch(self, max_jobs: int) -> List[Job]:
+        now = time.time()
+        db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            rows = db.execute(
+                "SELECT id, notification_id, deliveries + 1 FROM mentions"
+                " WHERE taken_at IS NULL OR taken_at < ?"
+                " ORDER BY id LIMIT ?",
+                (now - self.visibility_timeout, max_jobs),
+            ).fetchall()
+            db.executemany(
+                "UPDATE mentions SET taken_at = ?, deliveries = deliveries + 1"
+                " WHERE id = ?",
+                [(now, row[0]) for row in rows],
+            )
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        finally:
+            db.close()
+        return [Job(*row) for row in rows]
+
+    def ack(self, jobs: List[Job]):
+        with self._connect() as db:
+            db.executemany(
+                "DELETE FROM mentions WHERE id = ?", [(job.id,) for job in jobs]
+            )
+
+
+def create_queue(url: str) -> MentionQueue:
+    """
+    :param url: memory:// か sqlite:///path/to/queue.db
+    """
+    parsed = urlparse(url)
+    if parsed.scheme == "memory":
+        return MemoryQueue()
+    if parsed.scheme == "sqlite":
+        return SQLiteQueue(parsed.path)
+    raise ValueError(f"unknown queue: {url}")
+
+
+class MentionWorker:
+    """
+    キューからまとめてメンションを取り出して処理する
+
+    同じアカウントのメンションは届いた順に1つずつ、違うアカウントのメンションは並行して処理する。
+    同じ口座への書き込みが同時に走らないので、AccountModelの競合によるやり直しが起きにくい。
+
+    失敗したジョブはack()せず、順番を守るためにそれより後の同じアカウントのジョブも次に回す
+    (通知が取れなかった時はどのアカウントか分からないので、バッチの残りを全部次に回す)。
+    `max_deliveries` 回渡されても失敗するジョブは諦めてack()し、後ろのジョブを先に進める。
+    """
+
+    def __init__(
+        self,
+        queue: MentionQueue,
+        mastodon_factory: Callable,
+        fetch: Callable,
+        process: Callable,
+        batch_size: int = 20,
+        max_workers: int = 4,
+        poll_interval: float = 0.5,
+        max_deliveries: int = 5,
+    ):
+        """
+        :param fetch: fetch(mastodon, notification_id) -> get_notification()の結果
+        :param process: process(mastodon, notification_id, info) 1つのメンションを処理する
+        """
+        self.queue = queue
+        self.mastodon_factory = mastodon_factory
+        self.fetch = fetch
+        self.process = process
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_deliveries = max_deliveries
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def _fetch(self, mastodon, job: Job):
+        try:
+            return self.fetch(mastodon, job.notification_id)
+        except Exception:
+            print("Failed to fetch notification: {}".format(job.notification_id))
+            print(traceback.format_exc())
+            return None
+
+    def _give_up(self, job: Job) -> bool:
+        if job.deliveries < self.max_deliveries:
+            return False
+        print(
+            "Giving up notification after {} deliveries: {}".format(
+                job.deliveries, job.notification_id
+            )
+        )
+        return True
+
+    def _process_account(self, mastodon, jobs) -> List[Job]:
+        """
+        :return: ack()するジョブ (失敗したら、そこから後は次に回す)
+        """
+        done = []
+        for job, info in jobs:
+            try:
+                self.process(mastodon, job.notification_id, info)
+            except Exception:
+                print(traceback.format_exc())
+                if not self._give_up(job):
+                    break
+            done.append(job)
+        return done
+
+    def run_once(self) -> int:
+        """
+        1回分のバッチを処理する
+        ack()しなかったジョブは、キューの `visibility_timeout` がたってからもう一度処理する
+        :return: ack()したジョブの数
+        """
+        jobs = self.queue.get_batch(self.batch_size)
+        if not jobs:
+            return 0
+
+        mastodon = self.mastodon_factory()
+        infos = self._executor.map(lambda job: self._fetch(mastodon, job), jobs)
+
+        done = []
+        accounts = collections.OrderedDict()
+        for job, info in zip(jobs, infos):
+            if info is None:
+                if not self._give_up(job):
+                    break
+                done.append(job)
+                continue
+            accounts.setdefault(info["user_id"], []).append((job, info))
+
+        done += [
+            job
+            for account_done in self._executor.map(
+                lambda account_jobs: self._process_account(mastodon, account_jobs),
+                accounts.values(),
+            )
+            for job in account_done
+        ]
+        self.queue.ack(done)
+        return len(done)
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            try:
+                processed = self.run_once()
+            except Exception:
+                print(traceback.format_exc())
+                processed = 0
+            if not processed:
+                self._stop.wait(self.poll_interval)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run_forever, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
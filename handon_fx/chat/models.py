@@ -1,9 +1,34 @@
+import threading
+from collections import OrderedDict
 from datetime import timedelta
 
 from pynamodb.attributes import TTLAttribute, UnicodeAttribute
+from pynamodb.exceptions import PutError
 from pynamodb.models import Model
 import os
 
+# 最近処理した通知IDをいくつまで覚えておくか (webhookの再送をDynamoDBに聞かずに弾く)
+RECENT_NOTIFICATIONS = 1024
+
+_recent = OrderedDict()
+_recent_lock = threading.Lock()
+
+
+def _seen(notification_id: str) -> bool:
+    with _recent_lock:
+        if notification_id in _recent:
+            _recent.move_to_end(notification_id)
+            return True
+        return False
+
+
+def _remember(notification_id: str):
+    with _recent_lock:
+        _recent[notification_id] = True
+        _recent.move_to_end(notification_id)
+        while len(_recent) > RECENT_NOTIFICATIONS:
+            _recent.popitem(last=False)
+
 
 class ChatModel(Model):
     class Meta:
@@ -16,9 +41,20 @@ class ChatModel(Model):
 
     @staticmethod
     def lock(notification_id: str):
+        """
+        通知を処理する権利を取る (1回の条件付きputなので、同時に届いても片方しか取れない)
+        :return: 取れたらTrue、処理済み・処理中ならFalse
+        """
+        if _seen(notification_id):
+            return False
         try:
-            ChatModel().get(hash_key=notification_id)
+            ChatModel(notification_id=notification_id).save(
+                condition=ChatModel.notification_id.does_not_exist()
+            )
+        except PutError as e:
+            if e.cause_response_code != "ConditionalCheckFailedException":
+                raise
+            _remember(notification_id)
             return False
-        except ChatModel.DoesNotExist:
-            ChatModel(notification_id=notification_id).save()
-            return True
+        _remember(notification_id)
+        return True
@@ -1,4 +1,5 @@
 import re
+from collections import namedtuple
 
 BUY_TEXTS = ["買", "ロング", "long", "Long", "L", "buy", "Buy"]
 SELL_TEXTS = ["売", "ショート", "short", "Short", "S", "sell", "Sell"]
@@ -31,6 +32,9 @@ DEBT_TEXT = ["貸し", "借し"]
 CLEAR_DEBT_TEXTS = ["返済", "返し", "返す"]
 
 
+NUMBER_PATTERN = r"[-+]?\d+(?:,\d+)*(?:\.\d+)?%?"
+
+
 def _find(keywords, text):
     for t in keywords:
         if t in text:
@@ -48,29 +52,33 @@ def _find_yen(text):
 
 
 def _find_n(text):
-    numbers = re.findall(r"[-+]?\d+(?:,\d+)*(?:\.\d+)?%?", text)
+    numbers = re.findall(NUMBER_PATTERN, text)
 
     res = []
     for number_text in numbers:
-        number = float(number_text.rstrip("%"))
-        if "%" in number_text:
-            if number > 100:
-                number = 0.999998
-            elif number < -100:
-                number = -0.999998
-            elif abs(abs(number) - 100) < 0.0001:
-                number = 0.999998
-            else:
-                number /= 100
-        if "-" in number_text:
-            number = -number
-        if number > 1:
-            number = int(number)
-        res += [number]
+        res += [_parse_n(number_text)]
 
     return res
 
 
+def _parse_n(number_text):
+    number = float(number_text.rstrip("%"))
+    if "%" in number_text:
+        if number > 100:
+            number = 0.999998
+        elif number < -100:
+            number = -0.999998
+        elif abs(abs(number) - 100) < 0.0001:
+            number = 0.999998
+        else:
+            number /= 100
+    if "-" in number_text:
+        number = -number
+    if number > 1:
+        number = int(number)
+    return number
+
+
 
 def _find_obj(text):
     """Find the target object in the text.
@@ -96,6 +104,124 @@ def _find_obj(text):
     return res
 
 
+# scan_text()で見分ける操作とキーワード
+INTENT_TEXTS = {
+    "buy": BUY_TEXTS,
+    "sell": SELL_TEXTS,
+    "unposition": UNPOSITION_TEXTS,
+    "help": HELP_TEXTS,
+    "summary": SUMMARY_TEXTS,
+    "rate": RATE_TEXTS,
+    "ranking": RANKING_TEXTS,
+    "worst": WORST_RANKING_TEXTS,
+    "debt": DEBT_TEXT,
+    "clear_debt": CLEAR_DEBT_TEXTS,
+}
+
+
+class TextScan(namedtuple("TextScan", ["intents", "pairs", "number_texts", "yen"])):
+    @property
+    def numbers(self):
+        # _find_n()と同じく、使う時に初めて数値にする ("1,000"はfloat()で失敗する)
+        return [_parse_n(number_text) for number_text in self.number_texts]
+
+
+def _trie_pattern(words):
+    """Build a regex that walks the keywords as a trie.
+
+    Common prefixes are shared (e.g. "L" and "Long" become ``L(?:ong)?``),
+    so the regex engine tries each character once instead of every keyword.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for c in word:
+            node = node.setdefault(c, {})
+        node[""] = {}
+
+    def build(node):
+        end = "" in node
+        branches = [
+            re.escape(c) + build(child) for c, child in sorted(node.items()) if c
+        ]
+        if not branches:
+            return ""
+        if len(branches) == 1 and not end:
+            return branches[0]
+        return "(?:" + "|".join(branches) + ")" + ("?" if end else "")
+
+    return build(trie)
+
+
+# キーワードごとに、当たった操作・ペアをビットで持つ
+_LABELS = list(INTENT_TEXTS) + list(PAIRS_TEXTS)
+
+
+def _compile_scanner():
+    masks = {}
+    for i, label in enumerate(_LABELS):
+        for keyword in INTENT_TEXTS.get(label) or PAIRS_TEXTS[label]:
+            masks[keyword] = masks.get(keyword, 0) | 1 << i
+
+    # 各位置で一番長いキーワードしか取れないので、その中に含まれる短いキーワードの分も付けておく
+    # (「ドル円」なら「ドル」のrateも)
+    closure = {}
+    for keyword in masks:
+        for k in masks:
+            if k in keyword:
+                closure[keyword] = closure.get(keyword, 0) | masks[k]
+
+    # 数値はfindall()と同じく消費し、キーワードは先読みで重なりも含めて全部の位置で取る
+    pattern = re.compile(
+        "(" + NUMBER_PATTERN + ")(?=(万|円))?" + "|(?=(" + _trie_pattern(masks) + "))"
+    )
+    return pattern, closure
+
+
+_SCANNER, _KEYWORD_MASKS = _compile_scanner()
+_DECODED = {}
+
+
+def _decode(mask):
+    decoded = _DECODED.get(mask)
+    if decoded is None:
+        labels = [label for i, label in enumerate(_LABELS) if mask >> i & 1]
+        decoded = _DECODED[mask] = (
+            frozenset(label for label in labels if label in INTENT_TEXTS),
+            tuple(label for label in labels if label in PAIRS_TEXTS),
+        )
+    return decoded
+
+
+def scan_text(text):
+    """Scan the text once for intents, pairs, numbers and yen amounts.
+
+    Returns a ``TextScan`` whose fields match the older helpers:
+    - ``intents``: names in ``INTENT_TEXTS`` where ``_find`` would be True.
+    - ``pairs``: same as ``_find_obj``.
+    - ``numbers``: same as ``_find_n`` (parsed on access).
+    - ``yen``: same as ``_find_yen`` (only run when a number is followed by 万/円).
+    """
+    mask = 0
+    number_texts = []
+    has_yen = False
+    for number_text, suffix, keyword in _SCANNER.findall(text):
+        if keyword:
+            mask |= _KEYWORD_MASKS[keyword]
+        elif number_text:
+            number_texts.append(number_text)
+            has_yen = has_yen or bool(suffix)
+
+    intents, pairs = _decode(mask)
+    return TextScan(
+        intents=intents,
+        pairs=list(pairs),
+        number_texts=number_texts,
+        # 数値の後ろに万・円がある時だけ金額を読む
+        yen=_find_yen(text) if has_yen else [],
+    )
+
+
 def remove_html_tags(text):
     """Remove html tags from a string"""
     clean_a = re.compile("<a.*?>(.*?)</a>")
@@ -0,0 +1,256 @@
+"""
+ローカルで負荷試験やテストをするための、外部サービスの代わり
+"""
+import datetime
+import http.server
+import itertools
+import json
+import queue
+import random
+import threading
+import time
+
+from handon_fx.fx.rate import Quote
+
+
+class FakeQuoteFeed:
+    """
+    Yahooの代わりにランダムウォークするレートを返す
+    (handon_fx.fx.rate.set_quote_source()に渡して使う)
+    """
+
+    def __init__(self, price: float = 130.0, spread: float = 0.01, latency: float = 0):
+        self.price = price
+        self.spread = spread
+        self.latency = latency
+        self.calls = 0
+        self._random = random.Random(0)
+
+    def __call__(self) -> Quote:
+        if self.latency:
+            time.sleep(self.latency)
+        self.calls += 1
+        self.price = round(self.price + self._random.gauss(0, 0.01), 3)
+        return Quote(
+            name="USD/JPY",
+            price=self.price,
+            bid=self.price - self.spread / 2,
+            ask=self.price + self.spread / 2,
+            time=datetime.datetime.now(),
+        )
+
+
+class FakeMastodon:
+    """
+    Mastodon.pyのクライアントのうち、はんどんFXが使うものだけを真似する
+
+    push_subscription_decrypt_push()は暗号化せずにJSONのbodyをそのまま読む。
+    """
+
+    def __init__(self, latency: float = 0, hostname: str = "handon.club"):
+        self.latency = latency
+        self.hostname = hostname
+        self.posts = []
+        self._notifications = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def add_mention(self, acct: str, content: str, visibility: str = "public"):
+        """
+        メンションを作ってpushのbodyを返す
+        """
+        with self._lock:
+            notification_id = next(self._ids)
+            self._notifications[notification_id] = {
+                "id": notification_id,
+                "type": "mention",
+                "account": {"acct": acct},
+                "status": {
+                    "id": notification_id,
+                    "visibility": visibility,
+                    "content": f"<p>{content}</p>",
+                },
+            }
+        return json.dumps(
+            {"notification_id": notification_id, "notification_type": "mention"}
+        ).encode()
+
+    def push_subscription_decrypt_push(
+        self, data, decrypt_params, encryption_header, crypto_key_header
+    ):
+        return json.loads(data)
+
+    def notifications(
+        self, id=None, since_id=None, min_id=None, limit=None, types=None
+    ):
+        """
+        Mastodonと同じく1ページ `limit` 件 (省略時は15件) まで、新しい順に返す
+        since_idなら一番新しいページ、min_idならmin_idのすぐ後のページになる
+        """
+        self._wait()
+        if id is not None:
+            return self._notifications[int(id)]
+        limit = limit or 15
+        after = since_id if min_id is None else min_id
+        notifications = [
+            notification
+            for notification_id, notification in sorted(self._notifications.items())
+            if (after is None or notification_id > int(after))
+            and (types is None or notification["type"] in types)
+        ]
+        if min_id is None:
+            return notifications[::-1][:limit]
+        return notifications[:limit][::-1]
+
+    def status_post(self, status, in_reply_to_id=None, visibility=None):
+        self._wait()
+        with self._lock:
+            self.posts.append(
+                {
+                    "status": status,
+                    "in_reply_to_id": in_reply_to_id,
+                    "visibility": visibility,
+                }
+            )
+
+
+class FakeStreamServer:
+    """
+    Mastodonのストリーミング(/api/v1/streaming/user)を真似するローカルのHTTPサーバー
+
+    Mastodon.pyのstream_user()がつなぎに来るので、push()したイベントを
+    Server-Sent Eventsで流す。close_stream()で今つないでいるストリームを切る。
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, heartbeat: float = 1.0):
+        self.heartbeat = heartbeat
+        self.connections = 0
+        self._events = queue.Queue()
+        self._server = http.server.ThreadingHTTPServer(
+            (host, port), self._handler_class()
+        )
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path.startswith("/api/v1/instance"):
+                    # ストリーミングは同じサーバーにつないでもらう
+                    streaming = server.url.replace("http://", "ws://")
+                    return self._send_json({"urls": {"streaming_api": streaming}})
+                if self.path.startswith("/api/v1/streaming/user"):
+                    return self._stream()
+                self.send_error(404)
+
+            def _stream(self):
+                server.connections += 1
+                # Content-Lengthなしで、切るまでをbodyにする
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                self.wfile.flush()
+                try:
+                    while True:
+                        try:
+                            event = server._events.get(timeout=server.heartbeat)
+                        except queue.Empty:
+                            # Mastodonと同じく、空行なしのコメント行を送る
+                            self.wfile.write(b":thump\n")
+                            self.wfile.flush()
+                            continue
+                        if event is None:
+                            return
+                        name, payload = event
+                        self.wfile.write(
+                            f"event: {name}\ndata: {json.dumps(payload)}\n\n".encode()
+                        )
+                        self.wfile.flush()
+                except ConnectionError:
+                    # クライアントが先に切った
+                    pass
+
+        return Handler
+
+    def push(self, event: str, payload):
+        self._events.put((event, payload))
+
+    def close_stream(self):
+        self._events.put(None)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.close_stream()
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class FakeTransaction:
+    """
+    handon_fx.fx.commit.transaction()の代わりに、DynamoDBに書かずに書き込みを記録する
+    (transaction()の代わりにこのインスタンスをpatchして使う)
+
+    `errors` に例外を入れておくと、その数だけコミットの時に順に投げる
+    """
+
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.commits = []  # コミットできたトランザクションごとの書き込みのリスト
+        self._writes = None
+
+    def __call__(self):
+        return self
+
+    def __enter__(self):
+        self._writes = []
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        writes, self._writes = self._writes, None
+        if exc_type is not None:
+            return False
+        if self.errors:
+            raise self.errors.pop(0)
+        self.commits.append(writes)
+        return False
+
+    def save(self, model, condition=None):
+        self._writes.append(("save", model, None, condition))
+
+    def update(self, model, actions, condition=None):
+        self._writes.append(("update", model, actions, condition))
+
+    def writes(self, model_class=None):
+        """コミットできた書き込みを (種類, モデル, actions, condition) で返す"""
+        return [
+            write
+            for writes in self.commits
+            for write in writes
+            if model_class is None or isinstance(write[1], model_class)
+        ]
@@ -1,22 +1,66 @@
-from typing import Optional
+from typing import Dict, Iterable, Optional
 import datetime
+import os
 import pytz
 
-from .exceptions import NotEnoughCash
-from .rate import get_current_rate
-from backtesting._util import _Data as Data
-from .broker import HandonBroker
-from .models import TradeModel, AccountModel
-from .strategy import HandonStrategy
+from .exceptions import NotEnoughCash, TooManyTrades
+from .rate import DEFAULT_PAIR, get_current_quotes
+from .live import LiveBroker
+from .commit import MAX_TRANSACTION_ITEMS, transaction, retry_on_conflict
+from .models import TradeModel, AccountModel, LeaderboardModel
 from .trade import HandonTrade
+from .valuation import BookValuation, RankingCache
+
+
+LEADERBOARD = "equity"
+# rebuild_leaderboard()が全口座を書き終えた印の行 (board=LEADERBOARD_BUILT, account_id=LEADERBOARD)
+LEADERBOARD_BUILT = "built"
+MARGIN = 1.0 / 20.0
+LOT_UNIT = 10000
+# 1回の注文で書ける建玉の数 (口座とランキングの行の分を空ける)
+MAX_TRADE_WRITES = MAX_TRANSACTION_ITEMS - 2
+# 未決済の建玉がこれを超えていたら、注文の前にまとめておく
+# (注文1回で建玉の本数より数本多く書くことがあるので余裕を見る)
+MAX_OPEN_TRADES = MAX_TRADE_WRITES - 8
+# TradeModel.instrumentの昔の書き方
+INSTRUMENT_PAIRS = {"JPY/USD": "USDJPY"}
+
+# 同じコンテナの中ではランキングを使い回す (書き込んだら捨てる)
+ranking_cache = RankingCache(
+    rate_bucket=float(os.getenv("RANKING_RATE_BUCKET", "0.001")),
+    ttl=float(os.getenv("RANKING_CACHE_TTL", "30")),
+)
 
 
 class HandonFxAPI:
-    def __init__(self):
-        self.data = None
+    def __init__(self, compact_min_lots: Optional[int] = None):
+        """
+        :param compact_min_lots: 未決済の建玉がこの本数以上になったら1本にまとめる (0なら何もしない)
+        """
+        self.quotes = {}
+        self.quote = None
+        if compact_min_lots is None:
+            compact_min_lots = int(os.getenv("COMPACT_MIN_LOTS", "0"))
+        self.compact_min_lots = compact_min_lots
+        self._prefetched = {}  # account_id -> (口座, 建玉 or None)
+        self._account_trades = {}  # get_account_info()で返した口座と一緒に読んだ建玉
 
     def start(self):
-        self.data = Data(get_current_rate())
+        # 全ペアを1回で取ってくる
+        self.quotes = get_current_quotes()
+        self.quote = self.quotes[DEFAULT_PAIR]
+
+    def prefetch(self, account_id: str, account=None, trades=None):
+        """
+        先に(並行して)読み込んでおいた口座・建玉を渡しておくと、次の1回の読み込みはそれを使う
+        書き込みに失敗してやり直す時は読み直す
+        建玉はその口座と一緒にしか使わない (口座を読み直したら建玉も読み直す)
+        """
+        if account is not None:
+            self._prefetched[account_id] = (
+                account,
+                None if trades is None else list(trades),
+            )
 
     def get_accounts(self):
         accounts = []
@@ -24,13 +68,31 @@ class HandonFxAPI:
             accounts.append(account)
         return accounts
 
+    @retry_on_conflict
     def get_account_info(self, account_id: str, create_account: bool = True):
+        # 前に返した口座の建玉は、これから返す口座とversionが合わないかもしれない
+        self._account_trades.pop(account_id, None)
+        prefetched = self._prefetched.pop(account_id, None)
+        if prefetched is not None:
+            account, trades = prefetched
+            if trades is not None:
+                self._account_trades[account_id] = trades
+            return account
         try:
             account = AccountModel.get(account_id)
         except AccountModel.DoesNotExist:
             if create_account:
-                account = AccountModel(account_id=account_id, cash=100_0000)
-                account.save()
+                account = AccountModel(
+                    account_id=account_id,
+                    cash=100_0000,
+                    position_size=0,
+                    position_avg_price=0,
+                    open_trades=0,
+                )
+                with transaction() as t:
+                    t.save(account)
+                    self._update_leaderboard(t, account_id, cash=account.cash)
+                ranking_cache.invalidate()
             else:
                 raise AccountModel.DoesNotExist
         return account
@@ -40,61 +102,236 @@ class HandonFxAPI:
             account_id, TradeModel.state == "open"
         )
 
-    def _create_broker(self, account_id, cash):
-        broker = HandonBroker(
-            data=self.data,
+    def _create_broker(self, account_id, cash, open_trades=None):
+        broker = LiveBroker(
+            price=self.rate(),
             cash=cash,
-            commission=0,
-            margin=1.0 / 20.0,
-            trade_on_close=False,
-            hedging=False,
-            exclusive_orders=False,
-            index=self.data.index,
-            lot_unit=10000,
+            margin=MARGIN,
+            lot_unit=LOT_UNIT,
         )
 
-        trades = map(
-            lambda trade: HandonTrade.from_model(broker, trade),
-            self.get_open_trades(account_id),
-        )
-        broker.trades = list(trades)
+        # スナップショットで建玉がないと分かっていれば読みに行かない
+        prefetched = self._account_trades.pop(account_id, None)
+        if open_trades != 0:
+            if prefetched is None:
+                prefetched = self.get_open_trades(account_id)
+            trades = map(
+                lambda trade: HandonTrade.from_model(broker, trade),
+                prefetched,
+            )
+            broker.trades = list(trades)
 
         return broker
 
-    def rate(self):
-        return self.data.Close[-1]
+    def rate(self, pair: str = DEFAULT_PAIR):
+        if pair == DEFAULT_PAIR:
+            return self.quote.price
+        return self.quotes[pair].price
+
+    def to_jpy(self, currency: str) -> float:
+        """
+        `currency` 1単位が何円か (start()で取ったレートで換算する)
+        """
+        if currency == "JPY":
+            return 1.0
+        return self.rate(currency + "JPY")
 
-    def _get_summary(self, account: AccountModel, broker: HandonBroker):
+    def position_pl(self, trades: Iterable[TradeModel]) -> Dict[str, float]:
+        """
+        複数ペアの建玉の含み損益を、start()で取ったレートだけで円に換算して計算する
+        :param trades: 未決済の建玉 (instrumentがペア名のもの)
+        :return: ペアごとの含み損益(円)
+        """
+        pl = {}
+        for trade in trades:
+            pair = INSTRUMENT_PAIRS.get(trade.instrument, trade.instrument)
+            pair = pair.replace("/", "")
+            value = trade.size * (self.rate(pair) - trade.entry_price)
+            pl[pair] = pl.get(pair, 0) + value * self.to_jpy(pair[3:])
+        return pl
+
+    def _get_summary(self, account: AccountModel, broker: LiveBroker):
         summary = broker.summary()
         summary["debt"] = account.current_debt
         return summary
 
+    def _snapshot_summary(self, account: AccountModel):
+        """
+        口座の建玉のスナップショットからサマリを計算する (LiveBroker.summary()と同じ値)
+        スナップショットがない古い口座ならNone
+        """
+        if not account.has_position_snapshot:
+            return None
+
+        rate = self.rate()
+        size = account.position_size
+        avg_price = account.position_avg_price if size else 0
+        leverage = 1 / MARGIN
+        equity = account.cash + size * (rate - avg_price)
+        margin_available = max(0, equity - abs(size) * rate / leverage)
+        return {
+            "equity": equity,
+            "cash": account.cash,
+            "margin_available": margin_available,
+            "profit": equity - account.cash,
+            "lots_avaitable": int(margin_available * leverage // rate // LOT_UNIT),
+            "position_size": size,
+            "position_avg_price": avg_price,
+            "rate": rate,
+            "debt": account.current_debt,
+        }
+
     def summary(self, account_id: str):
         account = self.get_account_info(account_id)
+        summary = self._snapshot_summary(account)
+        if summary is not None:
+            return summary
         broker = self._create_broker(account.account_id, account.cash)
         return self._get_summary(account, broker)
 
     def _update_trade(self, broker, account: AccountModel, exit_cash: float):
-        updated_trades = list(
-            map(
-                lambda trade: trade.to_model(account_id=account.account_id),
-                broker.trades,
+        """
+        新しい建玉の追加と、変わった建玉の更新、口座の現金を1つのトランザクションで書き込む
+        読み込んでから変わっていない建玉は書き込まない
+        口座が他のリクエストに更新されていたらTransactWriteErrorになる
+        1トランザクションに入りきらない時は何も書かずにTooManyTradesにする
+        (建玉の多い口座は_load_broker()で先にまとめておく)
+        """
+        writes = self._trade_writes(broker, account.account_id, exit_cash)
+        if len(writes) > MAX_TRADE_WRITES:
+            raise TooManyTrades(
+                f"一度に更新する建玉が多すぎます({len(writes)}本)。"
+                f"{MAX_TRADE_WRITES}本以下になるように分けて注文してください"
             )
-        )
 
-        updated_trades += list(
-            map(
-                lambda trade: trade.to_model(
-                    account_id=account.account_id, exit_cash=exit_cash
-                ),
-                broker.closed_trades,
+        with transaction() as t:
+            for method, model, kwargs in writes:
+                getattr(t, method)(model, **kwargs)
+
+            position_size = broker.trades.size
+            position_cost = broker.trades.cost
+            t.update(
+                account,
+                actions=[
+                    AccountModel.cash.set(exit_cash),
+                    AccountModel.position_size.set(position_size),
+                    AccountModel.position_avg_price.set(
+                        position_cost / position_size if position_size else 0
+                    ),
+                    AccountModel.open_trades.set(len(broker.trades)),
+                ],
+            )
+            self._update_leaderboard(
+                t,
+                account.account_id,
+                cash=exit_cash,
+                position_size=position_size,
+                position_cost=position_cost,
             )
+        ranking_cache.invalidate()
+        account.cash = exit_cash
+
+    def _trade_writes(self, broker, account_id: str, exit_cash: float):
+        """
+        建玉の書き込みを (TransactWriteのメソッド名, モデル, 引数) のリストにする
+        """
+        writes = []
+        for trade in broker.trades:
+            writes += self._save_trade(trade, account_id)
+        for trade in broker.closed_trades:
+            writes += self._save_trade(trade, account_id, exit_cash)
+        for trade, merged in broker.merged_trades:
+            if not trade.is_new:
+                actions = [
+                    TradeModel.state.set("merged"),
+                    TradeModel.merged_into.set(merged.tag),
+                ]
+                condition = TradeModel.trade_id.exists()
+                writes.append(
+                    (
+                        "update",
+                        TradeModel(trade.tag),
+                        {"actions": actions, "condition": condition},
+                    )
+                )
+        return writes
+
+    def _save_trade(self, trade: HandonTrade, account_id: str, exit_cash=None):
+        if trade.is_new:
+            model = trade.to_model(account_id=account_id, exit_cash=exit_cash)
+            condition = TradeModel.trade_id.does_not_exist()
+            return [("save", model, {"condition": condition})]
+        if trade.is_dirty:
+            actions = trade.update_actions(exit_cash=exit_cash)
+            condition = TradeModel.trade_id.exists()
+            return [
+                (
+                    "update",
+                    TradeModel(trade.tag),
+                    {"actions": actions, "condition": condition},
+                )
+            ]
+        return []
+
+    @staticmethod
+    def _leaderboard_position(account: AccountModel):
+        """
+        口座の建玉のスナップショットをランキング用の行の値にする
+        (行がまだなくても建玉が0で作られないように、借金だけの更新でも一緒に書く)
+        """
+        if not account.has_position_snapshot:
+            return {}
+        size = account.position_size
+        return {
+            "position_size": size,
+            "position_cost": size * account.position_avg_price if size else 0,
+        }
+
+    def _update_leaderboard(self, t, account_id: str, **values):
+        """
+        ランキング用の行の更新をトランザクションに加える (行がなければ作られる)
+        :param values: LeaderboardModelの属性名と値
+        """
+        t.update(
+            LeaderboardModel(LEADERBOARD, account_id),
+            actions=[
+                getattr(LeaderboardModel, key).set(value)
+                for key, value in values.items()
+            ],
         )
 
-        with TradeModel.batch_write() as batch:
-            for trade in updated_trades:
-                batch.save(trade)
-        account.update(actions=[AccountModel.cash.set(exit_cash)])
+    def rebuild_leaderboard(self):
+        """
+        全口座の建玉を読み直してランキング用のテーブルを作り直す
+        全部書き終えたら印の行を置き、それまではテーブルをランキングに使わない
+        (デプロイ後に scripts/rebuild_leaderboard.py で1回実行する)
+        """
+        accounts = self.get_accounts()
+        book = BookValuation.load(accounts)
+        position_size = book.position_size()
+        position_cost = book.position_cost()
+        with LeaderboardModel.batch_write() as batch:
+            for i, account in enumerate(accounts):
+                batch.save(
+                    LeaderboardModel(
+                        LEADERBOARD,
+                        account.account_id,
+                        cash=account.cash,
+                        position_size=float(position_size[i]),
+                        position_cost=float(position_cost[i]),
+                        debt=account.debt,
+                        debt_date=account.debt_date,
+                    )
+                )
+        LeaderboardModel(LEADERBOARD_BUILT, LEADERBOARD).save()
+        ranking_cache.invalidate()
+
+    def leaderboard_built(self) -> bool:
+        try:
+            LeaderboardModel.get(LEADERBOARD_BUILT, LEADERBOARD)
+        except LeaderboardModel.DoesNotExist:
+            return False
+        return True
 
     def buy(self, account_id: str, size: Optional[float] = None):
         return self.order(account_id, "buy", size)
@@ -102,72 +339,91 @@ class HandonFxAPI:
     def sell(self, account_id: str, size: Optional[float] = None):
         return self.order(account_id, "sell", size)
 
-    def order(self, account_id: str, side: str, size: Optional[float] = None):
-        account = self.get_account_info(account_id)
-        broker = self._create_broker(account.account_id, account.cash)
-        strategy = HandonStrategy(data=self.data, broker=broker, params={})
-        strategy.init()
+    def _load_broker(self, account_id: str):
+        """
+        口座と建玉を読み込む
+        建玉が多くて注文を1トランザクションで書けなくなりそうなら、
+        先に古い建玉をまとめるだけのトランザクションを書いてから読み直す
+        (まとめても評価額・現金は変わらない)
+        :return: (口座, LiveBroker)
+        """
+        while True:
+            account = self.get_account_info(account_id)
+            broker = self._create_broker(
+                account.account_id, account.cash, account.open_trades
+            )
+            if len(broker.trades) <= MAX_OPEN_TRADES:
+                return account, broker
+            if broker.compact(max_lots=MAX_OPEN_TRADES) is None:
+                return account, broker
+            self._update_trade(broker, account, account.cash)
 
+    @retry_on_conflict
+    def order(self, account_id: str, side: str, size: Optional[float] = None):
+        account, broker = self._load_broker(account_id)
         before_summary = self._get_summary(account, broker)
 
         if side == "buy":
-            if size is None:
-                strategy.buy()
-            else:
-                strategy.buy(size=size)
+            broker.buy(size)
         else:
-            if size is None:
-                strategy.sell()
-            else:
-                strategy.sell(size=size)
-        broker.next()
+            broker.sell(size)
+
+        if self.compact_min_lots and len(broker.trades) >= self.compact_min_lots:
+            broker.compact()
 
         after_summary = self._get_summary(account, broker)
         self._update_trade(broker, account, after_summary["cash"])
 
         return {
-            "price": self.data.Close[-1],
+            "price": self.rate(),
             "before_summary": before_summary,
             "after_summary": after_summary,
         }
 
+    @retry_on_conflict
     def close_position(self, account_id: str):
-        account = self.get_account_info(account_id)
-        broker = self._create_broker(account.account_id, account.cash)
+        account, broker = self._load_broker(account_id)
         before_summary = self._get_summary(account, broker)
-        broker.close_trades(self.data.Close[-1])
+        broker.close_trades()
         after_summary = self._get_summary(account, broker)
         self._update_trade(broker, account, after_summary["cash"])
 
         return {
-            "price": self.data.Close[-1],
+            "price": self.rate(),
             "before_summary": before_summary,
             "after_summary": after_summary,
         }
 
     def get_equity(self, account: AccountModel):
+        summary = self._snapshot_summary(account)
+        if summary is not None:
+            return summary["equity"]
         broker = self._create_broker(account.account_id, account.cash)
         return broker.equity
 
-    def ranking(self):
+    def ranking(self, limit: Optional[int] = None, worst: bool = False):
         """
         評価額ランキングを取得する
+        :param limit: 上位何件まで返すか (Noneなら全口座)
+        :param worst: 評価額の低い順にする
         :return: 評価額ランキング
         """
-        accounts = self.get_accounts()
+        return ranking_cache.ranking(self._load_leaderboard, self.rate(), limit, worst)
 
-        ranking = []
-        for account in accounts:
-            broker = self._create_broker(account.account_id, account.cash)
-            ranking.append(
-                {
-                    "account_id": account.account_id,
-                    "equity": broker.equity - account.current_debt,
-                }
-            )
+    def _load_leaderboard(self):
+        # 作り直しが済むまでは、書き込んだ口座の行しかないので全口座を読む
+        if not self.leaderboard_built():
+            return BookValuation.load()
+        return BookValuation.from_leaderboard(LeaderboardModel.query(LEADERBOARD))
 
-        return sorted(ranking, key=lambda x: x["equity"], reverse=True)
+    def mark_to_market(self):
+        """
+        全口座の建玉を読み込んで、借金を引いた評価額をまとめて計算する
+        :return: account_idごとの評価額
+        """
+        return BookValuation.load().mark_to_market(self.rate())
 
+    @retry_on_conflict
     def request_debt(self, account_id: str, size: int):
         account = self.get_account_info(account_id)
 
@@ -179,14 +435,26 @@ class HandonFxAPI:
         new_debt_size = account.current_debt + size
         new_month_debt = account.this_month_debt + size
 
-        account.update(
-            actions=[
-                AccountModel.cash.set(new_cash),
-                AccountModel.debt.set(new_debt_size),
-                AccountModel.month_debt.set(new_month_debt),
-                AccountModel.debt_date.set(datetime.datetime.utcnow()),
-            ]
-        )
+        debt_date = datetime.datetime.utcnow()
+        with transaction() as t:
+            t.update(
+                account,
+                actions=[
+                    AccountModel.cash.set(new_cash),
+                    AccountModel.debt.set(new_debt_size),
+                    AccountModel.month_debt.set(new_month_debt),
+                    AccountModel.debt_date.set(debt_date),
+                ],
+            )
+            self._update_leaderboard(
+                t,
+                account_id,
+                cash=new_cash,
+                debt=new_debt_size,
+                debt_date=debt_date,
+                **self._leaderboard_position(account),
+            )
+        ranking_cache.invalidate()
 
         return {
             "cash": new_cash,
@@ -195,14 +463,18 @@ class HandonFxAPI:
             "month_limit": account.debt_limit,
         }
 
+    @retry_on_conflict
     def pay_debt(self, account_id: str, size: Optional[int] = None):
         account = self.get_account_info(account_id)
-        broker = self._create_broker(account.account_id, account.cash)
+        summary = self._snapshot_summary(account)
+        if summary is None:
+            broker = self._create_broker(account.account_id, account.cash)
+            summary = self._get_summary(account, broker)
 
         if size is None or size > account.current_debt:
             size = account.current_debt
 
-        if size > broker.margin_available:
+        if size > summary["margin_available"]:
             raise NotEnoughCash(f"余力が{size - account.cash}円足りません")
         if size > account.cash:
             raise NotEnoughCash(f"現金が{size - account.cash}円足りません。ポジションを決済してください")
@@ -214,14 +486,26 @@ class HandonFxAPI:
         if new_debt_size == 0:
             new_month_debt = 0
 
-        account.update(
-            actions=[
-                AccountModel.cash.set(new_cash),
-                AccountModel.debt.set(new_debt_size),
-                AccountModel.month_debt.set(new_month_debt),
-                AccountModel.debt_date.set(datetime.datetime.utcnow()),
-            ]
-        )
+        debt_date = datetime.datetime.utcnow()
+        with transaction() as t:
+            t.update(
+                account,
+                actions=[
+                    AccountModel.cash.set(new_cash),
+                    AccountModel.debt.set(new_debt_size),
+                    AccountModel.month_debt.set(new_month_debt),
+                    AccountModel.debt_date.set(debt_date),
+                ],
+            )
+            self._update_leaderboard(
+                t,
+                account_id,
+                cash=new_cash,
+                debt=new_debt_size,
+                debt_date=debt_date,
+                **self._leaderboard_position(account),
+            )
+        ranking_cache.invalidate()
 
         return {
             "cash": new_cash,
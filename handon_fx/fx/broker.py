@@ -37,12 +37,16 @@ class HandonBroker(_Broker):
 
     def _process_orders(self):
         data = self._data
-        open, high, low = data.Open[-1], data.High[-1], data.Low[-1]
-        prev_close = data.Close[-2]
+        open, high, low = (
+            data._current("Open"),
+            data._current("High"),
+            data._current("Low"),
+        )
+        prev_close = data._current("Close", -2)
         reprocess_orders = False
 
-        # Process orders
-        for order in list(self.orders):  # type: Order
+        # Process orders (only those this bar can trigger, in the book's order)
+        for order in self.orders.triggered(high, low):  # type: Order
 
             # Related SL/TP order was already removed
             if order not in self.orders:
@@ -60,6 +64,7 @@ class HandonBroker(_Broker):
                 # > When the stop price is reached, a stop order becomes a market/limit order.
                 # https://www.sec.gov/fast-answers/answersstopordhtm.html
                 order._replace(stop_price=None)
+                self.orders.reindex(order)
 
             # Determine purchase price.
             # Check if limit order can be filled.
@@ -239,12 +244,9 @@ class HandonBroker(_Broker):
                 // self._data.Close[-1]
                 // self.lot_unit
             ),
-            "position_size": self.position.size,
-            "position_avg_price": sum(
-                trade.entry_price * trade.size for trade in self.trades
-            )
-            / self.position.size
-            if self.position.size
+            "position_size": self.trades.size,
+            "position_avg_price": self.trades.cost / self.trades.size
+            if self.trades.size
             else 0,
             "rate": self._data.Close[-1],
         }
@@ -0,0 +1,62 @@
+import functools
+import os
+
+from pynamodb.connection import Connection
+from pynamodb.exceptions import TransactWriteError
+from pynamodb.transactions import TransactWrite
+
+COMMIT_RETRIES = 3
+# DynamoDBの1トランザクションに入れられる書き込みの数
+MAX_TRANSACTION_ITEMS = 100
+
+# 口座が他のリクエストに更新されていた場合に出る理由
+_CONFLICT_REASONS = ("ConditionalCheckFailed", "TransactionConflict")
+
+_connection = None
+
+
+def _get_connection():
+    global _connection
+    if _connection is None:
+        _connection = Connection(
+            region=os.getenv("REGION"), host=os.getenv("DYNAMODB_HOST")
+        )
+    return _connection
+
+
+def transaction() -> TransactWrite:
+    """
+    1回のTransactWriteItemsでまとめて書き込むトランザクションを作る
+    (1トランザクションMAX_TRANSACTION_ITEMS件まで)
+    """
+    return TransactWrite(connection=_get_connection())
+
+
+def is_conflict(error: TransactWriteError) -> bool:
+    reasons = getattr(error, "cancellation_reasons", None) or []
+    return any(
+        reason is not None and reason.code in _CONFLICT_REASONS for reason in reasons
+    )
+
+
+def retry_on_conflict(func):
+    """
+    書き込みの途中で口座が他のリクエストに更新されていたら、
+    読み込みからやり直す
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in range(COMMIT_RETRIES):
+            try:
+                return func(*args, **kwargs)
+            except TransactWriteError as e:
+                if not is_conflict(e) or attempt == COMMIT_RETRIES - 1:
+                    raise
+                print(
+                    "Commit conflict, retrying: {} ({}/{})".format(
+                        func.__name__, attempt + 1, COMMIT_RETRIES
+                    )
+                )
+
+    return wrapper
@@ -4,3 +4,11 @@ class NotEnoughCash(Exception):
     def __init__(self, message):
         self.message = message
         super().__init__(message)
+
+
+class TooManyTrades(Exception):
+    """Raised when an order would touch more trades than one transaction can write."""
+
+    def __init__(self, message):
+        self.message = message
+        super().__init__(message)
@@ -0,0 +1,150 @@
+import bisect
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# ヒストグラムのバケットの上限 (秒)
+LATENCY_BUCKETS = (
+    0.01,
+    0.02,
+    0.05,
+    0.1,
+    0.2,
+    0.3,
+    0.5,
+    0.75,
+    1.0,
+    1.5,
+    2.0,
+    3.0,
+    5.0,
+    10.0,
+    float("inf"),
+)
+
+
+class FetchTimeout(TimeoutError):
+    pass
+
+
+class LatencyHistogram:
+    """
+    取得元ごとの応答時間のヒストグラム (固定のバケットに数えるだけなので記録はO(log バケット数))
+    """
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(self.counts)
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def percentile(self, p: float) -> float:
+        """
+        :return: p%の応答がこれ以内に返ってきたバケットの上限 (記録がなければinf)
+        """
+        with self._lock:
+            total = sum(self.counts)
+            rank = total * p / 100
+            seen = 0
+            for bound, count in zip(self.buckets, self.counts):
+                seen += count
+                if count and seen >= rank:
+                    return bound
+        return float("inf")
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            res = {
+                f"<={bound}": count for bound, count in zip(self.buckets, self.counts)
+            }
+            res["errors"] = self.errors
+            return res
+
+
+class HedgedFetcher:
+    """
+    応答時間の上限つきでレートを取りに行く
+
+    まず1つ目の取得元に投げ、1つ目の取得元のp95の時間が過ぎても返ってこなければ
+    次の取得元 (なければ同じ取得元) にもう1回投げて、先に返ってきた方を使う。
+    `budget` 秒以内にどれも返ってこなければFetchTimeoutにする
+    (QuoteCacheが最後に取れたレートをstaleとして返す)。
+    """
+
+    def __init__(
+        self,
+        sources: List[Tuple[str, Callable]],
+        budget: float,
+        hedge_percentile: float = 95,
+        default_hedge_delay: float = 0.5,
+        min_samples: int = 20,
+        max_workers: int = 4,
+    ):
+        assert sources, "at least one source is required"
+        self.sources = sources
+        self.budget = budget
+        self.hedge_percentile = hedge_percentile
+        self.default_hedge_delay = default_hedge_delay
+        self.min_samples = min_samples
+        self.histograms = {name: LatencyHistogram() for name, _ in sources}
+        # 時間切れになったリクエストはそのまま裏で終わらせる
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def hedge_delay(self) -> float:
+        histogram = self.histograms[self.sources[0][0]]
+        if len(histogram) < self.min_samples:
+            return self.default_hedge_delay
+        return histogram.percentile(self.hedge_percentile)
+
+    def _timed(self, name: str, source: Callable):
+        start = time.perf_counter()
+        try:
+            res = source()
+        except Exception:
+            self.histograms[name].record_error()
+            raise
+        self.histograms[name].record(time.perf_counter() - start)
+        return res
+
+    def __call__(self):
+        deadline = time.perf_counter() + self.budget
+        pending = set()
+        error: Optional[Exception] = None
+
+        for i, delay in enumerate([0, self.hedge_delay()]):
+            name, source = self.sources[min(i, len(self.sources) - 1)]
+            pending.add(self._executor.submit(self._timed, name, source))
+
+            # 2本目を投げるまで (最後は時間切れまで) 待つ
+            wait_until = deadline if i == 1 else time.perf_counter() + delay
+            while pending:
+                timeout = min(wait_until, deadline) - time.perf_counter()
+                if timeout <= 0:
+                    break
+                done, pending = wait(pending, timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        return future.result()
+                    error = future.exception()
+                # 1本目が失敗したらすぐ2本目を投げる
+                if not pending and i == 0:
+                    break
+
+        if error is not None and not pending:
+            raise error
+        raise FetchTimeout(f"no quote within {self.budget}s")
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {name: h.snapshot() for name, h in self.histograms.items()}
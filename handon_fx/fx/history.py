@@ -0,0 +1,234 @@
+import os
+import tempfile
+import threading
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+# 1分足1本分のレコード (timeはUTCのunix秒)
+BAR_DTYPE = np.dtype(
+    [
+        ("time", "<i8"),
+        ("Open", "<f8"),
+        ("High", "<f8"),
+        ("Low", "<f8"),
+        ("Close", "<f8"),
+        ("Volume", "<f8"),
+    ]
+)
+MINUTE = 60
+DAY = 24 * 60 * 60
+
+Fetcher = Callable[[str, datetime, datetime], pd.DataFrame]
+
+
+def _to_seconds(t) -> int:
+    t = pd.Timestamp(t)
+    if t.tzinfo is None:
+        t = t.tz_localize("UTC")
+    return int(t.timestamp())
+
+
+def _day_of(seconds: int) -> str:
+    return datetime.fromtimestamp(seconds - seconds % DAY, timezone.utc).strftime(
+        "%Y-%m-%d"
+    )
+
+
+def _merge_intervals(intervals: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def frame_to_bars(df: pd.DataFrame) -> np.ndarray:
+    bars = np.empty(len(df), dtype=BAR_DTYPE)
+    index = pd.DatetimeIndex(df.index)
+    if index.tz is None:
+        index = index.tz_localize("UTC")
+    bars["time"] = index.asi8 // 10**9
+    for column in BAR_DTYPE.names[1:]:
+        bars[column] = df[column].to_numpy(dtype=float) if column in df else np.nan
+    return bars
+
+
+def bars_to_frame(bars: np.ndarray) -> pd.DataFrame:
+    return pd.DataFrame(
+        {column: bars[column] for column in BAR_DTYPE.names[1:]},
+        index=pd.DatetimeIndex(bars["time"].astype("datetime64[s]")).tz_localize("UTC"),
+    )
+
+
+def fetch_yahoo_history(symbol: str, start: datetime, end: datetime) -> pd.DataFrame:
+    # 失敗しても空のDataFrameを返されると、その区間を取得済みにしてしまうので例外にする
+    return yf.Ticker(symbol).history(
+        interval="1m", start=start, end=end, raise_errors=True
+    )
+
+
+class HistoryStore:
+    """
+    1分足の履歴を日ごと(UTC)の.npyファイルに貯めておくキャッシュ
+
+    `root/<symbol>/<YYYY-MM-DD>.npy` に足を、`<YYYY-MM-DD>.cover.npy` に取得済みの区間を置く。
+    要求された範囲のうち取得済みの区間に含まれない隙間だけを `fetcher` から取ってくる。
+    読み込みはmmapなので、1日に収まる範囲ならファイルのビューをそのまま返す。
+
+    取得済みにするのは `lag` 秒前より前に終わった足までで、作りかけ・未配信の足は次に取り直す。
+    """
+
+    def __init__(
+        self,
+        root: str,
+        fetcher: Fetcher = fetch_yahoo_history,
+        clock: Callable[[], float] = lambda: datetime.now(timezone.utc).timestamp(),
+        lag: float = 60,
+    ):
+        """
+        :param lag: 足が終わってから `fetcher` で取れるようになるまでの秒数
+        """
+        self.root = root
+        self.fetcher = fetcher
+        self._clock = clock
+        self.lag = lag
+        self._lock = threading.Lock()
+        self._maps: Dict[str, np.ndarray] = {}
+
+    def _path(self, symbol: str, day: str, kind: str = "") -> str:
+        return os.path.join(self.root, symbol, f"{day}{kind}.npy")
+
+    def _load(self, path: str, dtype, shape=(0,)) -> np.ndarray:
+        array = self._maps.get(path)
+        if array is None:
+            if not os.path.exists(path):
+                return np.empty(shape, dtype=dtype)
+            array = np.load(path, mmap_mode="r")
+            self._maps[path] = array
+        return array
+
+    def _save(self, path: str, array: np.ndarray):
+        # 読み込み中のmmapを壊さないように、別のファイルに書いてから置き換える
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".npy")
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp, path)
+        self._maps.pop(path, None)
+
+    def _days(self, start: int, end: int) -> List[str]:
+        return [_day_of(t) for t in range(start - start % DAY, end, DAY)]
+
+    def covered(self, symbol: str, day: str) -> List[Tuple[int, int]]:
+        cover = self._load(self._path(symbol, day, ".cover"), "<i8", (0, 2))
+        return [(int(start), int(end)) for start, end in cover]
+
+    def _settled(self) -> int:
+        """
+        足が確定している時刻 (`lag` 秒前を含む足の始まり。これより後の足はまだ変わりうる)
+        """
+        now = int(self._clock() - self.lag)
+        return now - now % MINUTE
+
+    def gaps(self, symbol: str, start, end) -> List[Tuple[int, int]]:
+        """
+        [start, end) のうち、まだ取得していない区間 (確定していない足の分は含まない)
+        """
+        start, end = _to_seconds(start), min(_to_seconds(end), self._settled())
+        covered = []
+        for day in self._days(start, end):
+            covered += self.covered(symbol, day)
+
+        gaps = []
+        for cover_start, cover_end in _merge_intervals(covered):
+            if cover_end <= start or end <= cover_start:
+                continue
+            if start < cover_start:
+                gaps.append((start, cover_start))
+            start = max(start, cover_end)
+        if start < end:
+            gaps.append((start, end))
+        return gaps
+
+    def _store(self, symbol: str, bars: np.ndarray, start: int, end: int):
+        for day in self._days(start, end):
+            day_start = _to_seconds(day)
+            day_end = day_start + DAY
+            new = bars[(day_start <= bars["time"]) & (bars["time"] < day_end)]
+
+            path = self._path(symbol, day)
+            merged = np.concatenate([np.asarray(self._load(path, BAR_DTYPE)), new])
+            # 同じ時刻の足は新しい方を残す
+            _, last = np.unique(merged["time"][::-1], return_index=True)
+            self._save(path, merged[len(merged) - 1 - last])
+
+            cover = self.covered(symbol, day)
+            cover.append((max(start, day_start), min(end, day_end)))
+            self._save(
+                self._path(symbol, day, ".cover"),
+                np.array(_merge_intervals(cover), dtype="<i8").reshape(-1, 2),
+            )
+
+    def fill(self, symbol: str, start, end) -> int:
+        """
+        [start, end) の隙間を取ってきて保存する
+        `fetcher` が例外を投げた隙間は取得済みにしない (例外はそのまま投げる)
+        :return: 取ってきた隙間の数
+        """
+        with self._lock:
+            gaps = self.gaps(symbol, start, end)
+            for gap_start, gap_end in gaps:
+                df = self.fetcher(
+                    symbol,
+                    datetime.fromtimestamp(gap_start, timezone.utc),
+                    datetime.fromtimestamp(gap_end, timezone.utc),
+                )
+                bars = frame_to_bars(df)
+                bars = bars[(gap_start <= bars["time"]) & (bars["time"] < gap_end)]
+                self._store(symbol, bars, gap_start, gap_end)
+            return len(gaps)
+
+    def bars(self, symbol: str, start, end) -> np.ndarray:
+        """
+        [start, end) の足 (取得済みのものだけ)
+        1日に収まる範囲ならmmapしたファイルのビューなのでコピーしない
+        """
+        start, end = _to_seconds(start), _to_seconds(end)
+        parts = []
+        for day in self._days(start, end):
+            day_bars = self._load(self._path(symbol, day), BAR_DTYPE)
+            times = day_bars["time"]
+            parts.append(
+                day_bars[np.searchsorted(times, start) : np.searchsorted(times, end)]
+            )
+        parts = [part for part in parts if len(part)]
+        if not parts:
+            return np.empty(0, dtype=BAR_DTYPE)
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts)
+
+    def history(self, symbol: str, start, end) -> pd.DataFrame:
+        self.fill(symbol, start, end)
+        return bars_to_frame(self.bars(symbol, start, end))
+
+
+_history_store: Optional[HistoryStore] = None
+
+
+def get_history_store() -> HistoryStore:
+    global _history_store
+    if _history_store is None:
+        _history_store = HistoryStore(
+            os.getenv(
+                "RATE_HISTORY_DIR",
+                os.path.join(tempfile.gettempdir(), "handon_fx", "history"),
+            )
+        )
+    return _history_store
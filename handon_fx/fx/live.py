@@ -0,0 +1,203 @@
+from datetime import datetime
+from math import copysign
+from typing import List, Optional, Tuple
+
+from backtesting import Strategy
+from backtesting.backtesting import _OutOfMoneyError, _TradeList
+from uuid6 import uuid7
+
+from .trade import HandonTrade
+
+
+class LiveBroker:
+    """
+    1つの価格で成行注文を約定させるだけのブローカー
+
+    約定価格・FIFOでの相殺・ロット単位の丸めはHandonBrokerと同じだが、
+    _Dataや資産推移の配列、注文キューは持たずにスカラー値と建玉のリストだけで処理する。
+    建玉はHandonTradeなので、そのままto_model()で保存できる。
+    """
+
+    def __init__(
+        self,
+        *,
+        price: float,
+        cash: float,
+        margin: float,
+        commission: float = 0,
+        lot_unit: int = 100000,
+    ):
+        assert 0 < cash, f"cash should be >0, is {cash}"
+        assert 0 < margin <= 1, f"margin should be between 0 and 1, is {margin}"
+        self.last_price = price
+        self._cash = cash
+        self._commission = commission
+        self._leverage = 1 / margin
+        self.lot_unit = lot_unit
+        self.trades = _TradeList()
+        self.closed_trades: List[HandonTrade] = []
+        # compact()でまとめられた (元の建玉, まとめた建玉)
+        self.merged_trades: List[Tuple[HandonTrade, HandonTrade]] = []
+
+    def __repr__(self):
+        return f"<LiveBroker: {self._cash:.0f} ({len(self.trades)} trades)>"
+
+    @staticmethod
+    def _now():
+        return int(datetime.now().timestamp())
+
+    def _adjusted_price(self, size, price=None) -> float:
+        return (price or self.last_price) * (1 + copysign(self._commission, size))
+
+    @property
+    def trades(self) -> _TradeList:
+        # 建玉の数量・建値の合計を持つリスト (代入されたリストも包み直す)
+        return self._trades
+
+    @trades.setter
+    def trades(self, trades):
+        self._trades = _TradeList(trades)
+
+    @property
+    def position_size(self) -> float:
+        return self._trades.size
+
+    @property
+    def equity(self) -> float:
+        if not self._trades:
+            return self._cash
+        return self._cash + self._trades.pl(self.last_price)
+
+    @property
+    def margin_available(self) -> float:
+        if not self._trades:
+            return max(0, self._cash)
+        margin_used = self._trades.exposure * self.last_price / self._leverage
+        return max(0, self.equity - margin_used)
+
+    def buy(self, size: Optional[float] = None):
+        return self.order(Strategy._FULL_EQUITY if size is None else size)
+
+    def sell(self, size: Optional[float] = None):
+        return self.order(-(Strategy._FULL_EQUITY if size is None else size))
+
+    def order(self, size: float):
+        """
+        成行注文を現在の価格で約定させる
+        :param size: 1未満なら余力に対する割合、1以上なら通貨の数量 (マイナスなら売り)
+        :return: 新しく建てた建玉 (反対の建玉の決済だけで終わった場合や、余力が足りない場合はNone)
+        """
+        assert (
+            0 < abs(size) < 1 or round(size) == size
+        ), "size must be a positive fraction of equity, or a positive whole number of units"
+        size = float(size)
+        price = self.last_price
+        adjusted_price = self._adjusted_price(size, price)
+
+        if -1 < size < 1:
+            size = copysign(
+                int(
+                    (self.margin_available * self._leverage * abs(size))
+                    // adjusted_price
+                ),
+                size,
+            )
+            size = (size // self.lot_unit) * self.lot_unit
+            if not size:
+                return None
+        need_size = int(size)
+        is_long = need_size > 0
+
+        # FIFOで反対向きの建玉から決済する
+        for trade in list(self.trades):
+            if trade.is_long == is_long:
+                continue
+            if abs(need_size) >= abs(trade.size):
+                self._close_trade(trade, price)
+                need_size += trade.size
+            else:
+                self._reduce_trade(trade, price, need_size)
+                need_size = 0
+            if not need_size:
+                break
+
+        trade = None
+        if (
+            need_size
+            and abs(need_size) * adjusted_price
+            <= self.margin_available * self._leverage
+        ):
+            trade = HandonTrade(self, need_size, adjusted_price, self._now(), None)
+            self.trades.append(trade)
+
+        self._check_equity()
+        return trade
+
+    def close_trades(self):
+        for trade in list(self.trades):
+            self._close_trade(trade, self.last_price)
+
+    def compact(self, max_lots: int = 90) -> Optional[HandonTrade]:
+        """
+        古い方から最大 `max_lots` 本の同じ向きの建玉を、平均建値の1本にまとめる
+        評価額・余力は変わらないが、一部決済した時の損益の実現の仕方は平均建値基準になる
+        :return: まとめた建玉 (まとめるものがなければNone)
+        """
+        lots = self.trades[:max_lots]
+        if len(lots) < 2 or len({trade.is_long for trade in lots}) != 1:
+            return None
+
+        size = sum(trade.size for trade in lots)
+        entry_price = sum(trade.size * trade.entry_price for trade in lots) / size
+        entry_bar = min(trade.entry_bar for trade in lots)
+        merged = HandonTrade(self, size, entry_price, entry_bar, str(uuid7()))
+
+        # 一番古い建玉の位置に置いてFIFOの順番を保つ
+        self.trades[: len(lots)] = [merged]
+        self.merged_trades += [(trade, merged) for trade in lots]
+        return merged
+
+    def _check_equity(self):
+        # _Broker.next()と同じく、評価額がなくなったら全部決済して止める
+        if self.equity <= 0:
+            for trade in list(self.trades):
+                self._close_trade(trade, self.last_price)
+            self._cash = 0
+            raise _OutOfMoneyError
+
+    def _reduce_trade(self, trade: HandonTrade, price: float, size: float):
+        size_left = trade.size + size
+        if not size_left:
+            close_trade = trade
+        else:
+            self.trades.resize(trade, size_left)
+            close_trade = trade._copy(size=-size, sl_order=None, tp_order=None)
+            self.trades.append(close_trade)
+        self._close_trade(close_trade, price)
+
+    def _close_trade(self, trade: HandonTrade, price: float):
+        self.trades.remove(trade)
+        self.closed_trades.append(
+            trade._replace(exit_price=price, exit_bar=self._now())
+        )
+        self._cash += trade.pl
+
+    def summary(self):
+        position_size = self.position_size
+        return {
+            "equity": self.equity,
+            "cash": self._cash,
+            "margin_available": self.margin_available,
+            "profit": self.equity - self._cash,
+            "lots_avaitable": int(
+                self.margin_available
+                * self._leverage
+                // self.last_price
+                // self.lot_unit
+            ),
+            "position_size": position_size,
+            "position_avg_price": self._trades.cost / position_size
+            if position_size
+            else 0,
+            "rate": self.last_price,
+        }
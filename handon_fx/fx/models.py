@@ -5,12 +5,13 @@ from pynamodb.attributes import (
     UnicodeAttribute,
     NumberAttribute,
     UTCDateTimeAttribute,
+    VersionAttribute,
 )
 from pynamodb.indexes import AllProjection
 from pynamodb.models import Model, GlobalSecondaryIndex
 import os
 
-from handon_fx.fx.utils import jst_same_month, jst_delta_days
+from handon_fx.fx.utils import jst_same_month, compound_debt
 
 
 class OrderModel(Model):
@@ -36,7 +37,7 @@ class TradeModel(Model):
     trade_id = UnicodeAttribute(hash_key=True)
 
     account_id = UnicodeAttribute()
-    state = UnicodeAttribute()  # open, done, canceled
+    state = UnicodeAttribute()  # open, done, canceled, merged
 
     instrument = UnicodeAttribute()  # JPY/USD
     size = NumberAttribute()  # マイナスなら買い
@@ -45,6 +46,7 @@ class TradeModel(Model):
     exit_price = NumberAttribute(null=True)  # ポジションの約定価格の価格
     exit_time = UTCDateTimeAttribute(null=True)  # ポジションの約定時間
     exit_cash = NumberAttribute(null=True)  # ポジションの約定時の残金
+    merged_into = UnicodeAttribute(null=True)  # まとめられた先のtrade_id (state=merged)
 
     account_state_index = AccountTradeIndex()
 
@@ -60,6 +62,16 @@ class AccountModel(Model):
     debt = NumberAttribute(default=0)  # 借金
     month_debt = NumberAttribute(default=0)  # 今月の借金額(上限100万)
     debt_date = UTCDateTimeAttribute(null=True)  # 最後に借金した日時
+    version = VersionAttribute()  # 同時に更新されたことを検出する用
+
+    # 建玉のスナップショット (約定・決済のたびに更新する。古い口座にはない)
+    position_size = NumberAttribute(null=True)  # 建玉の合計(マイナスなら売り)
+    position_avg_price = NumberAttribute(null=True)  # 平均建玉価格
+    open_trades = NumberAttribute(null=True)  # 未決済の建玉の本数
+
+    @property
+    def has_position_snapshot(self):
+        return self.open_trades is not None
 
     @property
     def this_month_debt(self):
@@ -84,7 +96,28 @@ class AccountModel(Model):
         :param account: アカウント
         :return: 借金
         """
-        if not self.debt_date:
-            return int(self.debt)
-        else:
-            return int(self.debt * (1.01 ** jst_delta_days(self.debt_date)))
+        return compound_debt(self.debt, self.debt_date)
+
+
+class LeaderboardModel(Model):
+    """
+    ランキング用に口座ごとの現金・建玉・借金を持っておくテーブル
+    評価額は現在のレートで cash + position_size * rate - position_cost - 借金 になる
+    """
+
+    class Meta:
+        table_name = os.getenv("LEADERBOARD_TABLE")
+        host = os.getenv("DYNAMODB_HOST")
+        region = os.getenv("REGION")
+
+    board = UnicodeAttribute(hash_key=True)  # equity
+    account_id = UnicodeAttribute(range_key=True)
+    cash = NumberAttribute(default=0)  # 現金
+    position_size = NumberAttribute(default=0)  # 建玉の合計(マイナスなら売り)
+    position_cost = NumberAttribute(default=0)  # 建玉のsize * entry_priceの合計
+    debt = NumberAttribute(default=0)  # 借金
+    debt_date = UTCDateTimeAttribute(null=True)  # 最後に借金した日時
+
+    @property
+    def current_debt(self):
+        return compound_debt(self.debt, self.debt_date)
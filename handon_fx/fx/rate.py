@@ -1,22 +1,239 @@
-import yfinance as yf
-import pandas_datareader as web
+import functools
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, NamedTuple, Optional, Union
+
+from pandas_datareader.yahoo.quotes import YahooQuotesReader
 
 import pandas as pd
 from datetime import datetime
 
+from .hedge import HedgedFetcher
+from .history import get_history_store
 
-def get_current_rate():
-    rate = web.get_quote_yahoo("JPY=X")[
-        ["shortName", "price", "regularMarketTime", "bid", "ask"]
-    ].iloc[0]
 
+class Quote(NamedTuple):
+    name: str
+    price: float
+    bid: float
+    ask: float
+    time: datetime
+    stale: bool = False  # 取得に失敗して前回のレートを返した時True
+
+
+# ペア名 (handon_fx.chat.utils.PAIRS_TEXTSのキー) とYahooのシンボル
+PAIR_SYMBOLS = {
+    "USDJPY": "JPY=X",
+    "EURJPY": "EURJPY=X",
+    "AUDJPY": "AUDJPY=X",
+    "BGPJPY": "GBPJPY=X",
+    "EURUSD": "EURUSD=X",
+    "AUDUSD": "AUDUSD=X",
+    "BGPUSD": "GBPUSD=X",
+    "BTCUSD": "BTC-USD",
+}
+DEFAULT_PAIR = "USDJPY"
+
+
+class BatchYahooQuotesReader(YahooQuotesReader):
+    """
+    全シンボルを1回のリクエストで取得する
+    (pandas_datareaderのYahooQuotesReaderはシンボルごとにリクエストする)
+    """
+
+    def __init__(
+        self, symbols, host: str = "query1.finance.yahoo.com", timeout=30, **kwargs
+    ):
+        super().__init__(symbols, **kwargs)
+        self.host = host
+        self.timeout = timeout
+
+    @property
+    def url(self):
+        return f"https://{self.host}/v7/finance/quote"
+
+    def read(self):
+        symbols = [self.symbols] if isinstance(self.symbols, str) else self.symbols
+        return self._read_one_data(self.url, self.params(",".join(symbols)))
+
+    def _read_lines(self, out):
+        results = json.loads(out.read())["quoteResponse"]["result"]
+        df = pd.DataFrame(results).set_index("symbol")
+        df["price"] = df["regularMarketPrice"]
+        return df
+
+
+def fetch_yahoo_quotes(symbols: Iterable[str], **kwargs) -> Dict[str, Quote]:
+    """
+    :param kwargs: BatchYahooQuotesReaderに渡す (host, timeout)
+    :return: シンボルごとのレート (Yahooが返さなかったシンボルは入らない)
+    """
+    rates = BatchYahooQuotesReader(list(symbols), **kwargs).read()
+    return {
+        symbol: Quote(
+            name=rate["shortName"],
+            price=rate["price"],
+            bid=rate["bid"],
+            ask=rate["ask"],
+            time=datetime.fromtimestamp(rate["regularMarketTime"]),
+        )
+        for symbol, rate in rates.iterrows()
+    }
+
+
+def fetch_yahoo_quote(symbol: str = "JPY=X") -> Quote:
+    return fetch_yahoo_quotes([symbol])[symbol]
+
+
+def fetch_pair_quotes(**kwargs) -> Dict[str, Quote]:
+    """
+    PAIR_SYMBOLSの全ペアのレートを1回のリクエストで取得する
+    :param kwargs: BatchYahooQuotesReaderに渡す (host, timeout)
+    :return: ペアごとのレート
+    """
+    quotes = fetch_yahoo_quotes(PAIR_SYMBOLS.values(), **kwargs)
+    return {
+        pair: quotes[symbol]
+        for pair, symbol in PAIR_SYMBOLS.items()
+        if symbol in quotes
+    }
+
+
+class QuoteCache:
+    """
+    プロセス全体で共有するレートのキャッシュ
+
+    `ttl` 秒以内のレートはそのまま返し、それを過ぎたら `source` から取り直す。
+    取り直しに失敗した場合は `max_staleness` 秒以内であれば古いレートを返す。
+    Lambdaのコンテナが温まっている間はモジュールごと生き残るので、
+    連続したメンションで同じレートを使い回せる。
+    """
+
+    def __init__(
+        self,
+        source: Callable[[], Quote],
+        ttl: float,
+        max_staleness: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.source = source
+        self.ttl = ttl
+        self.max_staleness = max(ttl, max_staleness)
+        self._clock = clock
+        self._quote: Optional[Quote] = None
+        self._fetched_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _age(self):
+        if self._fetched_at is None:
+            return float("inf")
+        return self._clock() - self._fetched_at
+
+    def get(self) -> Quote:
+        if self._age() < self.ttl:
+            return self._quote
+
+        # 同時に期限切れを見つけたスレッドが全員取りに行かないようにする
+        with self._lock:
+            if self._age() < self.ttl:
+                return self._quote
+            try:
+                quote = self.source()
+            except Exception as ex:
+                if self._age() <= self.max_staleness:
+                    print("Failed to fetch quote, serving stale: {}".format(ex))
+                    return _mark_stale(self._quote)
+                raise
+            self._quote = quote
+            self._fetched_at = self._clock()
+            return quote
+
+    def invalidate(self):
+        with self._lock:
+            self._quote = None
+            self._fetched_at = None
+
+
+def _mark_stale(quotes: Union[Quote, Dict[str, Quote]]):
+    if isinstance(quotes, Quote):
+        return quotes._replace(stale=True)
+    return {pair: quote._replace(stale=True) for pair, quote in quotes.items()}
+
+
+def _as_pairs(quotes: Union[Quote, Dict[str, Quote]]) -> Dict[str, Quote]:
+    if isinstance(quotes, Quote):
+        return {DEFAULT_PAIR: quotes}
+    return quotes
+
+
+RATE_FETCH_BUDGET = float(os.getenv("RATE_FETCH_BUDGET", "3"))
+
+# query1が遅ければquery2にも投げる
+hedged_fetcher = HedgedFetcher(
+    sources=[
+        (
+            "query1",
+            functools.partial(
+                fetch_pair_quotes,
+                host="query1.finance.yahoo.com",
+                timeout=RATE_FETCH_BUDGET,
+            ),
+        ),
+        (
+            "query2",
+            functools.partial(
+                fetch_pair_quotes,
+                host="query2.finance.yahoo.com",
+                timeout=RATE_FETCH_BUDGET,
+            ),
+        ),
+    ],
+    budget=RATE_FETCH_BUDGET,
+)
+
+_quote_cache = QuoteCache(
+    source=hedged_fetcher,
+    ttl=float(os.getenv("RATE_CACHE_TTL", "5")),
+    max_staleness=float(os.getenv("RATE_CACHE_MAX_STALENESS", "60")),
+)
+
+
+def set_quote_source(
+    source: Callable[[], Union[Quote, Dict[str, Quote]]],
+    ttl: Optional[float] = None,
+    max_staleness: Optional[float] = None,
+):
+    """
+    レートの取得元を差し替える (テストやベンチマークで偽のフィードを使う用)
+    :param source: ペアごとのレートのdictか、USDJPYだけのQuoteを返す関数
+    """
+    if ttl is not None:
+        _quote_cache.ttl = ttl
+    if max_staleness is not None:
+        _quote_cache.max_staleness = max(_quote_cache.ttl, max_staleness)
+    _quote_cache.source = source
+    _quote_cache.invalidate()
+
+
+def get_current_quotes() -> Dict[str, Quote]:
+    """
+    全ペアの最新のレート (キャッシュが切れていたら全ペアまとめて取り直す)
+    """
+    return _as_pairs(_quote_cache.get())
+
+
+def get_current_quote(pair: str = DEFAULT_PAIR) -> Quote:
+    return get_current_quotes()[pair]
+
+
+def quote_to_frame(quote: Quote):
     columns = ["Name", "Side", "Open", "High", "Low", "Close"]
-    # spread = rate['ask'] - rate['bid']
-    name = rate["shortName"]
-    bid = rate["bid"]
-    ask = rate["ask"]
-    price = rate["price"]
-    ts = datetime.fromtimestamp(rate["regularMarketTime"])
+    # spread = quote.ask - quote.bid
+    name = quote.name
+    price = quote.price
+    ts = quote.time
 
     return pd.DataFrame(
         data=[
@@ -28,6 +245,12 @@ def get_current_rate():
     )
 
 
-def get_history_rate(start, end):
-    usd_jpy = yf.Ticker("USDJPY=X")
-    return usd_jpy.history(period="1d", interval="1m", start=start, end=end)
+def get_current_rate():
+    return quote_to_frame(get_current_quote())
+
+
+def get_history_rate(start, end, symbol: str = "USDJPY=X"):
+    """
+    1分足の履歴 (取得済みの分はローカルのHistoryStoreから読む。indexはUTC)
+    """
+    return get_history_store().history(symbol, start, end)
@@ -15,51 +15,72 @@ class HandonTrade(Trade):
     Find active trades in `Strategy.trades` and closed, settled trades in `Strategy.closed_trades`.
     """
 
+    __slots__ = ("_persisted", "_dirty")
+
+    # DBに保存する項目 (これ以外の変更は保存しなくてよい)
+    PERSISTED_FIELDS = ("size", "exit_price", "exit_bar")
+
     def __init__(
         self, broker: _Broker, size: int, entry_price: float, entry_bar, trade_id
     ):
         super().__init__(broker, size, entry_price, entry_bar, trade_id)
-
-    def _get(self, k):
-        return getattr(self, f"_Trade{k}")
+        self._persisted = False  # from_model()で読み込んだものならTrue
+        self._dirty = set()  # 読み込んでから変わった項目
 
     def _replace(self, **kwargs):
         for k, v in kwargs.items():
-            setattr(self, f"_Trade__{k}", v)
+            setattr(self, "_Trade__" + k, v)
+            if k in self.PERSISTED_FIELDS:
+                self._dirty.add(k)
         return self
 
-    def _copy(self, **kwargs):
-        copied = super()._copy(**kwargs)
-        copied._replace(tag=str(uuid7()))  # DBのIDを新規にする
+    def __copy__(self):
+        copied = super().__copy__()
+        copied._persisted = self._persisted
+        copied._dirty = self._dirty
+        return copied
 
+    def _copy(self, **kwargs):
+        # DBのIDを新規にする (新しい建玉なので変わった項目は記録しない)
+        copied = Trade._replace(self.__copy__(), tag=str(uuid7()), **kwargs)
+        copied._persisted = False
+        copied._dirty = set()
         return copied
 
+    @property
+    def is_new(self) -> bool:
+        """まだDBにない建玉ならTrue"""
+        return not self._persisted
+
+    @property
+    def is_dirty(self) -> bool:
+        """DBから読み込んでから保存する項目が変わっていればTrue"""
+        return self._persisted and bool(self._dirty)
+
     def __repr__(self):
-        entry_bar = datetime.datetime.fromtimestamp(
-            self._get("__entry_bar")
-        ).isoformat()
+        entry_bar = datetime.datetime.fromtimestamp(self.entry_bar).isoformat()
         exit_bar = (
-            datetime.datetime.fromtimestamp(self._get("__exit_bar")).isoformat()
-            if self._get("__exit_bar") is not None
+            datetime.datetime.fromtimestamp(self.exit_bar).isoformat()
+            if self.exit_bar is not None
             else ""
         )
         return (
-            f'<Trade size={self._get("__size")} time={entry_bar}-{exit_bar or ""} '
-            f'price={self._get("__entry_price")}-{self._get("__exit_price") or ""} pl={self.pl:.0f}'
-            f'{" tag="+str(self._get("__tag")) if self._get("__tag") is not None else ""}>'
+            f'<Trade size={self.size} time={entry_bar}-{exit_bar or ""} '
+            f'price={self.entry_price}-{self.exit_price or ""} pl={self.pl:.0f}'
+            f'{" tag="+str(self.tag) if self.tag is not None else ""}>'
         )
 
     @property
     def entry_time(self) -> Union[pd.Timestamp, int]:
         """Datetime of when the trade was entered."""
-        return datetime.datetime.fromtimestamp(self._get("__entry_bar"))
+        return datetime.datetime.fromtimestamp(self.entry_bar)
 
     @property
     def exit_time(self) -> Optional[Union[pd.Timestamp, int]]:
         """Datetime of when the trade was exited."""
-        if self.__exit_bar is None:
+        if self.exit_bar is None:
             return None
-        return datetime.datetime.fromtimestamp(self._get("__exit_bar"))
+        return datetime.datetime.fromtimestamp(self.exit_bar)
 
     def to_model(
         self,
@@ -67,29 +88,56 @@ class HandonTrade(Trade):
         instrument: str = "JPY/USD",
         exit_cash: Optional[float] = None,
     ):
-        state = "open" if self._get("__exit_price") is None else "done"
-        exit_price = self._get("__exit_price")
-        exit_bar = self._get("__exit_bar")
+        state = "open" if self.exit_price is None else "done"
+        exit_price = self.exit_price
+        exit_bar = self.exit_bar
         if exit_bar is not None:
             exit_bar = datetime.datetime.fromtimestamp(exit_bar)
 
         return TradeModel(
-            trade_id=self._get("__tag") or str(uuid7()),
+            trade_id=self.tag or str(uuid7()),
             account_id=account_id,
             state=state,
             instrument=instrument,
-            size=self._get("__size"),
-            entry_price=self._get("__entry_price"),
-            entry_time=datetime.datetime.fromtimestamp(self._get("__entry_bar")),
+            size=self.size,
+            entry_price=self.entry_price,
+            entry_time=datetime.datetime.fromtimestamp(self.entry_bar),
             exit_price=exit_price,
             exit_time=exit_bar,
             exit_cash=exit_cash,
         )
 
+    def update_actions(self, exit_cash: Optional[float] = None):
+        """
+        読み込んでから変わった項目だけを書き換えるアクション
+        """
+        actions = []
+        if "size" in self._dirty:
+            actions.append(TradeModel.size.set(self.size))
+        if "exit_price" in self._dirty:
+            exit_price = self.exit_price
+            if exit_price is None:
+                actions.append(TradeModel.exit_price.remove())
+                actions.append(TradeModel.state.set("open"))
+            else:
+                actions.append(TradeModel.exit_price.set(exit_price))
+                actions.append(TradeModel.state.set("done"))
+        if "exit_bar" in self._dirty:
+            exit_bar = self.exit_bar
+            if exit_bar is None:
+                actions.append(TradeModel.exit_time.remove())
+            else:
+                actions.append(
+                    TradeModel.exit_time.set(datetime.datetime.fromtimestamp(exit_bar))
+                )
+        if exit_cash is not None:
+            actions.append(TradeModel.exit_cash.set(exit_cash))
+        return actions
+
     @staticmethod
     def from_model(broker, model: TradeModel):
         entry_time = int(model.entry_time.timestamp())
-        exit_time = model.exit_price
+        exit_time = model.exit_time
         if exit_time is not None:
             exit_time = int(exit_time.timestamp())
         trade = HandonTrade(
@@ -103,4 +151,6 @@ class HandonTrade(Trade):
             exit_bar=exit_time,
             exit_price=model.exit_price,
         )
+        trade._persisted = True
+        trade._dirty.clear()
         return trade
@@ -28,3 +28,12 @@ def jst_delta_days(utc_date: datetime.datetime, utc_now: datetime.datetime = Non
         jst_now.replace(hour=0, minute=0, second=0, microsecond=0)
         - jst_utc_date.replace(hour=0, minute=0, second=0, microsecond=0)
     ).days
+
+
+def compound_debt(debt, debt_date: datetime.datetime = None):
+    """
+    複利込みの借金額を計算する (1日1%)
+    """
+    if not debt_date:
+        return int(debt)
+    return int(debt * (1.01 ** jst_delta_days(debt_date)))
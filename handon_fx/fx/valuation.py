@@ -0,0 +1,247 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+import numpy as np
+
+from .models import AccountModel, TradeModel
+
+
+def top_k(values: np.ndarray, k: int) -> np.ndarray:
+    """
+    値の大きい順にk個のindex (np.argsort(-values, kind="stable")[:k] と同じ並び)
+    全部は並べずに、np.partitionでk番目の値を求めてそれ以上のものだけを並べる
+    """
+    if k >= len(values):
+        return np.argsort(-values, kind="stable")
+    threshold = np.partition(-values, k - 1)[k - 1]
+    candidates = np.flatnonzero(-values <= threshold)
+    return candidates[np.argsort(-values[candidates], kind="stable")][:k]
+
+
+def bottom_k(values: np.ndarray, k: int) -> np.ndarray:
+    """
+    値の小さい順にk個のindex (top_k(values, len(values))[::-1][:k] と同じ並び)
+    """
+    if k >= len(values):
+        return np.argsort(-values, kind="stable")[::-1]
+    threshold = np.partition(values, k - 1)[k - 1]
+    candidates = np.flatnonzero(values <= threshold)
+    # 同じ値なら後ろのものが先 (全体を並べて逆順にした時と同じ)
+    return candidates[np.lexsort((-candidates, values[candidates]))][:k]
+
+
+class BookValuation:
+    """
+    全口座の建玉を列指向で持って、評価額をまとめて計算する
+
+    建玉は (口座のindex, size, entry_price) の配列で持ち、
+    評価損益は口座ごとに np.bincount で一度に集計する。
+    """
+
+    def __init__(
+        self,
+        account_ids: List[str],
+        cash: Iterable[float],
+        debt: Iterable[float],
+        trade_account: Iterable[int],
+        size: Iterable[float],
+        entry_price: Iterable[float],
+    ):
+        self.account_ids = list(account_ids)
+        self.cash = np.asarray(cash, dtype=float)
+        self.debt = np.asarray(debt, dtype=float)
+        self.trade_account = np.asarray(trade_account, dtype=np.intp)
+        self.size = np.asarray(size, dtype=float)
+        self.entry_price = np.asarray(entry_price, dtype=float)
+
+    @classmethod
+    def from_models(cls, accounts, trades) -> "BookValuation":
+        """
+        口座の一覧と建玉の一覧から作る
+        口座が見つからない建玉は無視する
+        :param accounts: account_id, cash, current_debtを持つもの (AccountModel, LeaderboardModel)
+        :param trades: account_id, size, entry_priceを持つもの (TradeModel)
+        """
+        accounts = list(accounts)
+        index = {account.account_id: i for i, account in enumerate(accounts)}
+
+        trade_account, size, entry_price = [], [], []
+        for trade in trades:
+            i = index.get(trade.account_id)
+            if i is None:
+                continue
+            trade_account.append(i)
+            size.append(trade.size)
+            entry_price.append(trade.entry_price)
+
+        return cls(
+            account_ids=[account.account_id for account in accounts],
+            cash=[account.cash for account in accounts],
+            debt=[account.current_debt for account in accounts],
+            trade_account=trade_account,
+            size=size,
+            entry_price=entry_price,
+        )
+
+    @classmethod
+    def from_leaderboard(cls, rows) -> "BookValuation":
+        """
+        ランキング用の行から作る
+        各口座の建玉は平均建値の1本にまとめたものとして扱う
+        """
+        rows = list(rows)
+        held = [i for i, row in enumerate(rows) if row.position_size]
+        return cls(
+            account_ids=[row.account_id for row in rows],
+            cash=[row.cash for row in rows],
+            debt=[row.current_debt for row in rows],
+            trade_account=held,
+            size=[rows[i].position_size for i in held],
+            entry_price=[rows[i].position_cost / rows[i].position_size for i in held],
+        )
+
+    @classmethod
+    def load(cls, accounts: Optional[list] = None) -> "BookValuation":
+        """
+        全口座と全ての未決済の建玉をまとめて読み込む
+        """
+        if accounts is None:
+            accounts = AccountModel.scan()
+        return cls.from_models(accounts, TradeModel.scan(TradeModel.state == "open"))
+
+    def position_size(self) -> np.ndarray:
+        return np.bincount(
+            self.trade_account, weights=self.size, minlength=len(self.account_ids)
+        )
+
+    def position_cost(self) -> np.ndarray:
+        return np.bincount(
+            self.trade_account,
+            weights=self.size * self.entry_price,
+            minlength=len(self.account_ids),
+        )
+
+    def equity(self, rate: float) -> np.ndarray:
+        """
+        口座ごとの評価額 (現金 + 評価損益)
+        """
+        pl = np.bincount(
+            self.trade_account,
+            weights=self.size * (rate - self.entry_price),
+            minlength=len(self.account_ids),
+        )
+        return self.cash + pl
+
+    def net_equity(self, rate: float) -> np.ndarray:
+        """
+        口座ごとの評価額から借金を引いたもの
+        """
+        return self.equity(rate) - self.debt
+
+    def mark_to_market(self, rate: float) -> Dict[str, float]:
+        return dict(zip(self.account_ids, self.net_equity(rate).tolist()))
+
+    def ranking(self, rate: float):
+        """
+        借金を引いた評価額の高い順に並べる
+        """
+        equity = self.net_equity(rate)
+        order = np.argsort(-equity, kind="stable")
+        return [
+            {"account_id": self.account_ids[i], "equity": float(equity[i])}
+            for i in order
+        ]
+
+    def top(self, rate: float, k: int, worst: bool = False):
+        """
+        ranking(rate)の上位k件 (worstならranking(rate)[::-1]の上位k件)
+        """
+        equity = self.net_equity(rate)
+        order = bottom_k(equity, k) if worst else top_k(equity, k)
+        return [
+            {"account_id": self.account_ids[i], "equity": float(equity[i])}
+            for i in order
+        ]
+
+
+class _RankedBook(NamedTuple):
+    equity: np.ndarray
+    top: np.ndarray
+    bottom: np.ndarray
+
+
+class RankingCache:
+    """
+    ランキングを (レートのバケット, データのバージョン) ごとに覚えておく
+
+    口座・建玉・借金を書き込んだらinvalidate()でバージョンを上げて読み直させる。
+    他のコンテナでの書き込みは分からないので、読み込んだ口座は `ttl` 秒で捨てる。
+    上位・下位は同じ評価額の配列からtop_k/bottom_kで取り出す。
+    """
+
+    def __init__(
+        self,
+        rate_bucket: float = 0.001,
+        ttl: float = 30,
+        max_entries: int = 16,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.rate_bucket = rate_bucket
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version = 0
+        self._clock = clock
+        self._book: Optional[BookValuation] = None
+        self._loaded_at = 0.0
+        self._entries: "OrderedDict[tuple, _RankedBook]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._book = None
+            self._entries.clear()
+
+    def _get_book(self, load: Callable[[], BookValuation]) -> BookValuation:
+        if self._book is None or self._clock() - self._loaded_at >= self.ttl:
+            self._book = load()
+            self._loaded_at = self._clock()
+            self._entries.clear()
+        return self._book
+
+    def ranking(
+        self,
+        load: Callable[[], BookValuation],
+        rate: float,
+        limit: Optional[int] = None,
+        worst: bool = False,
+    ):
+        """
+        :param load: 口座が読み込まれていない・古い時に呼ぶ
+        :param limit: 上位何件まで返すか (Noneなら全部)
+        :param worst: 下から並べる
+        """
+        bucket = round(rate / self.rate_bucket)
+        with self._lock:
+            book = self._get_book(load)
+            n = len(book.account_ids)
+            k = n if limit is None else min(limit, n)
+
+            key = (bucket, self.version)
+            ranked = self._entries.get(key)
+            if ranked is None or len(ranked.top) < k:
+                equity = book.net_equity(rate)
+                ranked = _RankedBook(equity, top_k(equity, k), bottom_k(equity, k))
+                self._entries[key] = ranked
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(key)
+
+        order = ranked.bottom if worst else ranked.top
+        return [
+            {"account_id": book.account_ids[i], "equity": float(ranked.equity[i])}
+            for i in order[:k]
+        ]
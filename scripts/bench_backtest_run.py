@@ -0,0 +1,78 @@
+"""
+Backtest.runの1秒あたりの足の数を、ブローカーが毎回_Dataのビューを作って値を読んでいた以前の経路と
+_Data._current()で直接読む経路とで比べる
+
+    python scripts/bench_backtest_run.py [足の本数]
+"""
+import sys
+import time
+import warnings
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+import backtesting.backtesting
+from backtesting import Backtest, Strategy
+from backtesting._util import _Data
+from backtesting.lib import crossover
+from backtesting.test import SMA
+
+
+class ViewData(_Data):
+    """
+    以前の経路: 値を読むたびにその足までのビューを作る
+    """
+
+    def _current(self, key, i=-1):
+        return self[key][i]
+
+
+class SmaCross(Strategy):
+    def init(self):
+        self.sma1 = self.I(SMA, self.data.Close, 10)
+        self.sma2 = self.I(SMA, self.data.Close, 30)
+
+    def next(self):
+        if crossover(self.sma1, self.sma2):
+            self.position.close()
+            self.buy()
+        elif crossover(self.sma2, self.sma1):
+            self.position.close()
+            self.sell()
+
+
+def minute_bars(n):
+    random = np.random.default_rng(0)
+    close = 130 + np.cumsum(random.normal(0, 0.01, n))
+    return pd.DataFrame(
+        {
+            "Open": close,
+            "High": close + 0.01,
+            "Low": close - 0.01,
+            "Close": close,
+            "Volume": 1.0,
+        },
+        index=pd.date_range("2021-01-01", periods=n, freq="1min"),
+    )
+
+
+def bench(df, data_class):
+    bt = Backtest(df, SmaCross, cash=100_0000)
+    with mock.patch.object(backtesting.backtesting, "_Data", data_class):
+        start = time.perf_counter()
+        stats = bt.run()
+        return time.perf_counter() - start, stats
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    warnings.simplefilter("ignore")
+    df = minute_bars(n)
+
+    results = {}
+    for name, data_class in [("view", ViewData), ("cursor", _Data)]:
+        elapsed, stats = bench(df, data_class)
+        results[name] = stats
+        print("{:8s} {:10.0f} bars/s".format(name, n / elapsed))
+    assert results["view"]["Equity Final [$]"] == results["cursor"]["Equity Final [$]"]
@@ -0,0 +1,83 @@
+"""
+1回の注文にかかるCPU時間を、HandonBrokerを使う以前の経路とLiveBrokerとで比べる
+
+    python scripts/bench_live_broker.py [未決済の建玉の本数]
+"""
+import datetime
+import sys
+import time
+
+from backtesting._util import _Data as Data
+from handon_fx.fx.broker import HandonBroker
+from handon_fx.fx.live import LiveBroker
+from handon_fx.fx.models import TradeModel
+from handon_fx.fx.rate import Quote, quote_to_frame
+from handon_fx.fx.strategy import HandonStrategy
+from handon_fx.fx.trade import HandonTrade
+
+QUOTE = Quote("USD/JPY", 130.0, 130.0, 130.0, datetime.datetime(2023, 1, 4))
+
+
+def open_trades(n):
+    return [
+        TradeModel(
+            trade_id=str(i),
+            account_id="bench@handon.club",
+            state="open",
+            instrument="JPY/USD",
+            size=10000,
+            entry_price=129.0 + i % 10 / 10,
+            entry_time=datetime.datetime(2023, 1, 4),
+        )
+        for i in range(n)
+    ]
+
+
+def handon_broker_order(models):
+    data = Data(quote_to_frame(QUOTE))
+    broker = HandonBroker(
+        data=data,
+        cash=100_0000,
+        commission=0,
+        margin=1.0 / 20.0,
+        trade_on_close=False,
+        hedging=False,
+        exclusive_orders=False,
+        index=data.index,
+        lot_unit=10000,
+    )
+    broker.trades = [HandonTrade.from_model(broker, model) for model in models]
+    strategy = HandonStrategy(data=data, broker=broker, params={})
+    strategy.init()
+    strategy.sell(size=15000)
+    broker.next()
+    return broker.summary()
+
+
+def live_broker_order(models):
+    broker = LiveBroker(
+        price=QUOTE.price, cash=100_0000, margin=1.0 / 20.0, lot_unit=10000
+    )
+    broker.trades = [HandonTrade.from_model(broker, model) for model in models]
+    broker.sell(15000)
+    return broker.summary()
+
+
+def bench(func, models, repeat):
+    start = time.process_time()
+    for _ in range(repeat):
+        func(models)
+    return (time.process_time() - start) / repeat
+
+
+def main(n_trades):
+    models = open_trades(n_trades)
+    repeat = 2000
+    before = bench(handon_broker_order, models, repeat)
+    after = bench(live_broker_order, models, repeat)
+    print(f"open trades: {n_trades}")
+    print(f"HandonBroker: {before * 1e6:8.1f} us/order")
+    print(f"LiveBroker:   {after * 1e6:8.1f} us/order ({before / after:.1f}x)")
+
+
+main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
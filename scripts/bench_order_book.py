@@ -0,0 +1,79 @@
+"""
+指値・逆指値を何百本も置いておくグリッド戦略のBacktest.runの時間を、
+毎本すべての注文を見ていた以前の経路(リスト)と、価格で並べた注文板の経路とで比べる
+
+    python scripts/bench_order_book.py [足の本数] [片側の注文の本数]
+"""
+import sys
+import time
+import warnings
+from functools import partial
+
+from backtesting import Backtest, Strategy
+from backtesting.backtesting import _Broker
+
+from bench_backtest_run import minute_bars
+
+
+class ListOrders(list):
+    """
+    以前の経路: 毎本すべての注文を順に見る
+    """
+
+    def triggered(self, high, low):
+        return list(self)
+
+    def reindex(self, order):
+        pass
+
+
+class ListBroker(_Broker):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.orders = ListOrders()
+
+
+class Grid(Strategy):
+    levels = 200
+    step = 0.0005
+
+    def init(self):
+        pass
+
+    def next(self):
+        if len(self.data) % 500 == 0:
+            self.orders.cancel()
+        if len(self.orders) >= 2 * self.levels:
+            return
+        price = self.data.Close[-1]
+        for k in range(1, self.levels + 1):
+            offset = price * self.step * k
+            self.buy(size=1, limit=price - offset, tp=price)
+            self.sell(size=1, stop=price - offset - self.step)
+
+
+def bench(df, broker, levels):
+    bt = Backtest(df, Grid, cash=100_0000)
+    bt._broker = partial(broker, **bt._broker.keywords)
+    start = time.perf_counter()
+    stats = bt.run(levels=levels)
+    return time.perf_counter() - start, stats
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+    levels = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    warnings.simplefilter("ignore")
+    df = minute_bars(n)
+
+    results = {}
+    for name, broker in [("list", ListBroker), ("book", _Broker)]:
+        elapsed, stats = bench(df, broker, levels)
+        results[name] = stats
+        print(
+            "{:6s} {:8.3f}s {:10.0f} bars/s {:6d} trades".format(
+                name, elapsed, n / elapsed, stats["# Trades"]
+            )
+        )
+    assert results["list"]["_equity_curve"].equals(results["book"]["_equity_curve"])
+    assert results["list"]["_trades"].equals(results["book"]["_trades"])
@@ -0,0 +1,74 @@
+"""
+メンションの文字列からの操作・ペア・数値・金額の取り出しを、
+キーワードごとに_find()する以前のやり方とscan_text()とで比べる
+
+    python scripts/bench_parse_text.py [繰り返し回数]
+"""
+import sys
+import time
+
+from handon_fx.chat.utils import (
+    INTENT_TEXTS,
+    PAIRS_TEXTS,
+    _find,
+    _find_n,
+    _find_yen,
+    scan_text,
+)
+
+CORPUS = [
+    "@handon 1L",
+    "@handon USDJPY 1L",
+    "@handon USD/JPY 1L",
+    "@handon ドル円 0.5 買い",
+    "@handon 全部売り",
+    "@handon 30% short",
+    "@handon -2ロット買います",
+    "@handon ビットコイン 3ロング",
+    "@handon ポジション見せて",
+    "@handon サマリ",
+    "@handon ランキング",
+    "@handon 逆ランキング教えて",
+    "@handon 100万円貸してください",
+    "@handon 50万円返済します",
+    "@handon 返す",
+    "@handon 利確",
+    "@handon 損切りお願いします",
+    "@handon レート教えて",
+    "@handon help",
+    "@handon 今日はいい天気ですね。ドル円を10ロット買いたいけど余力はいくらありますか?",
+]
+
+
+def legacy_scan(text):
+    intents = {name for name, keywords in INTENT_TEXTS.items() if _find(keywords, text)}
+    pairs = [pair for pair, keywords in PAIRS_TEXTS.items() if _find(keywords, text)]
+    return intents, pairs, _find_n(text), _find_yen(text)
+
+
+def compiled_scan(text):
+    scan = scan_text(text)
+    return scan.intents, scan.pairs, scan.numbers, scan.yen
+
+
+def bench(func, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        for text in CORPUS:
+            func(text)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    for text in CORPUS:
+        assert legacy_scan(text) == compiled_scan(text), text
+
+    messages = n * len(CORPUS)
+    for name, func in [("legacy", legacy_scan), ("scan_text", compiled_scan)]:
+        elapsed = bench(func, n)
+        print(
+            "{:10s} {:8.2f} us/message {:10.0f} messages/s".format(
+                name, elapsed / messages * 1e6, messages / elapsed
+            )
+        )
@@ -0,0 +1,53 @@
+"""
+SignalStrategyのBacktest.runの時間を、毎本next()を呼ぶイベントループと
+シグナルの出た足だけを処理する経路とで比べる
+
+    python scripts/bench_signal_strategy.py [足の本数]
+"""
+import sys
+import time
+import warnings
+
+from backtesting import Backtest
+from backtesting.lib import SignalStrategy
+
+from bench_backtest_run import minute_bars
+
+
+class SmaCrossSignal(SignalStrategy):
+    def init(self):
+        close = self.data.Close.s
+        fast = close.rolling(60).mean() > close.rolling(240).mean()
+        entry = fast.astype(int).diff().fillna(0)
+        self.set_signal(entry * 0.95)
+
+
+class EventLoop(SmaCrossSignal):
+    # next()を上書きすると毎本処理する
+    def next(self):
+        super().next()
+
+
+def bench(df, strategy):
+    bt = Backtest(df, strategy, cash=100_0000)
+    start = time.perf_counter()
+    stats = bt.run()
+    return time.perf_counter() - start, stats
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    warnings.simplefilter("ignore")
+    df = minute_bars(n)
+
+    results = {}
+    for name, strategy in [("event", EventLoop), ("signal", SmaCrossSignal)]:
+        elapsed, stats = bench(df, strategy)
+        results[name] = stats
+        print(
+            "{:8s} {:8.3f}s {:12.0f} bars/s {:6d} trades".format(
+                name, elapsed, n / elapsed, stats["# Trades"]
+            )
+        )
+    assert results["event"]["_equity_curve"].equals(results["signal"]["_equity_curve"])
+    assert results["event"]["_trades"].equals(results["signal"]["_trades"])
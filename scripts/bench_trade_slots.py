@@ -0,0 +1,121 @@
+"""
+Trade・Orderのメモリ使用量と生成・コピー・読み出しの速さ、1本ごとに建玉を入れ替えるBacktest.runの時間、
+DBのTradeModelからHandonTradeを作り直す経路の速さを測る
+(`__slots__` にする前のコミットでも同じように動くので、前後で比べる)
+
+    python scripts/bench_trade_slots.py [建玉の本数] [Backtestの足の本数]
+"""
+import datetime
+import sys
+import time
+import tracemalloc
+import warnings
+
+from backtesting import Backtest, Strategy
+from backtesting.backtesting import Order, Trade
+from handon_fx.fx.live import LiveBroker
+from handon_fx.fx.models import TradeModel
+from handon_fx.fx.trade import HandonTrade
+
+from bench_backtest_run import minute_bars
+
+
+class Flip(Strategy):
+    """毎本、今の建玉を決済して反対向きに1本建てる (足の本数とほぼ同じ数の建玉ができる)"""
+
+    def init(self):
+        pass
+
+    def next(self):
+        if self.position.is_long:
+            self.sell(size=2)
+        elif self.position.is_short:
+            self.buy(size=2)
+        else:
+            self.buy(size=1)
+
+
+def memory(func):
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    objects = func()
+    size = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return size, objects
+
+
+def bench_objects(n):
+    size, trades = memory(lambda: [Trade(None, 1, 100.0, i, None) for i in range(n)])
+    print("Trade:  {:6.1f} bytes/trade".format(size / n))
+    size, _ = memory(lambda: [Order(None, 1, tp_price=101.0) for _ in range(n)])
+    print("Order:  {:6.1f} bytes/order".format(size / n))
+
+    start = time.perf_counter()
+    trades = [Trade(None, 1, 100.0, i, None) for i in range(n)]
+    created = time.perf_counter() - start
+
+    start = time.perf_counter()
+    copies = [trade._copy(size=-1, sl_order=None, tp_order=None) for trade in trades]
+    copied = time.perf_counter() - start
+
+    start = time.perf_counter()
+    total = 0
+    for trade in copies:
+        total += trade.size * trade.entry_price
+    read = time.perf_counter() - start
+    assert total == -100.0 * n
+
+    for name, elapsed in [("create", created), ("_copy", copied), ("read", read)]:
+        print("{:6s}  {:6.3f} us/trade".format(name, elapsed / n * 1e6))
+
+
+def bench_backtest(bars):
+    df = minute_bars(bars)
+    bt = Backtest(df, Flip, cash=1_000_000_000)
+    start = time.perf_counter()
+    stats = bt.run()
+    elapsed = time.perf_counter() - start
+    print(
+        "Backtest: {:8.3f}s {:8d} trades {:10.0f} trades/s".format(
+            elapsed, stats["# Trades"], stats["# Trades"] / elapsed
+        )
+    )
+
+
+def bench_handon_trades(n):
+    models = [
+        TradeModel(
+            trade_id=str(i),
+            account_id="bench@handon.club",
+            state="open",
+            instrument="JPY/USD",
+            size=10000,
+            entry_price=129.0 + i % 10 / 10,
+            entry_time=datetime.datetime(2023, 1, 4),
+        )
+        for i in range(n)
+    ]
+    broker = LiveBroker(price=130.0, cash=100_0000, margin=1.0 / 20.0)
+
+    start = time.perf_counter()
+    trades = [HandonTrade.from_model(broker, model) for model in models]
+    loaded = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for trade in trades:
+        trade._replace(size=5000)
+        trade.update_actions()
+        repr(trade)
+    updated = time.perf_counter() - start
+
+    for name, elapsed in [("from_model", loaded), ("update", updated)]:
+        print("{:10s} {:6.2f} us/trade".format(name, elapsed / n * 1e6))
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    bars = int(sys.argv[2]) if len(sys.argv) > 2 else 200_000
+    warnings.simplefilter("ignore")
+    bench_objects(n)
+    bench_handon_trades(min(n, 100_000))
+    bench_backtest(bars)
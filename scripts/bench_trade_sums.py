@@ -0,0 +1,78 @@
+"""
+建玉を何千本も持ったままのBacktest.runの時間を、評価額・余力を毎回すべての建玉から合計していた
+以前の経路と、建玉の数量・建値の合計を持ち回る経路とで比べる
+
+    python scripts/bench_trade_sums.py [足の本数] [持つ建玉の本数]
+"""
+import sys
+import time
+import warnings
+from functools import partial
+
+import numpy as np
+
+from backtesting import Backtest, Strategy
+from backtesting.backtesting import _Broker
+
+from bench_backtest_run import minute_bars
+
+
+class SumBroker(_Broker):
+    """
+    以前の経路: 評価額・余力を読むたびにすべての建玉を合計する
+    """
+
+    @property
+    def equity(self) -> float:
+        return self._cash + sum(trade.pl for trade in self.trades)
+
+    @property
+    def margin_available(self) -> float:
+        margin_used = sum(trade.value / self._leverage for trade in self.trades)
+        return max(0, self.equity - margin_used)
+
+
+class Ladder(Strategy):
+    max_trades = 1000
+
+    def init(self):
+        pass
+
+    def next(self):
+        # 古い建玉から決済しつつ、毎本1本ずつ買い増す
+        if len(self.trades) >= self.max_trades:
+            self.trades[0].close()
+        if self.equity > 0:
+            self.buy(size=1)
+
+
+def bench(df, broker, max_trades):
+    bt = Backtest(df, Ladder, cash=100_0000, hedging=True)
+    bt._broker = partial(broker, **bt._broker.keywords)
+    start = time.perf_counter()
+    stats = bt.run(max_trades=max_trades)
+    return time.perf_counter() - start, stats
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+    max_trades = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    warnings.simplefilter("ignore")
+    df = minute_bars(n)
+
+    results = {}
+    for name, broker in [("sum", SumBroker), ("running", _Broker)]:
+        elapsed, stats = bench(df, broker, max_trades)
+        results[name] = stats
+        print(
+            "{:8s} {:8.3f}s {:10.0f} bars/s {:6d} trades".format(
+                name, elapsed, n / elapsed, stats["# Trades"]
+            )
+        )
+    # 合計の順番が違うので、評価額は丸め誤差の範囲で一致する
+    assert np.allclose(
+        results["sum"]["_equity_curve"]["Equity"],
+        results["running"]["_equity_curve"]["Equity"],
+        rtol=1e-12,
+    )
+    assert results["sum"]["_trades"].equals(results["running"]["_trades"])
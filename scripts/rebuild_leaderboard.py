@@ -0,0 +1,15 @@
+"""
+全口座と未決済の建玉からランキング用のテーブルを作り直す
+デプロイ後に1回実行する (終わるまでランキングは全口座を読んで計算する)
+
+    python scripts/rebuild_leaderboard.py
+"""
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from handon_fx.fx import HandonFxAPI  # noqa: E402
+
+if __name__ == "__main__":
+    HandonFxAPI().rebuild_leaderboard()
+    print("rebuilt leaderboard")
@@ -0,0 +1,9 @@
+import dotenv
+
+dotenv.load_dotenv()
+
+from handon_fx.chat.mastodon_api import run_mention_stream
+
+if __name__ == "__main__":
+    # pushを受けるLambdaの代わりに、ユーザーストリームにつないで常駐する
+    run_mention_stream()
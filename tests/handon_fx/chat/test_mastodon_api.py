@@ -0,0 +1,363 @@
+#
+# filename: `tests/handon_fx/chat/test_mastodon_api.py`
+#
+
+import asyncio
+import base64
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import handon_fx.chat.mastodon_api as mastodon_api
+from handon_fx.fakes import FakeMastodon, FakeStreamServer
+
+
+#
+class MastodonApiAsyncTest(unittest.IsolatedAsyncioTestCase):
+
+    #
+    #
+    #
+    def setUp(self):
+        self.mastodon = FakeMastodon(hostname="handon.club")
+        self.patches = [
+            mock.patch.object(mastodon_api.ChatModel, "lock", return_value=True),
+            mock.patch.object(
+                mastodon_api.AccountModel,
+                "get",
+                side_effect=mastodon_api.AccountModel.DoesNotExist,
+            ),
+            mock.patch.object(mastodon_api.HandonFxAPI, "start"),
+            mock.patch.object(
+                mastodon_api.ChatBot, "action", side_effect=lambda user, text: text
+            ),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    #
+    #
+    #
+    async def test_process_mention_async(self):
+        self.mastodon.add_mention("osa9", "1L")
+        account = mastodon_api.AccountModel(
+            account_id="osa9@handon.club", cash=100, open_trades=0
+        )
+        with mock.patch.object(
+            mastodon_api.AccountModel, "get", return_value=account
+        ), mock.patch.object(mastodon_api.HandonFxAPI, "prefetch") as prefetch:
+            await mastodon_api.process_mention_async(self.mastodon, 1)
+        # process_mentionと同じく、口座を先に読んでおく
+        mastodon_api.HandonFxAPI.start.assert_called_once()
+        self.assertIs(account, prefetch.call_args.kwargs["account"])
+        self.assertEqual(["@osa9 1L"], [post["status"] for post in self.mastodon.posts])
+
+    async def test_process_mention_async_error(self):
+        self.mastodon.add_mention("osa9", "1L", visibility="direct")
+        with mock.patch.object(
+            mastodon_api.ChatBot, "action", side_effect=ValueError("だめ")
+        ):
+            await mastodon_api.process_mention_async(self.mastodon, 1)
+        self.assertEqual(
+            [{"status": "@osa9 エラーだめ", "in_reply_to_id": 1, "visibility": "direct"}],
+            self.mastodon.posts,
+        )
+
+    async def test_handle_push_notification_async(self):
+        body = self.mastodon.add_mention("osa9", "1L", visibility="unlisted")
+        ret = await mastodon_api.handle_push_notification_async(
+            body, "", "", mastodon=self.mastodon, priv_key={}
+        )
+        self.assertTrue(ret)
+        self.assertEqual(
+            [{"status": "@osa9 1L", "in_reply_to_id": 1, "visibility": "unlisted"}],
+            self.mastodon.posts,
+        )
+
+    async def test_process_mention_async_locked(self):
+        self.mastodon.add_mention("osa9", "1L")
+        with mock.patch.object(mastodon_api.ChatModel, "lock", return_value=False):
+            await mastodon_api.process_mention_async(self.mastodon, 1)
+        self.assertEqual([], self.mastodon.posts)
+
+    async def test_concurrent_mentions(self):
+        self.mastodon.latency = 0.05
+        bodies = [self.mastodon.add_mention("osa9", f"{i}L") for i in range(10)]
+        await asyncio.gather(
+            *[
+                mastodon_api.handle_push_notification_async(
+                    body, "", "", mastodon=self.mastodon, priv_key={}
+                )
+                for body in bodies
+            ]
+        )
+        self.assertEqual(
+            sorted(f"@osa9 {i}L" for i in range(10)),
+            sorted(post["status"] for post in self.mastodon.posts),
+        )
+
+
+#
+class ProcessMentionTest(unittest.TestCase):
+
+    #
+    #
+    #
+    def setUp(self):
+        self.mastodon = FakeMastodon(latency=0.05)
+        self.patches = [
+            mock.patch.object(mastodon_api.ChatModel, "lock", return_value=True),
+            mock.patch.object(
+                mastodon_api.AccountModel,
+                "get",
+                side_effect=mastodon_api.AccountModel.DoesNotExist,
+            ),
+            mock.patch.object(
+                mastodon_api.HandonFxAPI, "start", side_effect=lambda: time.sleep(0.05)
+            ),
+            mock.patch.object(
+                mastodon_api.ChatBot, "action", side_effect=lambda user, text: text
+            ),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    #
+    #
+    #
+    def test_prefetch_mention(self):
+        self.mastodon.add_mention("osa9", "1L")
+        fx = mastodon_api.HandonFxAPI()
+        start = time.perf_counter()
+        locked, info = mastodon_api.prefetch_mention(self.mastodon, 1, fx)
+        elapsed = time.perf_counter() - start
+
+        self.assertTrue(locked)
+        self.assertEqual("1L", info["content"])
+        # 通知の取得とレートの取得が重なっている
+        self.assertLess(elapsed, 0.09)
+
+    def test_concurrent_prefetch(self):
+        for i in range(8):
+            self.mastodon.add_mention("osa9", f"{i}L")
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(
+                executor.map(
+                    lambda i: mastodon_api.prefetch_mention(
+                        self.mastodon, i, mastodon_api.HandonFxAPI()
+                    ),
+                    range(1, 9),
+                )
+            )
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(
+            [f"{i}L" for i in range(8)], [r[1]["content"] for r in results]
+        )
+        # 他のメンションのprefetchの後ろに並ばない
+        self.assertLess(elapsed, 0.09 * 2)
+
+    def test_process_mention(self):
+        self.mastodon.add_mention("osa9", "1L", visibility="direct")
+        mastodon_api.process_mention(self.mastodon, 1)
+        self.assertEqual(
+            [{"status": "@osa9 1L", "in_reply_to_id": 1, "visibility": "direct"}],
+            self.mastodon.posts,
+        )
+
+
+#
+class MentionQueueConfigTest(unittest.TestCase):
+
+    #
+    #
+    #
+    def setUp(self):
+        self.patches = [
+            mock.patch.object(mastodon_api, "_mention_queue", None),
+            mock.patch.object(mastodon_api, "MentionWorker"),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    #
+    #
+    #
+    def test_queue(self):
+        with mock.patch.dict(os.environ, {"MENTION_QUEUE": "memory://"}):
+            self.assertIsNotNone(mastodon_api.get_mention_queue())
+        mastodon_api.MentionWorker.return_value.start.assert_called_once()
+
+    def test_lambda(self):
+        env = {"MENTION_QUEUE": "memory://", "AWS_LAMBDA_FUNCTION_NAME": "notify"}
+        with mock.patch.dict(os.environ, env):
+            # Lambdaではワーカーが動き続けられないので、その場で処理する
+            self.assertIsNone(mastodon_api.get_mention_queue())
+        mastodon_api.MentionWorker.assert_not_called()
+
+
+#
+class MastodonContextTest(unittest.TestCase):
+
+    #
+    #
+    #
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.key_path = os.path.join(self.dir, "privkey")
+        self.write_key(b"auth1")
+        self.context = mastodon_api.MastodonContext(key_path=self.key_path)
+        self.patches = [
+            mock.patch.object(
+                mastodon_api, "Mastodon", side_effect=lambda **kwargs: object()
+            ),
+            mock.patch.dict(
+                os.environ,
+                {"ACCESS_TOKEN": "token", "MASTODON_SERVER": "https://handon.club"},
+            ),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        shutil.rmtree(self.dir)
+
+    def write_key(self, auth, mtime=None):
+        with open(self.key_path, "w") as f:
+            json.dump({"privkey": 1, "auth": base64.b64encode(auth).decode()}, f)
+        if mtime is not None:
+            os.utime(self.key_path, (mtime, mtime))
+
+    #
+    #
+    #
+    def test_mastodon(self):
+        client = self.context.mastodon()
+        self.assertIs(client, self.context.mastodon())
+        self.assertEqual(1, mastodon_api.Mastodon.call_count)
+
+        os.environ["ACCESS_TOKEN"] = "token2"
+        self.assertIsNot(client, self.context.mastodon())
+        self.assertEqual(2, mastodon_api.Mastodon.call_count)
+
+    def test_priv_key(self):
+        priv_key = self.context.priv_key()
+        self.assertEqual(b"auth1", priv_key["auth"])
+        self.assertIs(priv_key, self.context.priv_key())
+
+        self.write_key(b"auth2", mtime=time.time() + 10)
+        self.assertEqual(b"auth2", self.context.priv_key()["auth"])
+
+
+#
+class MentionStreamTest(unittest.TestCase):
+
+    #
+    #
+    #
+    def setUp(self):
+        self.server = FakeStreamServer().start()
+        self.fake = FakeMastodon()
+        self.processed = []
+        self.patches = [
+            mock.patch.dict(os.environ, {"MASTODON_SERVER": "https://handon.club"}),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.server.stop()
+
+    def process(self, mastodon, notification_id, info=None):
+        self.processed.append((notification_id, info["user_id"], info["content"]))
+
+    def mention(self, acct, content):
+        body = json.loads(self.fake.add_mention(acct, content))
+        return self.fake.notifications(id=body["notification_id"])
+
+    #
+    #
+    #
+    def test_stream_user(self):
+        client = mastodon_api.Mastodon(
+            access_token="token",
+            api_base_url=self.server.url,
+            version_check_mode="none",
+        )
+        listener = mastodon_api.MentionStreamListener(client, process=self.process)
+        self.server.push("notification", self.mention("osa9", "1L"))
+        self.server.push("notification", {"id": "5", "type": "follow"})
+        self.server.push("notification", self.mention("someone@example.com", "2S"))
+        self.server.push("update", {"id": "3"})
+        self.server.close_stream()
+
+        client.stream_user(listener)
+        listener.close()
+
+        self.assertEqual(
+            [(1, "osa9@handon.club", "1L"), (2, "someone@example.com", "2S")],
+            sorted(self.processed),
+        )
+        self.assertEqual(5, listener.last_id)
+        self.assertEqual(1, self.server.connections)
+
+    def test_account_order(self):
+        def process(mastodon, notification_id, info=None):
+            time.sleep(0.01)
+            self.process(mastodon, notification_id, info)
+
+        listener = mastodon_api.MentionStreamListener(self.fake, process=process)
+        for i in range(5):
+            listener.on_notification(self.mention("osa9", f"{i}L"))
+        listener.close()
+        self.assertEqual([1, 2, 3, 4, 5], [p[0] for p in self.processed])
+
+    def test_catch_up(self):
+        listener = mastodon_api.MentionStreamListener(self.fake, process=self.process)
+        listener.catch_up()
+        listener.on_notification(self.mention("osa9", "1L"))
+        self.mention("osa9", "2L")
+        self.mention("osa9", "3L")
+        listener.catch_up()
+        listener.close()
+        self.assertEqual([1, 2, 3], [p[0] for p in self.processed])
+        self.assertEqual(3, listener.last_id)
+
+    def test_catch_up_pages(self):
+        listener = mastodon_api.MentionStreamListener(self.fake, process=self.process)
+        listener.on_notification(self.mention("osa9", "0L"))
+        # 1ページ(15件)に収まらないくらい溜まっていても全部拾う
+        for i in range(1, 40):
+            self.mention(f"user{i}", f"{i}L")
+        listener.catch_up()
+        listener.close()
+        self.assertEqual(list(range(1, 41)), sorted(p[0] for p in self.processed))
+        self.assertEqual(40, listener.last_id)
+
+
+if __name__ == "__main__":
+            unittest.main()
+
+# endof filename: `tests/handon_fx/chat/test_mastodon_api.py`
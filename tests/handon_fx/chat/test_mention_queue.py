@@ -0,0 +1,202 @@
+#
+# filename: `tests/handon_fx/chat/test_mention_queue.py`
+#
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from handon_fx.chat.mention_queue import (
+    MemoryQueue,
+    MentionQueue,
+    MentionWorker,
+    SQLiteQueue,
+    create_queue,
+)
+
+
+#
+class QueueTest(unittest.TestCase):
+
+    #
+    #
+    #
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    #
+    #
+    #
+    def check_queue(self, queue):
+        for notification_id in ["1", "2", "3"]:
+            queue.put(notification_id)
+        jobs = queue.get_batch(2)
+        self.assertEqual(["1", "2"], [job.notification_id for job in jobs])
+        self.assertEqual(["3"], [job.notification_id for job in queue.get_batch(2)])
+        self.assertEqual([], queue.get_batch(2))
+        queue.ack(jobs)
+
+    def test_memory_queue(self):
+        queue = MemoryQueue()
+        self.check_queue(queue)
+        self.assertEqual(1, len(queue))
+
+    def test_memory_queue_redelivery(self):
+        queue = MemoryQueue(visibility_timeout=0)
+        queue.put("1")
+        self.assertEqual(1, len(queue.get_batch(10)))
+        time.sleep(0.01)
+        jobs = queue.get_batch(10)
+        self.assertEqual([("1", 2)], [(j.notification_id, j.deliveries) for j in jobs])
+        queue.ack(jobs)
+        time.sleep(0.01)
+        self.assertEqual([], queue.get_batch(10))
+
+    def test_sqlite_queue(self):
+        queue = SQLiteQueue(os.path.join(self.dir, "queue.db"))
+        self.check_queue(queue)
+        # ack()していない"3"だけ残る
+        self.assertEqual(1, len(queue))
+
+    def test_sqlite_queue_redelivery(self):
+        queue = SQLiteQueue(os.path.join(self.dir, "queue.db"), visibility_timeout=0)
+        queue.put("1")
+        self.assertEqual(1, len(queue.get_batch(10)))
+        time.sleep(0.01)
+        jobs = queue.get_batch(10)
+        self.assertEqual([("1", 2)], [(j.notification_id, j.deliveries) for j in jobs])
+
+    def test_create_queue(self):
+        self.assertIsInstance(create_queue("memory://"), MemoryQueue)
+        path = os.path.join(self.dir, "queue.db")
+        self.assertEqual(path, create_queue("sqlite://" + path).path)
+        with self.assertRaises(ValueError):
+            create_queue("redis://localhost")
+        with self.assertRaises(TypeError):
+            MentionQueue()
+
+
+#
+class MentionWorkerTest(unittest.TestCase):
+
+    #
+    #
+    #
+    def setUp(self):
+        self.queue = MemoryQueue()
+        self.processed = []
+        self.running = {}
+        self.overlap = False
+        self.lock = threading.Lock()
+        self.worker = MentionWorker(
+            self.queue,
+            mastodon_factory=lambda: None,
+            fetch=self.fetch,
+            process=self.process,
+            batch_size=10,
+        )
+
+    def tearDown(self):
+        pass
+
+    def fetch(self, mastodon, notification_id):
+        if notification_id == "bad":
+            raise ConnectionError("notification is gone")
+        user_id = notification_id.split(":")[0]
+        return {"user_id": user_id, "content": notification_id}
+
+    def process(self, mastodon, notification_id, info):
+        user_id = info["user_id"]
+        if notification_id.endswith(":fail"):
+            raise RuntimeError("failed to reply")
+        with self.lock:
+            if self.running.get(user_id):
+                self.overlap = True
+            self.running[user_id] = True
+        time.sleep(0.02)
+        with self.lock:
+            self.running[user_id] = False
+            self.processed.append(notification_id)
+
+    #
+    #
+    #
+    def test_run_once(self):
+        ids = ["a:1", "b:1", "a:2", "c:1", "a:3", "b:2"]
+        for notification_id in ids:
+            self.queue.put(notification_id)
+
+        start = time.perf_counter()
+        self.assertEqual(len(ids), self.worker.run_once())
+        elapsed = time.perf_counter() - start
+
+        # 同じアカウントは順番に、重ならずに処理する
+        self.assertFalse(self.overlap)
+        for user_id in ["a", "b", "c"]:
+            self.assertEqual(
+                sorted(i for i in self.processed if i.startswith(user_id + ":")),
+                [i for i in self.processed if i.startswith(user_id + ":")],
+            )
+        self.assertEqual(6, len(self.processed))
+        # 違うアカウントは並行して処理する (一番多いaの3件分くらいで終わる)
+        self.assertLess(elapsed, 0.02 * 5)
+        self.assertEqual(0, self.worker.run_once())
+
+    def delivered(self):
+        time.sleep(0.01)
+        return [job.notification_id for job in self.queue.get_batch(10)]
+
+    def test_fetch_failure(self):
+        self.queue.visibility_timeout = 0
+        for notification_id in ["a:1", "bad", "a:2", "b:1"]:
+            self.queue.put(notification_id)
+        # "bad"がどのアカウントか分からないので、後ろは次に回す
+        self.assertEqual(1, self.worker.run_once())
+        self.assertEqual(["a:1"], self.processed)
+        self.assertEqual(["bad", "a:2", "b:1"], self.delivered())
+
+    def test_process_failure(self):
+        self.queue.visibility_timeout = 0
+        for notification_id in ["a:fail", "b:1", "a:2", "b:2"]:
+            self.queue.put(notification_id)
+        # 失敗したアカウントの残りは、失敗したジョブより先に処理しない
+        self.assertEqual(2, self.worker.run_once())
+        self.assertEqual(["b:1", "b:2"], self.processed)
+        self.assertEqual(["a:fail", "a:2"], self.delivered())
+
+    def test_give_up(self):
+        self.queue.visibility_timeout = 0
+        self.worker.max_deliveries = 2
+        for notification_id in ["a:fail", "bad", "a:2"]:
+            self.queue.put(notification_id)
+        self.assertEqual(0, self.worker.run_once())
+        time.sleep(0.01)
+        # 2回目で諦めてack()し、後ろのジョブを処理する
+        self.assertEqual(3, self.worker.run_once())
+        self.assertEqual(["a:2"], self.processed)
+        self.assertEqual([], self.delivered())
+
+    def test_start(self):
+        self.worker.poll_interval = 0.01
+        self.worker.start()
+        try:
+            self.queue.put("a:1")
+            for _ in range(100):
+                if self.processed:
+                    break
+                time.sleep(0.01)
+        finally:
+            self.worker.stop()
+        self.assertEqual(["a:1"], self.processed)
+
+
+if __name__ == "__main__":
+            unittest.main()
+
+# endof filename: `tests/handon_fx/chat/test_mention_queue.py`
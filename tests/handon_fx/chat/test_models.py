@@ -0,0 +1,73 @@
+#
+# filename: `tests/handon_fx/chat/test_models.py`
+#
+
+import unittest
+from unittest import mock
+
+from pynamodb.exceptions import PutError
+
+import handon_fx.chat.models as models
+from handon_fx.chat.models import ChatModel
+
+
+def conditional_check_failed():
+    error = PutError("Failed to put item")
+    error.cause = mock.Mock(
+        response={"Error": {"Code": "ConditionalCheckFailedException"}}
+    )
+    return error
+
+
+#
+class ChatModelLockTest(unittest.TestCase):
+
+    #
+    #
+    #
+    def setUp(self):
+        models._recent.clear()
+        self.patch = mock.patch.object(ChatModel, "save")
+        self.save = self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        models._recent.clear()
+
+    #
+    #
+    #
+    def test_lock(self):
+        self.assertTrue(ChatModel.lock("1"))
+        self.assertEqual(1, self.save.call_count)
+        self.assertIn("condition", self.save.call_args.kwargs)
+
+        # 同じコンテナへの再送はDynamoDBに聞かずに弾く
+        self.assertFalse(ChatModel.lock("1"))
+        self.assertEqual(1, self.save.call_count)
+
+    def test_lock_duplicate(self):
+        self.save.side_effect = conditional_check_failed()
+        self.assertFalse(ChatModel.lock("2"))
+        self.assertFalse(ChatModel.lock("2"))
+        self.assertEqual(1, self.save.call_count)
+
+    def test_lock_error(self):
+        self.save.side_effect = PutError("Failed to put item")
+        with self.assertRaises(PutError):
+            ChatModel.lock("3")
+        # 失敗した時は覚えないので、もう一度取りに行ける
+        self.save.side_effect = None
+        self.assertTrue(ChatModel.lock("3"))
+
+    def test_recent_limit(self):
+        with mock.patch.object(models, "RECENT_NOTIFICATIONS", 2):
+            for notification_id in ["1", "2", "3"]:
+                ChatModel.lock(notification_id)
+        self.assertEqual(["2", "3"], list(models._recent))
+
+
+if __name__ == "__main__":
+            unittest.main()
+
+# endof filename: `tests/handon_fx/chat/test_models.py`
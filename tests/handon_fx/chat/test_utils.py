@@ -86,6 +86,39 @@ class UtilsTest(unittest.TestCase):
         exp = ['USDJPY']
         self.assertEqual(exp, ret)
 
+    # one pass.
+    def test_scan_text(self):
+
+        # "USD"の"S"で売りも当たる (_findと同じ)
+        ret = utils.scan_text('USD/JPY 1L')
+        self.assertEqual({'buy', 'sell'}, ret.intents)
+        self.assertEqual(['USDJPY'], ret.pairs)
+        self.assertEqual([1.0], ret.numbers)
+        self.assertEqual([], ret.yen)
+
+        # 「ドル円」の中の「ドル」でrateも当たる
+        ret = utils.scan_text('ドル円のレート')
+        self.assertEqual({'rate'}, ret.intents)
+        self.assertEqual(['USDJPY'], ret.pairs)
+
+        ret = utils.scan_text('100万円貸して下さい')
+        self.assertEqual({'debt'}, ret.intents)
+        self.assertEqual([100], ret.numbers)
+        self.assertEqual([1000000], ret.yen)
+
+    def test_scan_text_parity(self):
+        texts = [
+            '1L', '30% short', '-2ロット買い', 'ビットコイン 3ロング', 'Long', 'ポジション',
+            '逆ランキング', '50万円返済します', '1.5万円返す', '0.51,000円', 'ユーロドル', 'help',
+        ]
+        for text in texts:
+            ret = utils.scan_text(text)
+            for intent, keywords in utils.INTENT_TEXTS.items():
+                self.assertEqual(utils._find(keywords, text), intent in ret.intents, (text, intent))
+            self.assertEqual(utils._find_obj(text), ret.pairs, text)
+            self.assertEqual(utils._find_n(text), ret.numbers, text)
+            self.assertEqual(utils._find_yen(text), ret.yen, text)
+
 
 
 #
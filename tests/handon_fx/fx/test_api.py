@@ -0,0 +1,412 @@
+#
+# filename: `tests/handon_fx/fx/test_api.py`
+#
+
+import datetime
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from pynamodb.exceptions import TransactWriteError
+
+import handon_fx.fx.api as api
+from handon_fx.fakes import FakeTransaction
+from handon_fx.fx.models import AccountModel, LeaderboardModel, TradeModel
+from handon_fx.fx.rate import Quote
+from handon_fx.fx.valuation import BookValuation
+
+from .test_commit import transact_error
+
+
+def account(account_id="osa9@handon.club", cash=100_0000, size=None, avg_price=0):
+    return AccountModel(
+        account_id=account_id,
+        cash=cash,
+        position_size=size,
+        position_avg_price=avg_price if size is not None else None,
+        open_trades=None if size is None else int(bool(size)),
+    )
+
+
+def trade_model(trade_id, size, entry_price=130.0):
+    return TradeModel(
+        trade_id=trade_id,
+        account_id="osa9@handon.club",
+        state="open",
+        instrument="JPY/USD",
+        size=size,
+        entry_price=entry_price,
+        entry_time=datetime.datetime(2023, 1, 4),
+    )
+
+
+def set_values(actions):
+    """SetActionのリストを {属性名: DynamoDBの値} にする"""
+    return {
+        action.values[0].attribute.attr_name: action.values[1].value
+        for action in actions
+    }
+
+
+def leaderboard_values(transaction):
+    (row,) = transaction.writes(LeaderboardModel)
+    return set_values(row[2])
+
+
+def fx_api(price=131.0):
+    fx = api.HandonFxAPI(compact_min_lots=0)
+    quote = Quote("USD/JPY", price, price, price, datetime.datetime(2023, 1, 4))
+    fx.quotes = {"USDJPY": quote}
+    fx.quote = quote
+    return fx
+
+
+#
+class LeaderboardTest(unittest.TestCase):
+
+    #
+    #
+    #
+    def setUp(self):
+        self.fx = fx_api()
+        self.transaction = FakeTransaction()
+        self.book = BookValuation.from_models(
+            [SimpleNamespace(account_id="a@handon.club", cash=100, current_debt=0)], []
+        )
+        self.patches = [
+            mock.patch.object(api, "transaction", self.transaction),
+            mock.patch.object(BookValuation, "load", return_value=self.book),
+            mock.patch.object(LeaderboardModel, "query", return_value=[]),
+        ]
+        for patch in self.patches:
+            patch.start()
+        api.ranking_cache.invalidate()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        api.ranking_cache.invalidate()
+
+    #
+    #
+    #
+    def test_not_built(self):
+        with mock.patch.object(
+            LeaderboardModel, "get", side_effect=LeaderboardModel.DoesNotExist
+        ):
+            ret = self.fx.ranking()
+        # 作り直しが済むまではテーブルを使わずに全口座を読む
+        self.assertEqual(["a@handon.club"], [r["account_id"] for r in ret])
+        LeaderboardModel.query.assert_not_called()
+
+    def test_built(self):
+        rows = [
+            LeaderboardModel(
+                api.LEADERBOARD,
+                "b@handon.club",
+                cash=200,
+                position_size=0,
+                position_cost=0,
+            )
+        ]
+        LeaderboardModel.query.return_value = rows
+        with mock.patch.object(LeaderboardModel, "get"):
+            ret = self.fx.ranking()
+        self.assertEqual(["b@handon.club"], [r["account_id"] for r in ret])
+        BookValuation.load.assert_not_called()
+
+    def test_rebuild_writes_marker_last(self):
+        events = []
+        batch = mock.MagicMock()
+        batch.__enter__.return_value.save.side_effect = lambda row: events.append(
+            row.account_id
+        )
+        batch.__exit__.side_effect = lambda *args: events.append("flush")
+        accounts = [account("a@handon.club", cash=100)]
+        with mock.patch.object(
+            LeaderboardModel, "batch_write", return_value=batch
+        ), mock.patch.object(
+            LeaderboardModel,
+            "save",
+            autospec=True,
+            side_effect=lambda row: events.append((row.board, row.account_id)),
+        ), mock.patch.object(
+            self.fx, "get_accounts", return_value=accounts
+        ):
+            self.fx.rebuild_leaderboard()
+        self.assertEqual(
+            ["a@handon.club", "flush", (api.LEADERBOARD_BUILT, api.LEADERBOARD)],
+            events,
+        )
+
+    def test_debt_keeps_position(self):
+        with mock.patch.object(
+            AccountModel, "get", return_value=account(size=30000, avg_price=130.0)
+        ):
+            self.fx.request_debt("osa9@handon.club", 10_0000)
+
+        values = leaderboard_values(self.transaction)
+        self.assertEqual({"N": "30000"}, values["position_size"])
+        self.assertEqual({"N": "3900000.0"}, values["position_cost"])
+        self.assertEqual({"N": "1100000"}, values["cash"])
+
+
+#
+class SummaryTest(unittest.TestCase):
+
+    #
+    #
+    #
+    def setUp(self):
+        self.fx = fx_api()
+        # 平均建値は (10000 * 129 + 20000 * 130.5) / 30000 = 130
+        self.trades = [trade_model("1", 10000, 129.0), trade_model("2", 20000, 130.5)]
+        self.account = account(size=30000, avg_price=130.0)
+        self.account.open_trades = 2
+        self.account.debt = 5_0000
+        self.account.debt_date = datetime.datetime.now(datetime.timezone.utc)
+        self.patches = [
+            mock.patch.object(AccountModel, "get", return_value=self.account),
+            mock.patch.object(
+                api.HandonFxAPI, "get_open_trades", return_value=self.trades
+            ),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    #
+    #
+    #
+    def test_snapshot_matches_broker(self):
+        broker = self.fx._create_broker(self.account.account_id, self.account.cash)
+        expected = self.fx._get_summary(self.account, broker)
+        snapshot = self.fx._snapshot_summary(self.account)
+        self.assertEqual(set(expected), set(snapshot))
+        for key, value in expected.items():
+            self.assertAlmostEqual(value, snapshot[key], places=6, msg=key)
+
+    def test_summary_uses_snapshot(self):
+        summary = self.fx.summary(self.account.account_id)
+        api.HandonFxAPI.get_open_trades.assert_not_called()
+        self.assertAlmostEqual(100_0000 + 30000 * (131.0 - 130.0), summary["equity"])
+        self.assertEqual(self.account.current_debt, summary["debt"])
+
+    def test_summary_without_snapshot(self):
+        self.account.open_trades = None
+        summary = self.fx.summary(self.account.account_id)
+        api.HandonFxAPI.get_open_trades.assert_called_once()
+        self.assertAlmostEqual(100_0000 + 30000 * (131.0 - 130.0), summary["equity"])
+
+    def test_get_equity(self):
+        self.assertAlmostEqual(103_0000, self.fx.get_equity(self.account))
+        api.HandonFxAPI.get_open_trades.assert_not_called()
+        self.account.open_trades = None
+        self.assertAlmostEqual(103_0000, self.fx.get_equity(self.account))
+        api.HandonFxAPI.get_open_trades.assert_called_once()
+
+    def test_create_broker_without_trades(self):
+        broker = self.fx._create_broker(self.account.account_id, 100_0000, 0)
+        api.HandonFxAPI.get_open_trades.assert_not_called()
+        self.assertEqual(0, len(broker.trades))
+        broker = self.fx._create_broker(self.account.account_id, 100_0000, 2)
+        self.assertEqual(2, len(broker.trades))
+
+
+#
+class WriteTest(unittest.TestCase):
+
+    #
+    #
+    #
+    def setUp(self):
+        self.fx = fx_api()
+        self.transaction = FakeTransaction()
+        self.account = account(size=0)
+        self.account.version = 1
+        self.patches = [
+            mock.patch.object(api, "transaction", self.transaction),
+            mock.patch.object(AccountModel, "get", return_value=self.account),
+            mock.patch.object(api.HandonFxAPI, "get_open_trades", return_value=[]),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    #
+    #
+    #
+    def test_order(self):
+        self.fx.buy("osa9@handon.club", 10000)
+        api.HandonFxAPI.get_open_trades.assert_not_called()
+
+        ((kind, model, _, condition),) = self.transaction.writes(TradeModel)
+        self.assertEqual(("save", 10000), (kind, model.size))
+        (update,) = self.transaction.writes(AccountModel)
+        values = set_values(update[2])
+        self.assertEqual({"N": "10000"}, values["position_size"])
+        self.assertEqual({"N": "131.0"}, values["position_avg_price"])
+        self.assertEqual({"N": "1"}, values["open_trades"])
+
+        values = leaderboard_values(self.transaction)
+        self.assertEqual({"N": "10000"}, values["position_size"])
+        self.assertEqual({"N": "1310000.0"}, values["position_cost"])
+        self.assertEqual({"N": "1000000"}, values["cash"])
+
+    def test_pay_debt(self):
+        self.account.debt = 10_0000
+        self.account.month_debt = 10_0000
+        self.account.debt_date = datetime.datetime.now(datetime.timezone.utc)
+        ret = self.fx.pay_debt("osa9@handon.club", 4_0000)
+        self.assertEqual(96_0000, ret["cash"])
+
+        (update,) = self.transaction.writes(AccountModel)
+        values = set_values(update[2])
+        self.assertEqual({"N": "960000"}, values["cash"])
+        self.assertEqual({"N": "60000"}, values["debt"])
+        self.assertEqual({"N": "60000"}, values["month_debt"])
+
+        values = leaderboard_values(self.transaction)
+        self.assertEqual({"N": "960000"}, values["cash"])
+        self.assertEqual({"N": "60000"}, values["debt"])
+        self.assertEqual({"N": "0"}, values["position_size"])
+
+    def test_retry_rereads_account(self):
+        self.transaction.errors.append(transact_error(None, "ConditionalCheckFailed"))
+        self.fx.buy("osa9@handon.club", 10000)
+        # 1回目はコミットできずに読み込みからやり直す
+        self.assertEqual(2, AccountModel.get.call_count)
+        self.assertEqual(1, len(self.transaction.commits))
+        self.assertEqual(1, len(self.transaction.writes(TradeModel)))
+
+    def test_other_error(self):
+        self.transaction.errors.append(transact_error("ValidationError"))
+        with self.assertRaises(TransactWriteError):
+            self.fx.buy("osa9@handon.club", 10000)
+        self.assertEqual(1, AccountModel.get.call_count)
+        self.assertEqual([], self.transaction.commits)
+
+
+#
+class PrefetchTest(unittest.TestCase):
+
+    #
+    #
+    #
+    def setUp(self):
+        self.fx = fx_api()
+        self.transaction = FakeTransaction()
+        self.prefetched = account(size=10000, avg_price=130.0)
+        self.fresh = account(size=20000, avg_price=130.0)
+        self.fresh.open_trades = 2
+        self.patches = [
+            mock.patch.object(api, "transaction", self.transaction),
+            mock.patch.object(AccountModel, "get", return_value=self.fresh),
+            mock.patch.object(
+                api.HandonFxAPI,
+                "get_open_trades",
+                return_value=[trade_model("1", 10000), trade_model("2", 10000)],
+            ),
+        ]
+        for patch in self.patches:
+            patch.start()
+        self.fx.prefetch(
+            "osa9@handon.club",
+            account=self.prefetched,
+            trades=[trade_model("1", 10000)],
+        )
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    #
+    #
+    #
+    def test_order(self):
+        self.fx.buy("osa9@handon.club", 10000)
+        AccountModel.get.assert_not_called()
+        api.HandonFxAPI.get_open_trades.assert_not_called()
+        (update,) = self.transaction.writes(AccountModel)
+        self.assertIs(self.prefetched, update[1])
+
+    def test_reread_together(self):
+        # summary()が先読みした口座を使ったら、注文では口座も建玉も読み直す
+        self.fx.summary("osa9@handon.club")
+        self.fx.buy("osa9@handon.club", 10000)
+        AccountModel.get.assert_called_once()
+        api.HandonFxAPI.get_open_trades.assert_called_once()
+        (update,) = self.transaction.writes(AccountModel)
+        self.assertIs(self.fresh, update[1])
+        self.assertEqual({"N": "3"}, set_values(update[2])["open_trades"])
+
+
+#
+class CommitTest(unittest.TestCase):
+
+    #
+    #
+    #
+    def setUp(self):
+        self.fx = fx_api()
+        self.transaction = FakeTransaction()
+        self.account = account(size=150 * 10000, avg_price=130.0)
+        self.account.open_trades = 150
+        lots = [trade_model(str(i), 10000) for i in range(150)]
+        # まとめた後に読み直すと、まとめた1本と残りの建玉になっている
+        compacted = [trade_model("merged", 90 * 10000)] + lots[90:]
+        self.patches = [
+            mock.patch.object(api, "transaction", self.transaction),
+            mock.patch.object(AccountModel, "get", return_value=self.account),
+            mock.patch.object(
+                api.HandonFxAPI, "get_open_trades", side_effect=[lots, compacted]
+            ),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    #
+    #
+    #
+    def test_close_many_lots(self):
+        self.fx.close_position("osa9@handon.club")
+
+        # 先に建玉をまとめるだけのトランザクション、次に決済のトランザクション
+        compaction, close = self.transaction.commits
+        self.assertTrue(all(len(c) <= 100 for c in self.transaction.commits))
+        trades = [w for w in compaction if isinstance(w[1], TradeModel)]
+        self.assertEqual(90, len([w for w in trades if w[0] == "update"]))
+        ((_, saved, _, _),) = [w for w in trades if w[0] == "save"]
+        self.assertEqual(90 * 10000, saved.size)
+        values = set_values(compaction[-2][2])
+        self.assertEqual({"N": "61"}, values["open_trades"])
+        self.assertEqual({"N": "1000000"}, values["cash"])
+
+        self.assertEqual(61, len([w for w in close if isinstance(w[1], TradeModel)]))
+        values = set_values(close[-2][2])
+        self.assertEqual({"N": "0"}, values["open_trades"])
+        self.assertEqual({"N": "2500000.0"}, values["cash"])
+
+    def test_too_many_writes(self):
+        with mock.patch.object(api, "MAX_OPEN_TRADES", 200):
+            with self.assertRaises(api.TooManyTrades):
+                self.fx.close_position("osa9@handon.club")
+        # 1つの注文を分けて書くことはしない
+        self.assertEqual([], self.transaction.commits)
+
+
+#
+if __name__ == "__main__":
+            unittest.main()
+
+# endof filename: `tests/handon_fx/fx/test_api.py`
@@ -0,0 +1,84 @@
+#
+# filename: `tests/handon_fx/fx/test_commit.py`
+#
+
+import unittest
+
+from pynamodb.exceptions import (
+    CancellationReason,
+    TransactWriteError,
+    VerboseClientError,
+)
+
+from handon_fx.fx.commit import COMMIT_RETRIES, is_conflict, retry_on_conflict
+
+
+def transact_error(*codes):
+    """TransactWriteItemsがキャンセルされた時のTransactWriteErrorを作る"""
+    reasons = [
+        None if code is None else CancellationReason(code=code, message=None)
+        for code in codes
+    ]
+    cause = VerboseClientError(
+        {"Error": {"Code": "TransactionCanceledException", "Message": ""}},
+        "TransactWriteItems",
+        cancellation_reasons=reasons,
+    )
+    return TransactWriteError("Failed to write transaction items", cause=cause)
+
+
+#
+class RetryOnConflictTest(unittest.TestCase):
+
+    #
+    #
+    #
+    def test_is_conflict(self):
+        self.assertTrue(is_conflict(transact_error(None, "ConditionalCheckFailed")))
+        self.assertTrue(is_conflict(transact_error("TransactionConflict")))
+        self.assertFalse(is_conflict(transact_error(None, "ValidationError")))
+        self.assertFalse(is_conflict(TransactWriteError("no cause")))
+
+    def test_retry(self):
+        calls = []
+
+        @retry_on_conflict
+        def commit():
+            calls.append(1)
+            if len(calls) < 2:
+                raise transact_error("ConditionalCheckFailed")
+            return "ok"
+
+        self.assertEqual("ok", commit())
+        self.assertEqual(2, len(calls))
+
+    def test_give_up(self):
+        calls = []
+
+        @retry_on_conflict
+        def commit():
+            calls.append(1)
+            raise transact_error("TransactionConflict")
+
+        with self.assertRaises(TransactWriteError):
+            commit()
+        self.assertEqual(COMMIT_RETRIES, len(calls))
+
+    def test_other_error(self):
+        calls = []
+
+        @retry_on_conflict
+        def commit():
+            calls.append(1)
+            raise transact_error("ValidationError")
+
+        with self.assertRaises(TransactWriteError):
+            commit()
+        self.assertEqual(1, len(calls))
+
+
+#
+if __name__ == "__main__":
+            unittest.main()
+
+# endof filename: `tests/handon_fx/fx/test_commit.py`
@@ -0,0 +1,118 @@
+#
+# filename: `tests/handon_fx/fx/test_hedge.py`
+#
+
+import threading
+import time
+import unittest
+
+from handon_fx.fx.hedge import FetchTimeout, HedgedFetcher, LatencyHistogram
+
+
+class SlowSource:
+    def __init__(self, value, latency=0.0, fail=False):
+        self.value = value
+        self.latency = latency
+        self.fail = fail
+        self.calls = 0
+        self.released = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.released.wait(self.latency)
+        if self.fail:
+            raise ConnectionError("source is down")
+        return self.value
+
+
+#
+class LatencyHistogramTest(unittest.TestCase):
+
+    #
+    #
+    #
+    def test_percentile(self):
+        histogram = LatencyHistogram()
+        self.assertEqual(float("inf"), histogram.percentile(95))
+
+        for _ in range(95):
+            histogram.record(0.04)
+        for _ in range(5):
+            histogram.record(2.5)
+        self.assertEqual(100, len(histogram))
+        self.assertEqual(0.05, histogram.percentile(95))
+        self.assertEqual(3.0, histogram.percentile(99))
+        self.assertEqual(95, histogram.snapshot()["<=0.05"])
+
+
+#
+class HedgedFetcherTest(unittest.TestCase):
+
+    #
+    #
+    #
+    def setUp(self):
+        self.sources = []
+
+    def tearDown(self):
+        for source in self.sources:
+            source.released.set()
+
+    def fetcher(self, primary, secondary, **kwargs):
+        self.sources += [primary, secondary]
+        kwargs.setdefault("budget", 1.0)
+        kwargs.setdefault("default_hedge_delay", 0.05)
+        return HedgedFetcher([("primary", primary), ("secondary", secondary)], **kwargs)
+
+    #
+    #
+    #
+    def test_primary(self):
+        primary, secondary = SlowSource("a"), SlowSource("b")
+        fetcher = self.fetcher(primary, secondary)
+        self.assertEqual("a", fetcher())
+        self.assertEqual(0, secondary.calls)
+        self.assertEqual(1, len(fetcher.histograms["primary"]))
+
+    def test_hedge(self):
+        primary, secondary = SlowSource("a", latency=5), SlowSource("b")
+        fetcher = self.fetcher(primary, secondary)
+        start = time.perf_counter()
+        self.assertEqual("b", fetcher())
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(1, secondary.calls)
+
+    def test_hedge_delay_from_p95(self):
+        primary, secondary = SlowSource("a"), SlowSource("b")
+        fetcher = self.fetcher(primary, secondary, min_samples=10)
+        for _ in range(10):
+            fetcher.histograms["primary"].record(0.15)
+        self.assertEqual(0.2, fetcher.hedge_delay())
+
+    def test_primary_error(self):
+        primary, secondary = SlowSource("a", fail=True), SlowSource("b")
+        fetcher = self.fetcher(primary, secondary, default_hedge_delay=5)
+        start = time.perf_counter()
+        self.assertEqual("b", fetcher())
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(1, fetcher.histograms["primary"].errors)
+
+    def test_budget(self):
+        primary, secondary = SlowSource("a", latency=5), SlowSource("b", latency=5)
+        fetcher = self.fetcher(primary, secondary, budget=0.2)
+        start = time.perf_counter()
+        with self.assertRaises(FetchTimeout):
+            fetcher()
+        self.assertLess(time.perf_counter() - start, 0.5)
+
+    def test_all_errors(self):
+        primary = SlowSource("a", fail=True)
+        secondary = SlowSource("b", fail=True)
+        with self.assertRaises(ConnectionError):
+            self.fetcher(primary, secondary)()
+
+
+if __name__ == "__main__":
+            unittest.main()
+
+# endof filename: `tests/handon_fx/fx/test_hedge.py`
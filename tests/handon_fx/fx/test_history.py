@@ -0,0 +1,164 @@
+#
+# filename: `tests/handon_fx/fx/test_history.py`
+#
+
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from handon_fx.fx.history import HistoryStore
+
+
+class FakeFetcher:
+    def __init__(self):
+        self.calls = []
+        self.error = None
+
+    def __call__(self, symbol, start, end):
+        self.calls.append((pd.Timestamp(start), pd.Timestamp(end)))
+        if self.error is not None:
+            raise self.error
+        index = pd.date_range(start, end, freq="1min", inclusive="left")
+        price = 130 + (index.asi8 // 10**9 % 3600) / 3600
+        return pd.DataFrame(
+            {
+                "Open": price,
+                "High": price + 0.01,
+                "Low": price - 0.01,
+                "Close": price,
+                "Volume": 0.0,
+            },
+            index=index,
+        )
+
+
+#
+class HistoryStoreTest(unittest.TestCase):
+
+    #
+    #
+    #
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.fetcher = FakeFetcher()
+        self.now = pd.Timestamp("2023-01-06 00:00", tz="UTC").timestamp()
+        self.store = HistoryStore(self.root, self.fetcher, clock=lambda: self.now)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    #
+    #
+    #
+    def test_history(self):
+        df = self.store.history("USDJPY=X", "2023-01-04 10:00", "2023-01-04 11:00")
+        self.assertEqual(60, len(df))
+        self.assertEqual(pd.Timestamp("2023-01-04 10:00", tz="UTC"), df.index[0])
+        self.assertEqual(["Open", "High", "Low", "Close", "Volume"], list(df.columns))
+
+        # 取得済みの範囲なら取りに行かない
+        self.store.history("USDJPY=X", "2023-01-04 10:10", "2023-01-04 10:50")
+        self.assertEqual(1, len(self.fetcher.calls))
+
+    def test_fill_only_gaps(self):
+        self.store.fill("USDJPY=X", "2023-01-04 10:00", "2023-01-04 11:00")
+        self.store.fill("USDJPY=X", "2023-01-04 12:00", "2023-01-04 13:00")
+        self.assertEqual(
+            2, self.store.fill("USDJPY=X", "2023-01-04 09:00", "2023-01-04 13:00")
+        )
+        self.assertEqual(
+            [
+                (
+                    pd.Timestamp("2023-01-04 09:00", tz="UTC"),
+                    pd.Timestamp("2023-01-04 10:00", tz="UTC"),
+                ),
+                (
+                    pd.Timestamp("2023-01-04 11:00", tz="UTC"),
+                    pd.Timestamp("2023-01-04 12:00", tz="UTC"),
+                ),
+            ],
+            self.fetcher.calls[2:],
+        )
+        bars = self.store.bars("USDJPY=X", "2023-01-04 09:00", "2023-01-04 13:00")
+        self.assertEqual(240, len(bars))
+        self.assertTrue(np.all(np.diff(bars["time"]) == 60))
+
+    def test_across_days(self):
+        self.store.fill("USDJPY=X", "2023-01-04 23:00", "2023-01-05 01:00")
+        self.assertEqual(1, len(self.fetcher.calls))
+        bars = self.store.bars("USDJPY=X", "2023-01-04 23:30", "2023-01-05 00:30")
+        self.assertEqual(60, len(bars))
+        self.assertEqual(
+            [], self.store.gaps("USDJPY=X", "2023-01-04 23:00", "2023-01-05 01:00")
+        )
+
+    def test_future_is_not_covered(self):
+        self.store.fill("USDJPY=X", "2023-01-05 23:00", "2023-01-06 01:00")
+        self.assertEqual(
+            [], self.store.gaps("USDJPY=X", "2023-01-05 23:00", "2023-01-06 01:00")
+        )
+
+        # 時間が進んだら、前回は確定していなかった分だけを取りに行く
+        self.now += 3600
+        self.assertEqual(
+            1, self.store.fill("USDJPY=X", "2023-01-05 23:00", "2023-01-06 01:00")
+        )
+        self.assertEqual(
+            pd.Timestamp("2023-01-05 23:59", tz="UTC"), self.fetcher.calls[-1][0]
+        )
+
+    def test_partial_minute_is_refetched(self):
+        self.now = pd.Timestamp("2023-01-05 10:30:25", tz="UTC").timestamp()
+        self.store.fill("USDJPY=X", "2023-01-05 10:00", "2023-01-05 11:00")
+        # 10:30の足は作りかけ、10:29の足はまだ配信されていないかもしれない
+        self.assertEqual(
+            pd.Timestamp("2023-01-05 10:29", tz="UTC"), self.fetcher.calls[-1][1]
+        )
+        bars = self.store.bars("USDJPY=X", "2023-01-05 10:00", "2023-01-05 11:00")
+        self.assertEqual(29, len(bars))
+        self.assertEqual(
+            [], self.store.gaps("USDJPY=X", "2023-01-05 10:00", "2023-01-05 11:00")
+        )
+
+        self.now += 100
+        self.assertEqual(
+            1, self.store.fill("USDJPY=X", "2023-01-05 10:00", "2023-01-05 11:00")
+        )
+        self.assertEqual(
+            (
+                pd.Timestamp("2023-01-05 10:29", tz="UTC"),
+                pd.Timestamp("2023-01-05 10:31", tz="UTC"),
+            ),
+            self.fetcher.calls[-1],
+        )
+        bars = self.store.bars("USDJPY=X", "2023-01-05 10:00", "2023-01-05 11:00")
+        self.assertEqual(31, len(bars))
+
+    def test_fetch_error(self):
+        self.fetcher.error = ConnectionError("Yahoo is down")
+        with self.assertRaises(ConnectionError):
+            self.store.fill("USDJPY=X", "2023-01-04 10:00", "2023-01-04 11:00")
+        # 失敗した区間は取得済みにせず、次に取り直す
+        self.assertEqual(
+            1, len(self.store.gaps("USDJPY=X", "2023-01-04 10:00", "2023-01-04 11:00"))
+        )
+        self.fetcher.error = None
+        df = self.store.history("USDJPY=X", "2023-01-04 10:00", "2023-01-04 11:00")
+        self.assertEqual(60, len(df))
+
+    def test_zero_copy(self):
+        self.store.fill("USDJPY=X", "2023-01-04 10:00", "2023-01-04 11:00")
+        bars = self.store.bars("USDJPY=X", "2023-01-04 10:10", "2023-01-04 10:20")
+        self.assertEqual(10, len(bars))
+        self.assertIsInstance(bars.base, np.memmap)
+        again = self.store.bars("USDJPY=X", "2023-01-04 10:10", "2023-01-04 10:20")
+        self.assertTrue(np.shares_memory(bars, again))
+
+
+if __name__ == "__main__":
+            unittest.main()
+
+# endof filename: `tests/handon_fx/fx/test_history.py`
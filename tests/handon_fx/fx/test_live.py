@@ -0,0 +1,140 @@
+#
+# filename: `tests/handon_fx/fx/test_live.py`
+#
+
+import datetime
+import unittest
+
+from backtesting._util import _Data as Data
+from handon_fx.fx.broker import HandonBroker
+from handon_fx.fx.live import LiveBroker
+from handon_fx.fx.rate import Quote, quote_to_frame
+from handon_fx.fx.strategy import HandonStrategy
+from handon_fx.fx.trade import HandonTrade
+
+
+def handon_broker(price, cash):
+    data = Data(
+        quote_to_frame(
+            Quote("USD/JPY", price, price, price, datetime.datetime(2023, 1, 4))
+        )
+    )
+    broker = HandonBroker(
+        data=data,
+        cash=cash,
+        commission=0,
+        margin=1.0 / 20.0,
+        trade_on_close=False,
+        hedging=False,
+        exclusive_orders=False,
+        index=data.index,
+        lot_unit=10000,
+    )
+    return broker, HandonStrategy(data=data, broker=broker, params={})
+
+
+def state(broker):
+    return (
+        [(t.size, t.entry_price) for t in broker.trades],
+        [(t.size, t.entry_price, t.exit_price) for t in broker.closed_trades],
+        broker.summary(),
+    )
+
+
+#
+class LiveBrokerTest(unittest.TestCase):
+
+    #
+    #
+    #
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    #
+    #
+    #
+    def test_same_as_handon_broker(self):
+        orders = [
+            [30000],
+            [30000, 20000],
+            [0.5],
+            [30000, -10000],
+            [30000, 20000, -40000],
+            [-20000, 0.3],
+            [30000, -0.5],
+            [10000, 10000, None],
+            [-10000, -10000, -25000],
+        ]
+        for sizes in orders:
+            expected, strategy = handon_broker(130.0, 100_0000)
+            live = LiveBroker(price=130.0, cash=100_0000, margin=1.0 / 20.0, lot_unit=10000)
+            for size in sizes:
+                if size is None or size > 0:
+                    strategy.buy() if size is None else strategy.buy(size=size)
+                    live.buy(size)
+                else:
+                    strategy.sell(size=-size)
+                    live.sell(-size)
+                expected.next()
+            self.assertEqual(state(expected), state(live), sizes)
+
+    def test_close_trades(self):
+        live = LiveBroker(price=130.0, cash=100_0000, margin=1.0 / 20.0, lot_unit=10000)
+        live.buy(30000)
+        live.buy(20000)
+        live.last_price = 131.0
+        live.close_trades()
+
+        self.assertEqual([], live.trades)
+        self.assertEqual(2, len(live.closed_trades))
+        self.assertEqual(100_0000 + 50000, live.summary()["cash"])
+
+    def test_compact(self):
+        live = LiveBroker(price=130.0, cash=100_0000, margin=1.0 / 20.0, lot_unit=10000)
+        live.buy(30000)
+        live.last_price = 132.0
+        live.buy(10000)
+        before = live.summary()
+
+        merged = live.compact()
+
+        self.assertEqual([merged], live.trades)
+        self.assertEqual(40000, merged.size)
+        self.assertAlmostEqual(130.5, merged.entry_price)
+        self.assertEqual(2, len(live.merged_trades))
+        self.assertAlmostEqual(before["equity"], live.summary()["equity"])
+        self.assertAlmostEqual(
+            before["margin_available"], live.summary()["margin_available"]
+        )
+        self.assertIsNone(live.compact())
+
+    def test_assigned_trades(self):
+        live = LiveBroker(price=130.0, cash=100_0000, margin=1.0 / 20.0, lot_unit=10000)
+        live.trades = [
+            HandonTrade(live, 30000, 130.0, 0, "a"),
+            HandonTrade(live, 10000, 132.0, 0, "b"),
+        ]
+        live.last_price = 131.0
+
+        summary = live.summary()
+        self.assertEqual(40000, summary["position_size"])
+        self.assertAlmostEqual(130.5, summary["position_avg_price"])
+        self.assertAlmostEqual(100_0000 + 30000 - 10000, summary["equity"])
+        self.assertAlmostEqual(
+            100_0000 + 20000 - 40000 * 131.0 / 20, summary["margin_available"]
+        )
+
+        live.sell(20000)
+        self.assertEqual([(10000, 130.0), (10000, 132.0)], state(live)[0])
+        self.assertEqual(20000, live.position_size)
+        self.assertAlmostEqual(100_0000 + 20000, live.equity)
+
+
+#
+if __name__ == "__main__":
+            unittest.main()
+
+# endof filename: `tests/handon_fx/fx/test_live.py`
@@ -0,0 +1,197 @@
+#
+# filename: `tests/handon_fx/fx/test_rate.py`
+#
+
+import datetime
+import io
+import json
+import unittest
+from types import SimpleNamespace
+
+import handon_fx.fx.rate as rate
+from handon_fx.fx.api import HandonFxAPI
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeFeed:
+    def __init__(self, price=130.0):
+        self.price = price
+        self.calls = 0
+        self.fail = False
+
+    def __call__(self):
+        self.calls += 1
+        if self.fail:
+            raise ConnectionError("feed is down")
+        return rate.Quote(
+            name="USD/JPY",
+            price=self.price,
+            bid=self.price - 0.01,
+            ask=self.price + 0.01,
+            time=datetime.datetime(2023, 1, 4, 12, 0, 0),
+        )
+
+
+#
+class QuoteCacheTest(unittest.TestCase):
+
+    #
+    #
+    #
+    def setUp(self):
+        self.clock = FakeClock()
+        self.feed = FakeFeed()
+        self.cache = rate.QuoteCache(
+            self.feed, ttl=5, max_staleness=60, clock=self.clock
+        )
+
+    def tearDown(self):
+        pass
+
+    #
+    #
+    #
+    def test_get_within_ttl(self):
+        self.assertEqual(130.0, self.cache.get().price)
+        self.feed.price = 131.0
+        self.clock.now = 4.9
+        self.assertEqual(130.0, self.cache.get().price)
+        self.assertEqual(1, self.feed.calls)
+
+    def test_get_after_ttl(self):
+        self.cache.get()
+        self.feed.price = 131.0
+        self.clock.now = 5.0
+        self.assertEqual(131.0, self.cache.get().price)
+        self.assertEqual(2, self.feed.calls)
+
+    def test_get_stale_on_failure(self):
+        self.cache.get()
+        self.feed.fail = True
+        self.clock.now = 30
+        quote = self.cache.get()
+        self.assertEqual(130.0, quote.price)
+        self.assertTrue(quote.stale)
+
+        self.clock.now = 61
+        with self.assertRaises(ConnectionError):
+            self.cache.get()
+
+    def test_get_current_rate(self):
+        rate.set_quote_source(self.feed, ttl=5, max_staleness=60)
+        try:
+            df = rate.get_current_rate()
+            rate.get_current_rate()
+        finally:
+            rate.set_quote_source(rate.hedged_fetcher)
+
+        self.assertEqual(1, self.feed.calls)
+        self.assertEqual([130.0, 130.0], list(df["Close"]))
+        self.assertEqual(["Open", "High", "Low", "Close"], list(df.columns[2:]))
+
+
+def make_quote(name, price):
+    return rate.Quote(
+        name=name,
+        price=price,
+        bid=price,
+        ask=price,
+        time=datetime.datetime(2023, 1, 4, 12, 0, 0),
+    )
+
+
+#
+class PairQuotesTest(unittest.TestCase):
+
+    #
+    #
+    #
+    def setUp(self):
+        self.quotes = {
+            "USDJPY": make_quote("USD/JPY", 130.0),
+            "EURJPY": make_quote("EUR/JPY", 140.0),
+            "EURUSD": make_quote("EUR/USD", 1.08),
+            "BTCUSD": make_quote("Bitcoin USD", 17000.0),
+        }
+        self.calls = 0
+
+        def feed():
+            self.calls += 1
+            return self.quotes
+
+        rate.set_quote_source(feed, ttl=5, max_staleness=60)
+
+    def tearDown(self):
+        rate.set_quote_source(rate.hedged_fetcher)
+
+    #
+    #
+    #
+    def test_batch_reader(self):
+        out = io.StringIO(
+            json.dumps(
+                {
+                    "quoteResponse": {
+                        "result": [
+                            {
+                                "symbol": "JPY=X",
+                                "shortName": "USD/JPY",
+                                "regularMarketPrice": 130.0,
+                                "regularMarketTime": 1672833600,
+                                "bid": 129.99,
+                                "ask": 130.01,
+                            },
+                            {
+                                "symbol": "BTC-USD",
+                                "shortName": "Bitcoin USD",
+                                "regularMarketPrice": 17000.0,
+                                "regularMarketTime": 1672833600,
+                                "bid": 16999.0,
+                                "ask": 17001.0,
+                            },
+                        ]
+                    }
+                }
+            )
+        )
+        reader = rate.BatchYahooQuotesReader(["JPY=X", "BTC-USD"])
+        self.assertEqual("JPY=X,BTC-USD", reader.params("JPY=X,BTC-USD")["symbols"])
+        df = reader._read_lines(out)
+        self.assertEqual(["JPY=X", "BTC-USD"], list(df.index))
+        self.assertEqual([130.0, 17000.0], list(df["price"]))
+
+    def test_get_current_quote(self):
+        self.assertEqual(130.0, rate.get_current_quote().price)
+        self.assertEqual(140.0, rate.get_current_quote("EURJPY").price)
+        self.assertEqual(1, self.calls)
+
+    def test_position_pl(self):
+        api = HandonFxAPI()
+        api.start()
+        trades = [
+            SimpleNamespace(instrument="JPY/USD", size=10000, entry_price=129.0),
+            SimpleNamespace(instrument="EURJPY", size=-10000, entry_price=141.0),
+            SimpleNamespace(instrument="EUR/USD", size=10000, entry_price=1.07),
+            SimpleNamespace(instrument="BTCUSD", size=1, entry_price=16000.0),
+        ]
+        pl = api.position_pl(trades)
+
+        self.assertEqual(1, self.calls)
+        self.assertAlmostEqual(10000, pl["USDJPY"])
+        self.assertAlmostEqual(10000, pl["EURJPY"])
+        self.assertAlmostEqual(100 * 130.0, pl["EURUSD"])
+        self.assertAlmostEqual(1000 * 130.0, pl["BTCUSD"])
+
+
+#
+if __name__ == "__main__":
+            unittest.main()
+
+# endof filename: `tests/handon_fx/fx/test_rate.py`
@@ -0,0 +1,92 @@
+#
+# filename: `tests/handon_fx/fx/test_trade.py`
+#
+
+import datetime
+import unittest
+
+from handon_fx.fx.live import LiveBroker
+from handon_fx.fx.models import TradeModel
+from handon_fx.fx.trade import HandonTrade
+
+
+def model(trade_id, size, entry_price=130.0):
+    return TradeModel(
+        trade_id=trade_id,
+        account_id="osa9@handon.club",
+        state="open",
+        instrument="JPY/USD",
+        size=size,
+        entry_price=entry_price,
+        entry_time=datetime.datetime(2023, 1, 4),
+    )
+
+
+#
+class HandonTradeTest(unittest.TestCase):
+
+    #
+    #
+    #
+    def setUp(self):
+        self.broker = LiveBroker(
+            price=131.0, cash=100_0000, margin=1.0 / 20.0, lot_unit=10000
+        )
+        self.broker.trades = [
+            HandonTrade.from_model(self.broker, model("a", 30000)),
+            HandonTrade.from_model(self.broker, model("b", 20000)),
+            HandonTrade.from_model(self.broker, model("c", 10000)),
+        ]
+
+    def tearDown(self):
+        pass
+
+    #
+    #
+    #
+    def test_from_model_is_clean(self):
+        for trade in self.broker.trades:
+            self.assertFalse(trade.is_new)
+            self.assertFalse(trade.is_dirty)
+            self.assertEqual([], trade.update_actions())
+
+    def test_dirty_after_fill(self):
+        self.broker.sell(40000)
+        self.broker.buy(10000)
+
+        open_trades = {t.tag: t for t in self.broker.trades if not t.is_new}
+        closed = self.broker.closed_trades
+
+        # a: 全部決済, b: 一部決済, c: 変更なし
+        self.assertEqual(["b", "c"], sorted(open_trades))
+        self.assertTrue(open_trades["b"].is_dirty)
+        self.assertFalse(open_trades["c"].is_dirty)
+        self.assertEqual(["a", None], [t.tag if not t.is_new else None for t in closed])
+        self.assertTrue(closed[0].is_dirty)
+        self.assertEqual(1, sum(t.is_new for t in self.broker.trades))
+
+    def test_update_actions(self):
+        self.broker.sell(30000)
+        actions = self.broker.closed_trades[0].update_actions(exit_cash=100_3000)
+        names = sorted(a.values[0].attribute.attr_name for a in actions)
+        self.assertEqual(["exit_cash", "exit_price", "exit_time", "state"], names)
+
+    def test_copy(self):
+        trade = self.broker.trades[0]
+        copied = trade._copy(size=-10000)
+
+        self.assertEqual((-10000, 130.0), (copied.size, copied.entry_price))
+        self.assertEqual(30000, trade.size)
+        self.assertNotEqual("a", copied.tag)
+        self.assertTrue(copied.is_new)
+        self.assertFalse(trade.is_dirty)
+        self.assertEqual(datetime.datetime(2023, 1, 4), copied.entry_time)
+        self.assertIsNone(copied.exit_time)
+        self.assertFalse(hasattr(copied, "__dict__"))
+
+
+#
+if __name__ == "__main__":
+            unittest.main()
+
+# endof filename: `tests/handon_fx/fx/test_trade.py`
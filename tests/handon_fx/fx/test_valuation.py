@@ -0,0 +1,168 @@
+#
+# filename: `tests/handon_fx/fx/test_valuation.py`
+#
+
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+from handon_fx.fx.valuation import BookValuation, RankingCache, bottom_k, top_k
+
+
+def account(account_id, cash, current_debt=0):
+    return SimpleNamespace(account_id=account_id, cash=cash, current_debt=current_debt)
+
+
+def trade(account_id, size, entry_price):
+    return SimpleNamespace(account_id=account_id, size=size, entry_price=entry_price)
+
+
+#
+class BookValuationTest(unittest.TestCase):
+
+    #
+    #
+    #
+    def setUp(self):
+        self.book = BookValuation.from_models(
+            [
+                account("a@handon.club", 100_0000),
+                account("b@handon.club", 50_0000, current_debt=10_0000),
+                account("c@handon.club", 80_0000),
+            ],
+            [
+                trade("a@handon.club", 10000, 130.0),
+                trade("a@handon.club", 20000, 131.0),
+                trade("b@handon.club", -30000, 132.0),
+                trade("unknown@handon.club", 10000, 100.0),
+            ],
+        )
+
+    def tearDown(self):
+        pass
+
+    #
+    #
+    #
+    def test_equity(self):
+        equity = self.book.equity(rate=131.0)
+        self.assertEqual([100_0000 + 10000, 50_0000 + 30000, 80_0000], list(equity))
+
+    def test_mark_to_market(self):
+        ret = self.book.mark_to_market(rate=131.0)
+        exp = {
+            "a@handon.club": 101_0000,
+            "b@handon.club": 43_0000,
+            "c@handon.club": 80_0000,
+        }
+        self.assertEqual(exp, ret)
+
+    def test_ranking(self):
+        ret = [r["account_id"] for r in self.book.ranking(rate=131.0)]
+        exp = ["a@handon.club", "c@handon.club", "b@handon.club"]
+        self.assertEqual(exp, ret)
+
+    def test_from_leaderboard(self):
+        rows = [
+            SimpleNamespace(
+                account_id="a@handon.club",
+                cash=100_0000,
+                position_size=30000,
+                position_cost=10000 * 130.0 + 20000 * 131.0,
+                current_debt=0,
+            ),
+            SimpleNamespace(
+                account_id="c@handon.club",
+                cash=80_0000,
+                position_size=0,
+                position_cost=0,
+                current_debt=0,
+            ),
+        ]
+        ret = BookValuation.from_leaderboard(rows).mark_to_market(rate=131.0)
+        self.assertAlmostEqual(101_0000, ret["a@handon.club"])
+        self.assertEqual(80_0000, ret["c@handon.club"])
+
+    def test_top(self):
+        full = self.book.ranking(rate=131.0)
+        self.assertEqual(full[:2], self.book.top(rate=131.0, k=2))
+        self.assertEqual(full[::-1][:2], self.book.top(rate=131.0, k=2, worst=True))
+
+    def test_top_k_ties(self):
+        values = np.array([1.0, 3.0, 2.0, 3.0, 1.0, 2.0, 3.0])
+        full = np.argsort(-values, kind="stable")
+        for k in range(1, len(values) + 1):
+            self.assertEqual(list(full[:k]), list(top_k(values, k)))
+            self.assertEqual(list(full[::-1][:k]), list(bottom_k(values, k)))
+
+
+#
+class RankingCacheTest(unittest.TestCase):
+
+    #
+    #
+    #
+    def setUp(self):
+        self.now = 0.0
+        self.loads = 0
+        self.cache = RankingCache(rate_bucket=0.01, ttl=30, clock=lambda: self.now)
+        self.book = BookValuation.from_models(
+            [
+                account("a@handon.club", 100_0000),
+                account("b@handon.club", 50_0000, current_debt=10_0000),
+                account("c@handon.club", 80_0000),
+            ],
+            [trade("a@handon.club", 30000, 131.0)],
+        )
+
+    def tearDown(self):
+        pass
+
+    def load(self):
+        self.loads += 1
+        return self.book
+
+    #
+    #
+    #
+    def test_ranking(self):
+        best = self.cache.ranking(self.load, 131.0, limit=2)
+        worst = self.cache.ranking(self.load, 131.001, limit=2, worst=True)
+        self.assertEqual(self.book.ranking(131.0)[:2], best)
+        self.assertEqual(self.book.ranking(131.0)[::-1][:2], worst)
+        self.assertEqual(1, self.loads)
+        self.assertEqual(1, len(self.cache._entries))
+
+        # 全件を要求されたら並べ直す
+        self.assertEqual(self.book.ranking(131.0), self.cache.ranking(self.load, 131.0))
+        self.assertEqual(1, self.loads)
+
+    def test_rate_bucket(self):
+        self.cache.ranking(self.load, 131.0)
+        ret = self.cache.ranking(self.load, 133.0)
+        self.assertEqual(self.book.ranking(133.0), ret)
+        self.assertEqual(2, len(self.cache._entries))
+        self.assertEqual(1, self.loads)
+
+    def test_invalidate(self):
+        self.cache.ranking(self.load, 131.0)
+        self.cache.invalidate()
+        self.cache.ranking(self.load, 131.0)
+        self.assertEqual(2, self.loads)
+
+    def test_ttl(self):
+        self.cache.ranking(self.load, 131.0)
+        self.now = 29
+        self.cache.ranking(self.load, 131.0)
+        self.assertEqual(1, self.loads)
+        self.now = 30
+        self.cache.ranking(self.load, 131.0)
+        self.assertEqual(2, self.loads)
+
+
+#
+if __name__ == "__main__":
+            unittest.main()
+
+# endof filename: `tests/handon_fx/fx/test_valuation.py`